@@ -1,13 +1,22 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from streamlit.errors import StreamlitAPIException
 import json
 import datetime
-from models.coach_agent import FinancialCoachAgent
-from models.evaluator import SessionEvaluator
-from utils.visualization import create_radar_dashboard, create_simple_dashboard, create_trend_analysis
+import textwrap
+import uuid
+from config import Config
+from models.incremental_evaluator import IncrementalEvaluator
+from models.llm_client import llm_user
+from models.rule_scorer import RULE_SOURCE
+from utils.analytics import get_user_analytics, peek_user_analytics
+from utils.metrics import current_run, track_run
+from utils.resources import (get_coach_agent, get_evaluation_jobs, get_metrics_exporter, get_opening_prefetcher,
+                             get_session_evaluator)
+from utils.session_store import EVALUATION_DONE, EVALUATION_FAILED, get_default_store
+from utils.visualization import cached_radar_dashboard, cached_trend_analysis, get_cached_figure
 
 # 页面配置
 st.set_page_config(
@@ -20,8 +29,14 @@ st.set_page_config(
 
 class FinancialCoachApp:
     def __init__(self):
-        self.coach = FinancialCoachAgent()
-        self.evaluator = SessionEvaluator()
+        # 进程级共享资源，每次 rerun 只取缓存的实例
+        self.coach = get_coach_agent()
+        self.evaluator = get_session_evaluator()
+        self.store = get_default_store()
+        self.prefetcher = get_opening_prefetcher() if Config.PREFETCH_OPENING else None
+        self.jobs = get_evaluation_jobs() if Config.BACKGROUND_EVALUATION else None
+        if Config.METRICS:
+            get_metrics_exporter()
         self.init_session_state()
 
     def init_session_state(self):
@@ -32,8 +47,11 @@ class FinancialCoachApp:
             st.session_state.session_started = False
         if 'client_type' not in st.session_state:
             st.session_state.client_type = None
-        if 'session_history' not in st.session_state:
-            st.session_state.session_history = []
+        if 'guest_id' not in st.session_state:
+            # 未填写工号的学员各用一个会话级匿名身份，公平调度和历史分析不会混在一起
+            st.session_state.guest_id = f"guest-{uuid.uuid4().hex[:8]}"
+        if not st.session_state.get('user_id', '').strip():
+            st.session_state.user_id = st.session_state.guest_id
         if 'evaluation_data' not in st.session_state:
             st.session_state.evaluation_data = {}
 
@@ -41,6 +59,7 @@ class FinancialCoachApp:
         """渲染侧边栏"""
         with st.sidebar:
             st.title("💰 理财经理陪练系统")
+            st.text_input("学员工号", key="user_id", help="填写工号后练习记录可跨会话保留，留空则使用本次会话的匿名身份")
             st.markdown("---")
 
             # 客户类型选择
@@ -72,60 +91,106 @@ class FinancialCoachApp:
             st.markdown("---")
 
             # 历史会话统计
-            if st.session_state.session_history:
+            stats = self.get_analytics().summary()
+            if stats['total']:
                 st.subheader("历史统计")
-                total_sessions = len(st.session_state.session_history)
-
-                # 安全地计算平均分
-                scores = []
-                for session in st.session_state.session_history:
-                    # 检查评估数据是否存在且包含 overall_score
-                    if (session.get('evaluation') and
-                            isinstance(session['evaluation'], dict) and
-                            'overall_score' in session['evaluation']):
-                        scores.append(session['evaluation']['overall_score'])
-
-                if scores:
-                    avg_score = sum(scores) / len(scores)
-                    st.metric("总练习次数", total_sessions)
-                    st.metric("平均得分", f"{avg_score:.1f}")
+                st.metric("总练习次数", stats['total'])
+                if stats['avg_score'] is not None:
+                    st.metric("平均得分", f"{stats['avg_score']:.1f}")
                 else:
-                    st.metric("总练习次数", total_sessions)
                     st.metric("平均得分", "暂无")
 
+            # 评估缓存命中情况
+            if self.evaluator.cache is not None:
+                cache_stats = self.evaluator.cache.stats()
+                if cache_stats['hits'] + cache_stats['misses']:
+                    st.caption(f"评估缓存：命中 {cache_stats['hits']} · 未命中 {cache_stats['misses']} · "
+                               f"命中率 {cache_stats['hit_rate']:.0%}")
+
+            # 开场提问预取命中情况
+            if self.prefetcher is not None:
+                prefetch_stats = self.prefetcher.stats()
+                if prefetch_stats['used'] + prefetch_stats['discarded']:
+                    st.caption(f"开场提问预取：显示 {prefetch_stats['used']} · 丢弃 {prefetch_stats['discarded']}"
+                               f"（约 {prefetch_stats['wasted_tokens']} tokens）")
+
+    def render_instant_feedback(self):
+        """对话中的即时评分：本地规则评分，毫秒级完成，不调用模型"""
+        manager_messages = [msg['content'] for msg in st.session_state.messages if msg['role'] == 'user']
+        if not manager_messages:
+            return
+
+        evaluation = self.evaluator.rule_scorer.evaluate(
+            manager_messages, st.session_state.client_type, st.session_state.get('session_difficulty', 3))
+        scores = evaluation['scores']
+        with st.expander(f"⚡ 即时评分：{evaluation['overall_score']}/100（本地规则估算，结束会话后以模型评估为准）"):
+            st.caption(f"需求挖掘 {scores['demand_mining']} · 产品匹配 {scores['product_fit']} · "
+                       f"异议处理 {scores['objection_handling']} · 沟通能力 {scores['communication']} · "
+                       f"专业知识 {scores['professional_knowledge']}")
+            for phrase in evaluation['suggested_phrases'][:2]:
+                st.caption(f"💡 {phrase}")
+
     def start_new_session(self, client_type, scenario, difficulty):
         """开始新会话"""
         st.session_state.session_started = True
         st.session_state.client_type = client_type
         st.session_state.session_difficulty = difficulty  # 保存难度
+        st.session_state.session_scenario = scenario
         st.session_state.messages = []
+        st.session_state.rendered_messages = {}
+        st.session_state.turn_metrics = []
         st.session_state.evaluation_data = {}
+        st.session_state.evaluation_failed = False
+        st.session_state.turn_evaluator = (
+            IncrementalEvaluator(self.evaluator, client_type, difficulty)
+            if Config.INCREMENTAL_EVALUATION else None
+        )
+
+        # 趁学员阅读欢迎语，后台预生成客户的开场提问，完成后由聊天片段轮询显示
+        self.discard_opening_prefetch()
+        if self.prefetcher is not None:
+            st.session_state.opening_prefetch = self.prefetcher.start(client_type, difficulty)
 
         # 添加欢迎消息
+        opening_hint = "客户正在组织开场提问，稍后会先开口，您也可以直接开始对话。" if self.prefetcher else "请开始与客户对话吧！"
         welcome_msg = f"""
         开始新的陪练会话！
         - 客户类型: {client_type}
         - 练习场景: {scenario}  
         - 难度级别: {difficulty}/5
 
-        请开始与客户对话吧！
+        {opening_hint}
         """
         st.session_state.messages.append({
+            "id": uuid.uuid4().hex,
             "role": "assistant",
             "content": welcome_msg,
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": datetime.datetime.now().isoformat(),
+            "is_welcome": True
         })
 
     def end_session(self):
         """结束当前会话"""
         if st.session_state.session_started:
+            # 后台评估：保存会话并提交任务，结果在“会话评估”页轮询
+            if st.session_state.messages and self.jobs is not None:
+                session_record = {
+                    "timestamp": datetime.datetime.now().isoformat(),
+                    "client_type": st.session_state.client_type,
+                    "scenario": st.session_state.get('session_scenario'),
+                    "difficulty": st.session_state.get('session_difficulty', 3),
+                    "messages": st.session_state.messages,
+                    "duration_minutes": self.calculate_session_duration(),
+                    "metrics": [run.snapshot() for run in st.session_state.get('turn_metrics', [])]
+                }
+                st.session_state.evaluation_job_id = self.jobs.submit(
+                    st.session_state.user_id, session_record, st.session_state.get('turn_evaluator'))
+                st.session_state.evaluation_data = {}
+                st.session_state.evaluation_failed = False
+
             # 生成最终评估
-            if st.session_state.messages:
-                evaluation = self.evaluator.comprehensive_evaluation(
-                    st.session_state.messages,
-                    st.session_state.client_type,
-                    st.session_state.get('session_difficulty', 3)  # 传递难度
-                )
+            elif st.session_state.messages:
+                evaluation = self.evaluate_current_session()
 
                 # 确保评估数据格式正确
                 if not isinstance(evaluation, dict):
@@ -137,16 +202,36 @@ class FinancialCoachApp:
                 session_record = {
                     "timestamp": datetime.datetime.now().isoformat(),
                     "client_type": st.session_state.client_type,
+                    "scenario": st.session_state.get('session_scenario'),
+                    "difficulty": st.session_state.get('session_difficulty', 3),
                     "messages": st.session_state.messages,
                     "evaluation": evaluation,
-                    "duration_minutes": self.calculate_session_duration()
+                    "duration_minutes": self.calculate_session_duration(),
+                    "metrics": [run.snapshot() for run in st.session_state.get('turn_metrics', [])]
                 }
-                st.session_state.session_history.append(session_record)
+                # 保存前尚未加载的缓存在首次访问时会从存储读到这条记录，只有已加载的才需要追加
+                analytics = peek_user_analytics(st.session_state.user_id)
+                self.store.save_session(st.session_state.user_id, session_record)
+                if analytics is not None:
+                    analytics.append(session_record)
 
+        self.discard_opening_prefetch()
         st.session_state.session_started = False
         st.session_state.messages = []
         st.rerun()
 
+    def evaluate_current_session(self):
+        """评估当前会话：优先聚合逐轮评估的结果，否则对整段对话做一次评估"""
+        turn_evaluator = st.session_state.get('turn_evaluator')
+        if turn_evaluator is not None:
+            return turn_evaluator.report()
+
+        return self.evaluator.comprehensive_evaluation(
+            st.session_state.messages,
+            st.session_state.client_type,
+            st.session_state.get('session_difficulty', 3)  # 传递难度
+        )
+
     def calculate_session_duration(self):
         """计算会话时长"""
         if len(st.session_state.messages) >= 2:
@@ -155,14 +240,38 @@ class FinancialCoachApp:
             return (end_time - start_time).total_seconds() / 60
         return 0
 
+    def render_chat_fragment(self):
+        """聊天区域作为独立片段：发送消息只重跑这里，不重建侧边栏、评估报告和分析图表
+
+        客户的开场提问生成期间，每隔 Config.OPENING_POLL_INTERVAL 秒单独重跑以显示开场提问。
+        """
+        polling = st.session_state.get('opening_prefetch') is not None
+        st.session_state.opening_polling = polling
+        st.fragment(self.render_chat_panel, run_every=Config.OPENING_POLL_INTERVAL if polling else None)()
+
+    def render_chat_panel(self):
+        """片段单独重跑时不经过主程序，需在这里标记本次请求所属的学员并统计运行耗时"""
+        with llm_user(st.session_state.user_id), track_run("chat"):
+            self.poll_opening_prefetch()
+            self.render_chat_interface()
+        # 开场提问已显示或作废：处理完本次输入后整页重跑，停止定时轮询
+        if st.session_state.get('opening_polling') and 'opening_prefetch' not in st.session_state:
+            st.rerun()
+
     def render_chat_interface(self):
         """渲染聊天界面"""
         st.header(f"💬 与{st.session_state.client_type}对话")
+        if Config.INSTANT_FEEDBACK:
+            self.render_instant_feedback()
 
-        # 聊天消息显示
+        # 聊天消息显示：只有最近的消息逐条渲染，更早的消息折叠后按页查看
+        messages = st.session_state.messages
+        live_count = max(1, Config.CHAT_LIVE_MESSAGES)
         chat_container = st.container()
         with chat_container:
-            for message in st.session_state.messages:
+            if len(messages) > live_count:
+                self.render_archived_messages(messages[:-live_count])
+            for message in messages[-live_count:]:
                 if message["role"] == "user":
                     with st.chat_message("user", avatar="👨‍💼"):
                         st.markdown(message["content"])
@@ -177,45 +286,156 @@ class FinancialCoachApp:
             if prompt := st.chat_input("请输入您的回复..."):
                 # 添加用户消息
                 st.session_state.messages.append({
+                    "id": uuid.uuid4().hex,
                     "role": "user",
                     "content": prompt,
                     "timestamp": datetime.datetime.now().isoformat()
                 })
+                # 本轮的 LLM 调用、解析等指标记在当前运行上，运行耗时在运行结束时补记
+                run = current_run()
+                if run is not None:
+                    st.session_state.setdefault('turn_metrics', []).append(run)
+                # 学员在开场提问生成之前就先开口，预生成的开场提问作废
+                self.discard_opening_prefetch()
 
                 # 检查是否请求反馈
-                if "请求反馈" in prompt or "评估" in prompt:
-                    evaluation = self.evaluator.comprehensive_evaluation(
-                        st.session_state.messages,
-                        st.session_state.client_type
-                    )
+                if self.evaluator.is_feedback_request(prompt):
+                    evaluation = self.evaluate_current_session()
                     st.session_state.evaluation_data = evaluation
                     feedback_msg = self.evaluator.format_feedback(evaluation)
 
                     st.session_state.messages.append({
+                        "id": uuid.uuid4().hex,
                         "role": "assistant",
                         "content": feedback_msg,
                         "timestamp": datetime.datetime.now().isoformat(),
                         "is_feedback": True
                     })
                 else:
-                    # 获取AI回复
-                    with st.spinner("客户正在思考..."):
-                        ai_response = self.coach.get_response(
-                            prompt,
-                            st.session_state.messages,
-                            st.session_state.client_type
-                        )
+                    # 客户回复期间在后台评估本轮发言
+                    turn_evaluator = st.session_state.get('turn_evaluator')
+                    if turn_evaluator is not None:
+                        turn_evaluator.submit_turn(st.session_state.messages)
 
+                    ai_response = self.get_client_reply(prompt)
                     st.session_state.messages.append({
+                        "id": uuid.uuid4().hex,
                         "role": "assistant",
                         "content": ai_response,
                         "timestamp": datetime.datetime.now().isoformat()
                     })
-
+                    # 普通对话只影响聊天区域；本次是整页运行，或需要停止开场提问的定时轮询时整页重跑
+                    if not st.session_state.get('opening_polling'):
+                        try:
+                            st.rerun(scope="fragment")
+                        except StreamlitAPIException:
+                            pass
+                    st.rerun()
+
+                # 评估报告更新了“会话评估”页，整页重跑
                 st.rerun()
 
+    def render_archived_messages(self, archived):
+        """较早的消息默认不渲染；展开后只渲染选中的一页，整页合并为一段 markdown"""
+        if not st.toggle(f"显示更早的 {len(archived)} 条消息", key="show_archived_messages"):
+            return
+
+        page_size = max(1, Config.CHAT_PAGE_SIZE)
+        pages = (len(archived) + page_size - 1) // page_size
+        page = st.number_input(f"页码（共 {pages} 页）", min_value=1, max_value=pages, value=pages,
+                               key="archived_page") if pages > 1 else 1
+        start = (page - 1) * page_size
+        with st.container(border=True):
+            st.markdown("\n\n---\n\n".join(
+                self.message_markdown(message) for message in archived[start:start + page_size]))
+
+    @staticmethod
+    def message_markdown(message):
+        """归档消息的 markdown，按消息ID缓存，翻页时不重复拼接"""
+        rendered = st.session_state.setdefault('rendered_messages', {})
+        message_id = message.get('id') or f"{message['role']}:{message.get('timestamp')}"
+        if message_id not in rendered:
+            speaker = "👨‍💼 **理财经理**" if message['role'] == "user" else "👥 **客户**"
+            if message.get('is_feedback'):
+                speaker = "📊 **评估报告**"
+            timestamp = message.get('timestamp', "")
+            rendered[message_id] = f"{speaker} · {timestamp[11:19]}\n\n{textwrap.dedent(message['content']).strip()}"
+        return rendered[message_id]
+
+    def get_client_reply(self, prompt):
+        """获取客户回复，开启流式时边生成边渲染，缩短首字等待时间"""
+        if Config.STREAM_RESPONSES:
+            with st.chat_message("user", avatar="👨‍💼"):
+                st.markdown(prompt)
+            with st.chat_message("assistant", avatar="👥"):
+                return st.write_stream(self.coach.get_response(
+                    prompt,
+                    st.session_state.messages,
+                    st.session_state.client_type,
+                    st.session_state.get('session_difficulty', 3),
+                    stream=True
+                ))
+
+        with st.spinner("客户正在思考..."):
+            return self.coach.get_response(
+                prompt,
+                st.session_state.messages,
+                st.session_state.client_type,
+                st.session_state.get('session_difficulty', 3)
+            )
+
+    def poll_opening_prefetch(self):
+        """开场提问预生成完成后作为客户的第一条消息显示"""
+        future = st.session_state.get('opening_prefetch')
+        if future is None or not future.done():
+            return
+        del st.session_state['opening_prefetch']
+        opening = self.prefetcher.take(future)
+        if opening is not None:
+            st.session_state.messages.append({
+                "id": uuid.uuid4().hex,
+                "role": "assistant",
+                "content": opening,
+                "timestamp": datetime.datetime.now().isoformat(),
+                "is_opening": True
+            })
+
+    def discard_opening_prefetch(self):
+        """丢弃尚未显示的开场提问预取"""
+        future = st.session_state.pop('opening_prefetch', None)
+        if future is not None and self.prefetcher is not None:
+            self.prefetcher.discard(future)
+
+    def poll_evaluation_job(self):
+        """查询后台评估任务，完成后载入评估结果"""
+        job_id = st.session_state.get('evaluation_job_id')
+        if not job_id or self.jobs is None:
+            return
+
+        job = self.jobs.status(job_id)
+        if job is None:
+            st.session_state.evaluation_job_id = None
+        elif job['status'] in (EVALUATION_DONE, EVALUATION_FAILED):
+            if job['status'] == EVALUATION_DONE:
+                st.session_state.evaluation_data = job['evaluation']
+            st.session_state.evaluation_failed = job['status'] == EVALUATION_FAILED
+            st.session_state.evaluation_job_id = None
+            # 历史记录有变化：整页重跑以刷新侧边栏统计和成长分析，同时停止定时轮询
+            st.rerun()
+        else:
+            st.info("⏳ 上一个会话正在后台评估中，完成后自动刷新，您可以先开始新的会话")
+
+    def render_evaluation_fragment(self):
+        """评估页作为独立片段；后台评估进行中时每隔 Config.EVALUATION_POLL_INTERVAL 秒单独重跑以轮询结果"""
+        polling = self.jobs is not None and bool(st.session_state.get('evaluation_job_id'))
+        st.fragment(self.render_evaluation_dashboard,
+                    run_every=Config.EVALUATION_POLL_INTERVAL if polling else None)()
+
     def render_evaluation_dashboard(self):
         """渲染评估仪表板"""
+        self.poll_evaluation_job()
+        if st.session_state.get('evaluation_failed'):
+            st.error("上一个会话的评估失败，请稍后在历史记录中重新评估")
         if st.session_state.evaluation_data:
             st.header("会话评估报告")
 
@@ -226,6 +446,9 @@ class FinancialCoachApp:
                 st.error("评估数据格式错误")
                 return
 
+            if evaluation.get('evaluation_source') == RULE_SOURCE:
+                st.warning("评估模型暂时不可用，本报告由本地规则评分生成，仅供参考")
+
             # 使用默认值防止 KeyError
             overall_score = evaluation.get('overall_score', 0)
             scores = evaluation.get('scores', {})
@@ -252,7 +475,7 @@ class FinancialCoachApp:
 
             # 额外显示雷达图
             st.subheader("能力维度雷达图")
-            radar_fig = create_radar_dashboard(evaluation)
+            radar_fig = cached_radar_dashboard(evaluation)
             st.plotly_chart(radar_fig, use_container_width=True)
 
             # 详细反馈
@@ -275,25 +498,24 @@ class FinancialCoachApp:
                 for example in suggested_phrases:
                     st.info(f"💬 {example}")
 
+    @st.fragment
     def render_analytics(self):
-        """渲染数据分析页面"""
+        """渲染数据分析页面；图表按学员和历史版本缓存，历史不变时不重建"""
         st.header("训练数据分析")
 
-        if not st.session_state.session_history:
-            st.info("暂无历史数据，请先完成一些练习会话。")
-            return
-
         # 转换为DataFrame便于分析
+        analytics = self.get_analytics()
         history_df = self.prepare_analytics_data()
+        # 图表缓存键：学员 + 分析缓存版本号，历史数据变化时才重建图表
+        history_version = (st.session_state.user_id, analytics.version)
 
-        # 额外检查DataFrame是否为空
         if len(history_df) == 0:
-            st.info("暂无有效的历史数据进行分析。")
+            st.info("暂无历史数据，请先完成一些练习会话。")
             return
 
         # 整体趋势分析 - 使用新的折线图
         st.subheader("综合得分趋势")
-        trend_fig = create_trend_analysis(history_df)
+        trend_fig = cached_trend_analysis(history_df, version=history_version)
         st.plotly_chart(trend_fig, use_container_width=True)
 
         # 其他图表
@@ -301,8 +523,9 @@ class FinancialCoachApp:
 
         with col1:
             # 客户类型分布
-            fig2 = px.pie(history_df, names='client_type',
-                          title='客户类型分布')
+            client_type_counts = analytics.client_type_counts()
+            fig2 = get_cached_figure("client_type_pie", history_version, lambda: px.pie(
+                values=client_type_counts.values, names=client_type_counts.index, title='客户类型分布'))
             st.plotly_chart(fig2, use_container_width=True)
 
 
@@ -311,32 +534,13 @@ class FinancialCoachApp:
         st.dataframe(history_df[['session_date', 'client_type', 'overall_score',
                                  'duration_minutes']], use_container_width=True)
 
-    def prepare_analytics_data(self):
-        """准备分析数据"""
-        data = []
-        for i, session in enumerate(st.session_state.session_history):
-            evaluation = session.get('evaluation', {})
-            scores = evaluation.get('scores', {})
-
-            data.append({
-                'session_date': i + 1,  # 使用序号而不是日期，便于显示
-                'client_type': session['client_type'],
-                'overall_score': evaluation.get('overall_score', 0),
-                'demand_mining': scores.get('demand_mining', 0),
-                'product_fit': scores.get('product_fit', 0),
-                'objection_handling': scores.get('objection_handling', 0),
-                'communication': scores.get('communication', 0),
-                'professional_knowledge': scores.get('professional_knowledge', 0),
-                'duration_minutes': session.get('duration_minutes', 0)
-            })
+    def get_analytics(self):
+        """当前学员的列式分析缓存"""
+        return get_user_analytics(self.store, st.session_state.user_id)
 
-        # 如果数据为空，返回空的DataFrame
-        if not data:
-            return pd.DataFrame(columns=['session_date', 'client_type', 'overall_score',
-                                         'demand_mining', 'product_fit', 'objection_handling',
-                                         'communication', 'professional_knowledge', 'duration_minutes'])
-
-        return pd.DataFrame(data)
+    def prepare_analytics_data(self):
+        """准备分析数据（列式缓存，仅在会话结束时追加）"""
+        return self.get_analytics().frame()
 
 
 
@@ -349,12 +553,12 @@ class FinancialCoachApp:
 
         with tab1:
             if st.session_state.session_started:
-                self.render_chat_interface()
+                self.render_chat_fragment()
             else:
                 st.info("👈 请在侧边栏选择客户类型并开始新会话")
 
         with tab2:
-            self.render_evaluation_dashboard()
+            self.render_evaluation_fragment()
 
         with tab3:
             self.render_analytics()
@@ -363,4 +567,6 @@ class FinancialCoachApp:
 # 运行应用
 if __name__ == "__main__":
     app = FinancialCoachApp()
-    app.run()
\ No newline at end of file
+    # 本次 rerun 发起的 LLM 请求按学员公平排队，并统计运行耗时
+    with llm_user(st.session_state.user_id), track_run("app"):
+        app.run()
\ No newline at end of file
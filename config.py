@@ -1,6 +1,8 @@
 # 新增 config.py
 import os
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 
 class Config:
     STREAMLIT_THEME = "light"
@@ -8,6 +10,81 @@ class Config:
     PAGE_ICON = "💰"
     LAYOUT = "wide"
 
+    # LLM 后端：dashscope（默认）、openai（OpenAI 兼容接口）或 fake（本地确定性假后端）
+    LLM_BACKEND = os.getenv("COACH_LLM_BACKEND", "dashscope")
+    OPENAI_BASE_URL = os.getenv("COACH_OPENAI_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+    OPENAI_MODEL = os.getenv("COACH_OPENAI_MODEL")  # 为空时沿用调用方指定的模型
+    # 假后端的首字延迟、抖动和流式分段间隔（秒）
+    FAKE_LATENCY = float(os.getenv("COACH_FAKE_LATENCY", "0.8"))
+    FAKE_JITTER = float(os.getenv("COACH_FAKE_JITTER", "0.2"))
+    FAKE_DELTA_INTERVAL = float(os.getenv("COACH_FAKE_DELTA_INTERVAL", "0.05"))
+    # 会话评估是否按维度并发请求（关闭时使用单次整体评估）
+    PARALLEL_EVALUATION = os.getenv("COACH_PARALLEL_EVALUATION", "1") != "0"
+    # 后端支持时以 JSON 模式请求评估结果，减少格式错误
+    EVALUATION_JSON_MODE = os.getenv("COACH_EVALUATION_JSON_MODE", "1") != "0"
+    # 是否在对话过程中后台逐轮评估，结束会话时直接聚合出报告
+    INCREMENTAL_EVALUATION = os.getenv("COACH_INCREMENTAL_EVALUATION", "1") != "0"
+    TURN_EVALUATION_WORKERS = int(os.getenv("COACH_TURN_EVALUATION_WORKERS", "8"))
+    # 结束会话时把评估交给后台任务队列，不阻塞界面
+    BACKGROUND_EVALUATION = os.getenv("COACH_BACKGROUND_EVALUATION", "1") != "0"
+    EVALUATION_JOB_WORKERS = int(os.getenv("COACH_EVALUATION_JOB_WORKERS", "4"))
+    # “会话评估”页等待后台评估时的轮询间隔（秒）
+    EVALUATION_POLL_INTERVAL = float(os.getenv("COACH_EVALUATION_POLL_INTERVAL", "2"))
+    # 评估结果缓存：内存 LRU 条目数（0 表示关闭），磁盘层目录（为空表示只用内存）
+    EVALUATION_CACHE_SIZE = int(os.getenv("COACH_EVALUATION_CACHE_SIZE", "256"))
+    EVALUATION_CACHE_DIR = os.getenv("COACH_EVALUATION_CACHE_DIR", "")  # 例如 data/evaluation_cache
+    # 本地规则评分：对话中在侧边栏显示即时评分；校准文件由 scripts/calibrate_rule_scorer.py 生成，不存在时不校准
+    INSTANT_FEEDBACK = os.getenv("COACH_INSTANT_FEEDBACK", "1") != "0"
+    RULE_SCORER_CALIBRATION = os.getenv("COACH_RULE_SCORER_CALIBRATION",
+                                        os.path.join(BASE_DIR, "data", "rule_scorer_calibration.json"))
+    # 会话持久化（SQLite），以及首次建库时导入的旧版 JSON 历史
+    SESSION_DB_PATH = os.getenv("COACH_SESSION_DB_PATH", os.path.join(BASE_DIR, "data", "sessions.db"))
+    LEGACY_HISTORY_PATH = os.path.join(BASE_DIR, "data", "session_history.json")
+    # 聊天界面是否逐字流式显示客户回复
+    STREAM_RESPONSES = os.getenv("COACH_STREAM_RESPONSES", "1") != "0"
+    # 聊天界面逐条渲染的最近消息数，更早的消息折叠后按页查看，每页消息数
+    CHAT_LIVE_MESSAGES = int(os.getenv("COACH_CHAT_LIVE_MESSAGES", "20"))
+    CHAT_PAGE_SIZE = int(os.getenv("COACH_CHAT_PAGE_SIZE", "20"))
+    # 客户角色上下文的 token 预算（含系统提示词），以及较早对话压缩成要点后的预算
+    CONTEXT_MAX_TOKENS = int(os.getenv("COACH_CONTEXT_MAX_TOKENS", "1500"))
+    CONTEXT_MEMO_TOKENS = int(os.getenv("COACH_CONTEXT_MEMO_TOKENS", "300"))
+    # 异步 LLM 请求管线：全局并发上限、排队上限（满时调用方等待）、排队等待超时（秒）、HTTP 长连接池大小
+    ASYNC_LLM = os.getenv("COACH_ASYNC_LLM", "1") != "0"
+    LLM_MAX_CONCURRENCY = int(os.getenv("COACH_LLM_MAX_CONCURRENCY", "32"))
+    LLM_MAX_QUEUE = int(os.getenv("COACH_LLM_MAX_QUEUE", "256"))
+    LLM_QUEUE_TIMEOUT = float(os.getenv("COACH_LLM_QUEUE_TIMEOUT", "30"))
+    LLM_MAX_CONNECTIONS = int(os.getenv("COACH_LLM_MAX_CONNECTIONS", "64"))
+    # 容错：单次尝试超时（秒，另按 max_tokens 每个 token 放宽；流式为首字及相邻两段之间的等待）、
+    # 整次调用截止时间、重试次数与退避、对冲请求（模型样本不足时的对冲延迟，仅异步管线）、熔断阈值与冷却时间。
+    # 关闭 ASYNC_LLM 时同步调用同样受超时和截止时间约束
+    LLM_RESILIENCE = os.getenv("COACH_LLM_RESILIENCE", "1") != "0"
+    LLM_TIMEOUT = float(os.getenv("COACH_LLM_TIMEOUT", "10"))
+    LLM_TIMEOUT_PER_TOKEN = float(os.getenv("COACH_LLM_TIMEOUT_PER_TOKEN", "0.05"))
+    LLM_DEADLINE = float(os.getenv("COACH_LLM_DEADLINE", "90"))
+    LLM_MAX_RETRIES = int(os.getenv("COACH_LLM_MAX_RETRIES", "2"))
+    LLM_BACKOFF_BASE = float(os.getenv("COACH_LLM_BACKOFF_BASE", "0.5"))
+    LLM_BACKOFF_MAX = float(os.getenv("COACH_LLM_BACKOFF_MAX", "4"))
+    LLM_HEDGE = os.getenv("COACH_LLM_HEDGE", "1") != "0"
+    LLM_HEDGE_DELAY = float(os.getenv("COACH_LLM_HEDGE_DELAY", "3"))
+    LLM_BREAKER_THRESHOLD = int(os.getenv("COACH_LLM_BREAKER_THRESHOLD", "5"))
+    LLM_BREAKER_RESET = float(os.getenv("COACH_LLM_BREAKER_RESET", "30"))
+    # 客户回复的模型路由：档位从强到快，逗号分隔；延迟预算（秒，流式按首字延迟 P90 计）；
+    # 不超过该 token 数的发言视为寒暄，降一档。延迟来自容错层的统计，关闭 LLM_RESILIENCE 时不按延迟顺延
+    MODEL_ROUTING = os.getenv("COACH_MODEL_ROUTING", "1") != "0"
+    MODEL_TIERS = [m.strip() for m in os.getenv("COACH_MODEL_TIERS", "qwen-max,qwen-plus,qwen-turbo").split(",")
+                   if m.strip()]
+    ROUTING_LATENCY_BUDGET = float(os.getenv("COACH_ROUTING_LATENCY_BUDGET", "2.5"))
+    SMALL_TALK_TOKENS = int(os.getenv("COACH_SMALL_TALK_TOKENS", "12"))
+    # 会话开始时后台预生成客户的开场提问，生成期间聊天区域按该间隔（秒）轮询，完成后立即显示
+    PREFETCH_OPENING = os.getenv("COACH_PREFETCH_OPENING", "1") != "0"
+    OPENING_POLL_INTERVAL = float(os.getenv("COACH_OPENING_POLL_INTERVAL", "0.5"))
+    # 性能指标：LLM 排队/首字/总耗时、token、解析、图表构建和脚本运行耗时；
+    # 定时写入 Prometheus 文本格式的指标文件（为空不写），端口非0时另提供 http://host:端口/metrics
+    METRICS = os.getenv("COACH_METRICS", "1") != "0"
+    METRICS_FILE = os.getenv("COACH_METRICS_FILE", os.path.join(BASE_DIR, "data", "metrics.prom"))
+    METRICS_PORT = int(os.getenv("COACH_METRICS_PORT", "0"))
+    METRICS_INTERVAL = float(os.getenv("COACH_METRICS_INTERVAL", "15"))
+
     # Qwen API配置
     @property
     def QWEN_API_KEY(self):
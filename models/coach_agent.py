@@ -1,15 +1,31 @@
-import dashscope
-from dashscope import Generation
-import os
-from typing import List, Dict
-import json
+from typing import List, Dict, Iterator, Union
+from config import Config
+from models.context_manager import ContextWindowManager
+from models.llm_backend import LLMBackend, LLMError
+from models.llm_client import get_default_client
+from models.model_router import ModelRouter
+from models.resilience import CircuitOpenError, get_default_latency_tracker
 
 
 class FinancialCoachAgent:
-    def __init__(self):
-        # 配置 Qwen API - 请替换为您的 API_KEY
-        self.api_key = os.getenv("DASHSCOPE_API_KEY", "sk-f048c8f9134d42058be81012f5cffb23")
-        dashscope.api_key = self.api_key
+    # 客户先开口时代替理财经理发言的提示，引导客户从典型问题中提出开场提问
+    OPENING_PROMPT = "（理财经理已经坐下准备接待你，请你作为客户先开口：简单打个招呼，然后从你的典型问题中挑一个最关心的问出来，不超过两句话）"
+
+    def __init__(self, backend: LLMBackend = None):
+        # LLM 后端（DashScope / OpenAI 兼容接口 / 本地假后端），默认按 Config.LLM_BACKEND 创建
+        self.backend = backend or get_default_client()
+        self.context = ContextWindowManager(
+            max_tokens=Config.CONTEXT_MAX_TOKENS,
+            memo_max_tokens=Config.CONTEXT_MEMO_TOKENS,
+            opening_prompt=self.OPENING_PROMPT
+        )
+        # 关闭路由时所有回复都使用最强的档位
+        self.router = ModelRouter(
+            tiers=Config.MODEL_TIERS,
+            latency=get_default_latency_tracker(),
+            latency_budget=Config.ROUTING_LATENCY_BUDGET,
+            small_talk_tokens=Config.SMALL_TALK_TOKENS
+        ) if Config.MODEL_ROUTING else None
 
         self.client_types = {
             "稳健型中年客户": {
@@ -83,8 +99,94 @@ class FinancialCoachAgent:
             }
         }
 
-    def get_response(self, user_input: str, message_history: List[Dict], client_type: str, difficulty: int = 3) -> str:
-        """获取AI陪练回复"""
+        # 预先渲染每种客户类型 × 难度的系统提示词，每轮对话直接复用，
+        # 同一会话内的提示词前缀逐字节一致，便于服务端前缀缓存命中
+        self._system_prompts = {
+            (client_type, difficulty): self._render_system_prompt(client_type, difficulty)
+            for client_type in self.client_types
+            for difficulty in range(1, 6)
+        }
+
+    def get_response(self, user_input: str, message_history: List[Dict], client_type: str, difficulty: int = 3,
+                     stream: bool = False) -> Union[str, Iterator[str]]:
+        """获取AI陪练回复
+
+        stream=True 时返回增量文本的生成器，便于界面逐字渲染。
+        """
+        messages = self._build_messages(user_input, message_history, client_type, difficulty)
+        temperature = 0.7 + (difficulty * 0.06)  # 难度越高，回复越不可预测
+        models = self.select_models(user_input, client_type, difficulty, stream)
+
+        if stream:
+            return self._stream_response(messages, temperature, models)
+
+        try:
+            # 首选模型失败时依次回退到更快的档位；熔断说明服务整体不可用，不再回退
+            for index, model in enumerate(models):
+                try:
+                    return self.backend.call(messages, model=model, temperature=temperature, max_tokens=500)
+                except LLMError as e:
+                    if isinstance(e, CircuitOpenError) or index == len(models) - 1:
+                        raise
+                    print(f"模型 {model} 调用失败，回退到 {models[index + 1]}: {str(e)}")
+
+        except LLMError as e:
+            if e.status_code is not None:
+                return f"抱歉，Qwen服务暂时不可用。错误码：{e.status_code}"
+            return f"抱歉，我现在无法回复。错误信息：{str(e)}"
+        except Exception as e:
+            return f"抱歉，我现在无法回复。错误信息：{str(e)}"
+
+    def get_opening_messages(self, client_type: str, difficulty: int) -> List[Dict]:
+        """预生成开场提问的消息列表"""
+        return self._build_messages(self.OPENING_PROMPT, [], client_type, difficulty)
+
+    def get_opening(self, client_type: str, difficulty: int, messages: List[Dict] = None) -> str:
+        """客户主动提出的开场提问，失败时抛出 LLMError，供后台预取使用"""
+        messages = messages or self.get_opening_messages(client_type, difficulty)
+        model = self.select_models(self.OPENING_PROMPT, client_type, difficulty)[0]
+        return self.backend.call(messages, model=model, temperature=0.7 + (difficulty * 0.06), max_tokens=500)
+
+    def select_models(self, user_input: str, client_type: str, difficulty: int, stream: bool = False) -> List[str]:
+        """本次回复的候选模型，首选在前"""
+        if self.router is None:
+            return Config.MODEL_TIERS[:1]
+        client_level = self.client_types.get(client_type, {}).get("difficulty")
+        return self.router.route(client_level, difficulty, user_input, stream=stream)
+
+    def _stream_response(self, messages: List[Dict], temperature: float, models: List[str]) -> Iterator[str]:
+        """流式获取回复，逐段产出增量文本；首字之前失败时回退到下一个模型"""
+        try:
+            for index, model in enumerate(models):
+                started = False
+                try:
+                    for delta in self.backend.stream(messages, model=model, temperature=temperature, max_tokens=500):
+                        started = True
+                        yield delta
+                    return
+                except LLMError as e:
+                    if started or isinstance(e, CircuitOpenError) or index == len(models) - 1:
+                        raise
+                    print(f"模型 {model} 调用失败，回退到 {models[index + 1]}: {str(e)}")
+
+        except LLMError as e:
+            if e.status_code is not None:
+                yield f"抱歉，Qwen服务暂时不可用。错误码：{e.status_code}"
+            else:
+                yield f"抱歉，我现在无法回复。错误信息：{str(e)}"
+        except Exception as e:
+            yield f"抱歉，我现在无法回复。错误信息：{str(e)}"
+
+    def get_system_prompt(self, client_type: str, difficulty: int) -> str:
+        """获取预渲染的系统提示词"""
+        system_prompt = self._system_prompts.get((client_type, difficulty))
+        if system_prompt is None:
+            system_prompt = self._system_prompts[(client_type, difficulty)] = self._render_system_prompt(
+                client_type, difficulty)
+        return system_prompt
+
+    def _render_system_prompt(self, client_type: str, difficulty: int) -> str:
+        """渲染客户角色的系统提示词"""
 
         client_profile = self.client_types.get(client_type, self.client_types["稳健型中年客户"])
 
@@ -95,7 +197,7 @@ class FinancialCoachAgent:
         elif difficulty == 5:
             difficulty_modifier = "显著增加质疑和挑战性，可以适当表现出不耐烦和强势态度。"
 
-        system_prompt = f"""
+        return f"""
         你是一名真实的{client_type}，正在与理财经理咨询理财产品。
 
         你的个人情况：{client_profile['profile']}
@@ -116,28 +218,10 @@ class FinancialCoachAgent:
         请用自然、口语化的中文回复，展现真实客户的思考过程。
         """
 
-        try:
-            # 构建对话历史
-            messages = [{"role": "system", "content": system_prompt}]
-            for msg in message_history[-6:]:  # 最近6轮对话作为上下文
-                if msg["role"] == "user":
-                    messages.append({"role": "user", "content": msg["content"]})
-                else:
-                    messages.append({"role": "assistant", "content": msg["content"]})
-
-            # 调用 Qwen API
-            response = Generation.call(
-                model="qwen-max",
-                messages=messages,
-                temperature=0.7 + (difficulty * 0.06),  # 难度越高，回复越不可预测
-                max_tokens=500,
-                result_format='message'
-            )
-
-            if response.status_code == 200:
-                return response.output.choices[0].message.content
-            else:
-                return f"抱歉，Qwen服务暂时不可用。错误码：{response.status_code}"
+    def _build_messages(self, user_input: str, message_history: List[Dict], client_type: str,
+                        difficulty: int) -> List[Dict]:
+        """构建发送给模型的消息列表"""
+        system_prompt = self.get_system_prompt(client_type, difficulty)
 
-        except Exception as e:
-            return f"抱歉，我现在无法回复。错误信息：{str(e)}"
\ No newline at end of file
+        # 按 token 预算截取对话历史，较早的对话压缩为要点
+        return self.context.build(system_prompt, message_history, user_input)
@@ -0,0 +1,101 @@
+import math
+import re
+from typing import List, Dict
+
+_CJK_PATTERN = re.compile(r'[　-〿一-鿿＀-￯]')
+_SENTENCE_END = re.compile(r'[。！？!?\n]')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文字符及全角标点按1个计，其余字符按4个1个计"""
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class ContextWindowManager:
+    """按 token 预算构建客户角色的对话上下文
+
+    - 去掉非对话消息（开场欢迎语、is_feedback 评估报告）
+    - 客户主动提出的开场提问（is_opening）之前补上开场提示，保持理财经理与客户交替发言
+    - 当前这轮理财经理发言只保留一次
+    - 最近的对话尽量原样保留，超出预算的较早对话压缩成一段简短的对话要点，附在系统提示词之后
+    """
+
+    def __init__(self, max_tokens: int = 1500, memo_max_tokens: int = 300, snippet_chars: int = 40,
+                 opening_prompt: str = ""):
+        self.max_tokens = max_tokens
+        self.memo_max_tokens = memo_max_tokens
+        self.snippet_chars = snippet_chars
+        self.opening_prompt = opening_prompt
+
+    def dialogue_messages(self, message_history: List[Dict]) -> List[Dict]:
+        """只保留理财经理与客户之间的真实对话"""
+        dialogue = []
+        for msg in message_history:
+            if msg.get('is_feedback') or msg.get('is_welcome'):
+                continue
+            if msg.get('is_opening') and self.opening_prompt:
+                dialogue.append({"role": "user", "content": self.opening_prompt})
+            # 理财经理开口前的其他助手消息都是系统提示类内容（如欢迎语）
+            elif msg['role'] != 'user' and not dialogue:
+                continue
+            dialogue.append({"role": "user" if msg['role'] == 'user' else "assistant", "content": msg['content']})
+        return dialogue
+
+    def build(self, system_prompt: str, message_history: List[Dict], user_input: str) -> List[Dict]:
+        """构建发送给模型的消息列表"""
+        dialogue = self.dialogue_messages(message_history)
+
+        # 调用方通常已把当前发言追加到历史中，去重后统一放在末尾
+        if dialogue and dialogue[-1]['role'] == 'user' and dialogue[-1]['content'] == user_input:
+            dialogue.pop()
+
+        budget = (self.max_tokens - estimate_tokens(system_prompt) - estimate_tokens(user_input)
+                  - self.memo_max_tokens)
+
+        # 从最近的消息往前保留，直到用完预算
+        recent_start = len(dialogue)
+        used = 0
+        while recent_start > 0:
+            cost = estimate_tokens(dialogue[recent_start - 1]['content'])
+            if used + cost > budget:
+                break
+            used += cost
+            recent_start -= 1
+
+        older, recent = dialogue[:recent_start], dialogue[recent_start:]
+        if older:
+            system_prompt = f"{system_prompt}\n\n{self.summarize(older)}"
+
+        return ([{"role": "system", "content": system_prompt}] + recent
+                + [{"role": "user", "content": user_input}])
+
+    def summarize(self, messages: List[Dict]) -> str:
+        """把较早的对话压缩成逐条要点；超出要点预算时保留离现在最近的部分"""
+        lines = []
+        for msg in messages:
+            speaker = "理财经理" if msg['role'] == 'user' else "你（客户）"
+            lines.append(f"- {speaker}：{self._snippet(msg['content'])}")
+
+        kept = []
+        used = estimate_tokens("此前对话要点：")
+        for line in reversed(lines):
+            cost = estimate_tokens(line)
+            if used + cost > self.memo_max_tokens:
+                break
+            kept.append(line)
+            used += cost
+        kept.reverse()
+
+        return "此前对话要点：\n" + "\n".join(kept)
+
+    def _snippet(self, text: str) -> str:
+        """取第一句话，过长时截断"""
+        text = text.strip()
+        match = _SENTENCE_END.search(text)
+        sentence = text[:match.end()].strip() if match else text
+        if len(sentence) > self.snippet_chars:
+            sentence = sentence[:self.snippet_chars] + "…"
+        return sentence
@@ -0,0 +1,124 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+from config import Config
+
+
+class EvaluationCache:
+    """按对话内容寻址的评估结果缓存
+
+    键为 (理财经理发言, 客户类型, 难度, 提示词版本) 的哈希；内存层按 LRU 淘汰，
+    可选的磁盘层把结果以 JSON 文件保存在 data/ 下，进程重启后仍可命中。
+    """
+
+    def __init__(self, max_entries: int = 256, disk_dir: str = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(manager_messages: List[str], client_type: str, difficulty: int, prompt_version: str) -> str:
+        """计算缓存键"""
+        payload = json.dumps([prompt_version, client_type, difficulty, manager_messages], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """命中时返回评估结果的副本，未命中返回 None"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self._entries[key])
+
+        evaluation = self._read_disk(key)
+        with self._lock:
+            if evaluation is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, evaluation)
+            return copy.deepcopy(evaluation)
+
+    def put(self, key: str, evaluation: Dict):
+        """写入缓存（内存层，以及开启时的磁盘层）"""
+        evaluation = copy.deepcopy(evaluation)
+        with self._lock:
+            self._store(key, evaluation)
+        self._write_disk(key, evaluation)
+
+    def _store(self, key: str, evaluation: Dict):
+        self._entries[key] = evaluation
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Dict]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write_disk(self, key: str, evaluation: Dict):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(evaluation, f, ensure_ascii=False)
+            os.replace(tmp_path, path)  # 原子替换，避免并发读到半个文件
+        except OSError as e:
+            print(f"评估缓存写入失败: {str(e)}")
+
+    def clear(self):
+        """清空内存层（磁盘层保留）"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> EvaluationCache:
+    """进程内共享的默认缓存，按 Config 配置创建"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = EvaluationCache(
+                max_entries=Config.EVALUATION_CACHE_SIZE,
+                disk_dir=Config.EVALUATION_CACHE_DIR or None
+            )
+        return _default_cache
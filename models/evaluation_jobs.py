@@ -0,0 +1,91 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from models.evaluator import SessionEvaluator
+from models.incremental_evaluator import IncrementalEvaluator
+from models.llm_client import llm_user, submit_in_context
+from utils.analytics import invalidate_user_analytics
+from utils.session_store import (SessionStore, EVALUATION_PENDING, EVALUATION_RUNNING, EVALUATION_DONE,
+                                 EVALUATION_FAILED)
+
+
+class EvaluationJobQueue:
+    """后台会话评估任务队列
+
+    结束会话时先保存会话记录（状态为 pending，附带任务ID），评估交给线程池执行，完成后写回数据库；
+    学员无需等待评估即可开始下一个会话，“会话评估”页按任务ID轮询状态。
+    进程重启时，数据库中未完成的任务会重新排队。
+    """
+
+    def __init__(self, evaluator: SessionEvaluator, store: SessionStore, workers: int = 4):
+        self.evaluator = evaluator
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="evaluation-job")
+        self._status = {}  # 任务ID -> 状态，仅覆盖本进程提交的任务
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: str, record: Dict, turn_evaluator: IncrementalEvaluator = None) -> str:
+        """保存会话记录并提交评估任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        record = dict(record, evaluation=None, evaluation_status=EVALUATION_PENDING, evaluation_job_id=job_id)
+        session_id = self.store.save_session(user_id, record)
+        self._enqueue(job_id, session_id, user_id, record, turn_evaluator)
+        return job_id
+
+    def _enqueue(self, job_id: str, session_id: int, user_id: str, record: Dict,
+                 turn_evaluator: IncrementalEvaluator = None):
+        with self._lock:
+            self._status[job_id] = EVALUATION_PENDING
+        with llm_user(user_id):
+            submit_in_context(self._executor, self._run, job_id, session_id, user_id, record, turn_evaluator)
+
+    def _run(self, job_id: str, session_id: int, user_id: str, record: Dict,
+             turn_evaluator: IncrementalEvaluator = None):
+        self._set_status(job_id, EVALUATION_RUNNING)
+        self.store.update_evaluation(session_id, None, EVALUATION_RUNNING)
+        try:
+            # 优先聚合逐轮评估的结果，否则对整段对话做一次评估
+            if turn_evaluator is not None:
+                evaluation = turn_evaluator.report()
+            else:
+                evaluation = self.evaluator.comprehensive_evaluation(
+                    record['messages'], record['client_type'], record.get('difficulty') or 3)
+        except Exception as e:
+            print(f"后台评估失败({job_id}): {str(e)}")
+            self.store.update_evaluation(session_id, None, EVALUATION_FAILED)
+            self._set_status(job_id, EVALUATION_FAILED)
+            return
+
+        self.store.update_evaluation(session_id, evaluation, EVALUATION_DONE)
+        invalidate_user_analytics(user_id)
+        self._set_status(job_id, EVALUATION_DONE)
+
+    def _set_status(self, job_id: str, status: str):
+        with self._lock:
+            self._status[job_id] = status
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """查询任务状态；已完成时附带评估结果"""
+        with self._lock:
+            status = self._status.get(job_id)
+        if status in (EVALUATION_PENDING, EVALUATION_RUNNING):
+            return {"status": status, "evaluation": None}
+
+        job = self.store.get_evaluation_job(job_id)
+        if job is None:
+            return None
+        return {"status": job['status'], "evaluation": job['evaluation'] if job['status'] == EVALUATION_DONE else None}
+
+    def resume_pending(self) -> int:
+        """重新排队数据库中未完成的任务（逐轮评估状态已丢失，改为整体评估），返回任务数"""
+        resumed = 0
+        for pending in self.store.pending_evaluations():
+            with self._lock:
+                if pending['evaluation_job_id'] in self._status:
+                    continue
+            session = self.store.get_session(pending['id'])
+            self._enqueue(pending['evaluation_job_id'], pending['id'], pending['user_id'], session)
+            resumed += 1
+        return resumed
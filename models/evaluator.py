@@ -1,16 +1,38 @@
-import dashscope
-from dashscope import Generation
-import os
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 import re
-import json
+from config import Config
+from models.evaluation_cache import EvaluationCache, get_default_cache
+from models.llm_backend import LLMBackend, LLMError
+from models.llm_client import get_default_client, submit_in_context
+from models.rule_scorer import RuleScorer
+from utils.json_extract import coerce_number, extract_json_object
+from utils.keyword_matcher import KeywordMatcher
+from utils.metrics import timed
 
 
 class SessionEvaluator:
-    def __init__(self):
-        # 配置 Qwen API
-        self.api_key = os.getenv("DASHSCOPE_API_KEY", "sk-f048c8f9134d42058be81012f5cffb23")
-        dashscope.api_key = self.api_key
+    # 评估提示词版本，修改提示词或评分规则时递增，使旧的缓存结果失效
+    PROMPT_VERSION = "2"
+    # 学员在对话中请求即时反馈的指令，包含任一关键词即视为指令，不属于与客户的对话
+    FEEDBACK_COMMANDS = ("请求反馈", "评估")
+
+    @classmethod
+    def is_feedback_request(cls, text: str) -> bool:
+        return any(command in text for command in cls.FEEDBACK_COMMANDS)
+
+    def __init__(self, backend: LLMBackend = None, cache: EvaluationCache = None):
+        # LLM 后端，默认按 Config.LLM_BACKEND 创建
+        self.backend = backend or get_default_client()
+        # 评估结果缓存，默认使用进程内共享缓存；Config.EVALUATION_CACHE_SIZE 为0时不缓存
+        self.cache = cache if cache is not None else (
+            get_default_cache() if Config.EVALUATION_CACHE_SIZE > 0 else None
+        )
+        # 评估请求的额外参数：后端支持时开启 JSON 模式
+        self.json_call_kwargs = (
+            {"response_format": {"type": "json_object"}}
+            if Config.EVALUATION_JSON_MODE and getattr(self.backend, "supports_json_mode", False) else {}
+        )
 
         self.evaluation_criteria = {
             "demand_mining": {
@@ -214,134 +236,283 @@ class SessionEvaluator:
             ]
         }
 
-    def comprehensive_evaluation(self, messages: List[Dict], client_type: str, difficulty: int = 3) -> Dict:
-        """平衡型综合评估 - 严格但公平"""
-
-        # 提取理财经理的发言
-        manager_messages = [msg['content'] for msg in messages if msg['role'] == 'user']
-        conversation_text = "\n".join(manager_messages)
-
-        # 检测亮点和平庸特征
-        positive_score = self._detect_positive_indicators(manager_messages, client_type)
-        mediocrity_score = self._detect_mediocrity(manager_messages)
-
-        # 根据客户类型调整评估重点
-        evaluation_focus = self._get_evaluation_focus(client_type, difficulty)
+        # 亮点指标对应的关键词
+        self.indicator_keywords = {
+            "使用开放式提问深入了解客户": ["什么", "如何", "为什么", "能不能聊聊", "您觉得", "哪些方面"],
+            "系统性收集客户完整信息": ["收入", "支出", "资产", "负债", "家庭", "规划", "工作情况"],
+            "挖掘到客户的隐性需求和痛点": ["其实您", "我理解您", "真正需要", "核心需求", "深层需求"],
+            "建立完整的客户画像": ["整体情况", "全面了解", "综合评估", "客户画像"],
+            "产品推荐与客户需求高度匹配": ["适合您", "根据您的", "匹配", "符合您", "针对您的"],
+            "提供个性化定制方案": ["为您定制", "个性化", "专门为您", "量身定做", "个性化方案"],
+            "有效化解客户关键质疑": ["数据表明", "案例显示", "实际上", "您看这样", "我们可以"],
+            "展现深度同理心和耐心": ["我理解", "不用担心", "慢慢来", "不着急", "有道理"],
+            "语言精准且通俗易懂": ["简单说", "举个例子", "就像", "通俗讲", "说白了"],
+            "建立良好的信任关系": ["我们一起", "长期", "信任", "放心", "合作"],
+            "产品信息准确无误": ["年化收益", "期限", "风险等级", "保本", "收益率"],
+            "风险提示完整清晰": ["风险", "可能亏损", "不保证", "需要注意", "风险提示"]
+        }
 
-        evaluation_prompt = f"""
-作为金融行业资深教练，请对以下理财经理与{client_type}的对话进行平衡评估。难度级别：{difficulty}/5。
+        # 特殊客户类型的额外亮点短语
+        self.client_bonus_phrases = {
+            # 对小白客户的友好表现
+            "friendly": ["不用着急", "慢慢来", "我理解", "不用担心", "简单说", "举个例子", "从基础开始", "一步一步"],
+            # 对蛮横客户的耐心表现
+            "patience": ["我理解您的顾虑", "您说得对", "感谢您提出", "我们来看数据", "保持冷静", "专业应对"]
+        }
 
-对话记录：
-{conversation_text}
+        # 平庸特征短语
+        self.mediocrity_phrases = {
+            "template": ["很高兴为您服务", "这是一个很好的问题", "根据您的需求", "我们推荐", "建议您"],
+            "data": ["数据显示", "统计表明", "案例显示", "历史回报", "年化收益", "具体数据"],
+            "evasion": ["这个要看具体情况", "很难一概而论", "建议您考虑", "我们可以进一步讨论"],
+            "theory": ["首先", "其次", "然后", "最后", "综上所述"]
+        }
 
-{evaluation_focus}
+        # 把以上所有关键词编译为一个多模式匹配器，一次扫描得到全部命中
+        self._keyword_matcher = self._build_keyword_matcher()
+        self._last_scan = (None, None)
+        # 本地规则评分：即时反馈与模型不可用时的回退
+        self.rule_scorer = RuleScorer(self, RuleScorer.load_calibration(Config.RULE_SCORER_CALIBRATION))
 
-## 📊 平衡评估标准（总分100分）
+        # 各客户类型的评估重点
+        self.evaluation_focus_map = {
+            "小白型新手客户": "🎓 重点评估耐心引导和通俗解释能力，认可基础教育的努力。对于通俗易懂的解释要给予加分。",
+            "蛮横型高净值客户": "⚠️ 重点评估情绪控制和专业权威展现，认可压力下的稳定表现。对于保持专业冷静要给予认可。",
+            "稳健型中年客户": "🏠 重点评估风险匹配和家庭规划，认可全面性考虑。对于稳健建议要给予肯定。",
+            "进取型年轻客户": "🚀 重点评估收益机会把握，认可创新思维。对于进取型建议要适当认可。",
+            "保守型退休客户": "🛡️ 重点评估安全保障，认可风险意识。对于保守建议要给予理解。",
+            "企业主客户": "💼 重点评估税务和企业需求，认可商业思维。对于企业角度思考要加分。",
+            "白领上班族": "📱 重点评估便捷方案，认可效率考虑。对于便捷性建议要认可。"
+        }
 
-### 核心原则：
-1. **严格但不苛刻**：要求专业但认可努力
-2. **亮点加分制**：优秀表现给予额外加分  
-3. **进步导向**：重点指出可改进的方向
-4. **客户适配**：根据客户类型调整评估重点
-5. **鼓励为主**：在指出问题的同时给予鼓励
+        # 预先渲染提示词中的固定部分；修改评估标准后需重新调用 _build_prompt_templates
+        self._build_prompt_templates()
 
-### 1. 需求挖掘（20分）
-{self._format_balanced_criteria('demand_mining')}
+    def comprehensive_evaluation(self, messages: List[Dict], client_type: str, difficulty: int = 3,
+                                 parallel: bool = None) -> Dict:
+        """平衡型综合评估 - 严格但公平
 
-### 2. 产品匹配（20分）  
-{self._format_balanced_criteria('product_fit')}
+        parallel 为空时按 Config.PARALLEL_EVALUATION 决定是否按维度并发评估。
+        相同对话的重复评估直接命中缓存，不再调用模型。
+        """
+        if parallel is None:
+            parallel = Config.PARALLEL_EVALUATION
 
-### 3. 异议处理（20分）
-{self._format_balanced_criteria('objection_handling')}
+        # 提取理财经理的发言
+        manager_messages = [msg['content'] for msg in messages if msg['role'] == 'user']
 
-### 4. 沟通能力（20分）
-{self._format_balanced_criteria('communication')}
+        cache_key = self._cache_key(manager_messages, client_type, difficulty, parallel)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
 
-### 5. 专业知识（20分）
-{self._format_balanced_criteria('professional_knowledge')}
+        if parallel:
+            return self.parallel_evaluation(messages, client_type, difficulty, cache_key=cache_key)
 
-## 🌟 亮点加分项（每项+1-2分）：
-- 使用客户能理解的通俗语言解释复杂概念
-- 主动挖掘客户的隐性需求和真实痛点
-- 提供个性化定制的解决方案
-- 有效处理情绪化质疑并建立信任
-- 展现深度专业知识和数据支撑
-- 沟通节奏把控得当，引导对话进程
-- 展现耐心和同理心
-- 提供清晰的步骤指导
+        conversation_text = "\n".join(manager_messages)
 
-## 📈 评分等级标准：
-- 🟢 卓越 (90-100分)：专业表现突出，有多处亮点
-- 🔵 优秀 (80-89分)：表现良好，有明显亮点
-- 🟡 良好 (70-79分)：基本达标，有进步空间  
-- 🟠 及格 (60-69分)：存在不足但无重大错误
-- 🔴 需改进 (50-59分)：需要重点改进
+        # 检测亮点和平庸特征
+        positive_score = self._detect_positive_indicators(manager_messages, client_type)
+        mediocrity_score = self._detect_mediocrity(manager_messages)
 
-请以JSON格式返回评估结果：
-{{
-    "overall_score": 75,
-    "scores": {{
-        "demand_mining": 15,
-        "product_fit": 16,
-        "objection_handling": 14, 
-        "communication": 16,
-        "professional_knowledge": 14
-    }},
-    "strengths": ["具体亮点描述，至少找出2-3个积极方面"],
-    "improvements": ["具体改进建议，3-4个关键点"],
-    "critical_errors": ["重大错误列表，如无则留空"],
-    "positive_highlights": ["检测到的具体亮点"],
-    "suggested_phrases": ["针对性提升话术"],
-    "detailed_feedback": {{
-        "demand_mining": "具体评价和改进建议",
-        "product_fit": "具体评价和改进建议",
-        "objection_handling": "具体评价和改进建议", 
-        "communication": "具体评价和改进建议",
-        "professional_knowledge": "具体评价和改进建议"
-    }},
-    "performance_level": "需改进/及格/良好/优秀/卓越",
-    "encouragement": "一句鼓励性话语"
-}}
+        # 根据客户类型调整评估重点
+        evaluation_focus = self._get_evaluation_focus(client_type, difficulty)
 
-请确保找出对话中的亮点，给予建设性反馈。
-"""
+        # 固定前缀在前、本次对话在后，保证前缀逐字节一致，便于服务端前缀缓存命中
+        evaluation_prompt = self._evaluation_prompt_prefix + self._render_session_section(
+            client_type, difficulty, evaluation_focus, conversation_text)
 
         try:
             # 使用 Qwen API
-            response = Generation.call(
-                model="qwen-turbo",
+            result_text = self.backend.call(
                 messages=[{"role": "user", "content": evaluation_prompt}],
+                model="qwen-turbo",
                 temperature=0.3,  # 适度随机性以识别亮点
                 max_tokens=4000,
-                result_format='message'
+                **self.json_call_kwargs
             )
+            # 无法解析时抛出 ValueError，按难度和客户类型回退且不写入缓存
+            with timed("evaluation_parse_seconds", kind="session"):
+                evaluation_data = self._parse_evaluation(result_text, manager_messages, client_type)
+
+            # 应用亮点加分
+            evaluation_data = self._apply_positive_adjustment(evaluation_data, positive_score)
+            # 应用平庸检测调整（更温和）
+            evaluation_data = self._apply_mediocrity_adjustment(evaluation_data, mediocrity_score)
+            # 根据难度调整
+            evaluation_data = self._apply_difficulty_adjustment(evaluation_data, difficulty, client_type)
+
+            # 有维度由本地规则补齐的结果不写入缓存，下次仍请求模型
+            if cache_key is not None and not evaluation_data.get('rule_dimensions'):
+                self.cache.put(cache_key, evaluation_data)
+            return evaluation_data
+
+        except LLMError as e:
+            print(f"Qwen API错误: {e.status_code if e.status_code is not None else e}")
+            return self.get_balanced_evaluation(difficulty, client_type, manager_messages)
+        except Exception as e:
+            print(f"评估过程出错: {str(e)}")
+            return self.get_balanced_evaluation(difficulty, client_type, manager_messages)
 
-            if response.status_code == 200:
-                result_text = response.output.choices[0].message.content
-                evaluation_data = self.parse_evaluation_result(result_text)
+    def _cache_key(self, manager_messages: List[str], client_type: str, difficulty: int, parallel: bool):
+        """计算评估缓存键，未启用缓存时返回 None"""
+        if self.cache is None:
+            return None
+        prompt_version = f"{self.PROMPT_VERSION}-{'parallel' if parallel else 'single'}"
+        return self.cache.make_key(manager_messages, client_type, difficulty, prompt_version)
 
-                # 应用亮点加分
-                evaluation_data = self._apply_positive_adjustment(evaluation_data, positive_score)
-                # 应用平庸检测调整（更温和）
-                evaluation_data = self._apply_mediocrity_adjustment(evaluation_data, mediocrity_score)
-                # 根据难度调整
-                evaluation_data = self._apply_difficulty_adjustment(evaluation_data, difficulty, client_type)
+    def parallel_evaluation(self, messages: List[Dict], client_type: str, difficulty: int = 3,
+                            cache_key: str = None) -> Dict:
+        """按维度并发评估：每个维度一个小提示词并发请求，再合并为完整评估结果
 
-                return evaluation_data
-            else:
-                print(f"Qwen API错误: {response.status_code}")
-                return self.get_balanced_evaluation(difficulty, client_type)
+        总耗时约等于最慢的单个维度；某个维度失败时只有该维度回退到本地规则评分，并记入 rule_dimensions。
+        只有全部维度都成功的结果才会写入缓存。
+        """
+        manager_messages = [msg['content'] for msg in messages if msg['role'] == 'user']
+        conversation_text = "\n".join(manager_messages)
 
-        except Exception as e:
-            print(f"评估过程出错: {str(e)}")
-            return self.get_balanced_evaluation(difficulty, client_type)
+        positive_score = self._detect_positive_indicators(manager_messages, client_type)
+        mediocrity_score = self._detect_mediocrity(manager_messages)
+        evaluation_focus = self._get_evaluation_focus(client_type, difficulty)
+        rule_results = self.rule_scorer.score_dimensions(manager_messages, client_type)
+        fallback = self.get_balanced_evaluation(difficulty, client_type, manager_messages, dimensions=rule_results)
+
+        results = {}
+        failed = []
+        with ThreadPoolExecutor(max_workers=len(self.evaluation_criteria)) as executor:
+            futures = {
+                dimension: submit_in_context(executor, self._evaluate_dimension, dimension, conversation_text,
+                                             client_type, difficulty, evaluation_focus)
+                for dimension in self.evaluation_criteria
+            }
+            for dimension, future in futures.items():
+                try:
+                    results[dimension] = future.result()
+                except Exception as e:
+                    print(f"维度评估出错({dimension}): {str(e)}")
+                    results[dimension] = rule_results[dimension]
+                    failed.append(dimension)
+
+        # 所有维度都失败时与整体评估失败的行为保持一致
+        if len(failed) == len(self.evaluation_criteria):
+            return fallback
+
+        evaluation_data = self._merge_dimension_results(results, fallback)
+        evaluation_data = self._apply_positive_adjustment(evaluation_data, positive_score)
+        evaluation_data = self._apply_mediocrity_adjustment(evaluation_data, mediocrity_score)
+        evaluation_data = self._apply_difficulty_adjustment(evaluation_data, difficulty, client_type)
+
+        if failed:
+            evaluation_data['rule_dimensions'] = failed
+        elif cache_key is not None:
+            self.cache.put(cache_key, evaluation_data)
+        return evaluation_data
+
+    def _evaluate_dimension(self, dimension: str, conversation_text: str, client_type: str, difficulty: int,
+                            evaluation_focus: str) -> Dict:
+        """评估单个维度，失败时抛出异常由调用方回退"""
+        dimension_prompt = self._dimension_prompt_prefixes[dimension] + self._render_session_section(
+            client_type, difficulty, evaluation_focus, conversation_text)
+        result_text = self.backend.call(
+            messages=[{"role": "user", "content": dimension_prompt}],
+            model="qwen-turbo",
+            temperature=0.3,
+            max_tokens=800,
+            **self.json_call_kwargs
+        )
+        with timed("evaluation_parse_seconds", kind="dimension"):
+            return self._parse_dimension_result(result_text, dimension)
+
+    def _parse_dimension_result(self, result_text: str, dimension: str) -> Dict:
+        """解析单维度评估结果，格式不符时抛出 ValueError"""
+        result = extract_json_object(result_text)
+        if result is None:
+            # JSON 无法恢复时至少抢救出分数
+            result = self._salvage_fields(result_text, ['score'])
+            if not result:
+                raise ValueError("未找到JSON结果")
+
+        # 兼容模型按整体格式返回的情况
+        scores = result.get('scores') if isinstance(result.get('scores'), dict) else {}
+        score = coerce_number(result.get('score', scores.get(dimension)))
+        if score is None:
+            raise ValueError("缺少有效的 score 字段")
+
+        detailed_feedback = result.get('detailed_feedback') if isinstance(result.get('detailed_feedback'), dict) else {}
+        feedback = result.get('feedback', detailed_feedback.get(dimension, ''))
+        max_score = self.evaluation_criteria[dimension]['max_score']
+        return {
+            "score": max(0, min(max_score, int(score))),
+            "strengths": self._string_list(result.get('strengths')),
+            "improvements": self._string_list(result.get('improvements')),
+            "critical_errors": self._string_list(result.get('critical_errors')),
+            "positive_highlights": self._string_list(result.get('positive_highlights')),
+            "suggested_phrases": self._string_list(result.get('suggested_phrases')),
+            "feedback": feedback if isinstance(feedback, str) else ''
+        }
+
+    def _merge_dimension_results(self, results: Dict[str, Dict], fallback: Dict) -> Dict:
+        """把各维度结果合并为 format_feedback / create_radar_dashboard 使用的格式"""
+
+        def collect(field: str, limit: int = None) -> List[str]:
+            items = []
+            for result in results.values():
+                for item in result.get(field, []):
+                    if item and item not in items:
+                        items.append(item)
+            return items[:limit] if limit else items
+
+        scores = {dimension: result['score'] for dimension, result in results.items()}
+        overall_score = round(sum(
+            scores[dimension] / criteria['max_score'] * criteria['weight'] * 100
+            for dimension, criteria in self.evaluation_criteria.items()
+        ))
+
+        return {
+            "overall_score": overall_score,
+            "scores": scores,
+            "strengths": collect('strengths', 4) or fallback['strengths'],
+            "improvements": collect('improvements', 4) or fallback['improvements'],
+            "critical_errors": collect('critical_errors'),
+            "positive_highlights": collect('positive_highlights', 5),
+            "suggested_phrases": collect('suggested_phrases', 4),
+            "detailed_feedback": {dimension: result['feedback'] for dimension, result in results.items()},
+            "performance_level": self._get_performance_level(overall_score),
+            "encouragement": fallback['encouragement']
+        }
+
+    def _build_keyword_matcher(self) -> KeywordMatcher:
+        """编译亮点与平庸检测用到的全部关键词"""
+        groups = {}
+        for indicators in self.positive_indicators.values():
+            for indicator in indicators:
+                groups[f"indicator:{indicator}"] = self._get_indicator_keywords(indicator)
+        for name, phrases in self.client_bonus_phrases.items():
+            groups[f"bonus:{name}"] = phrases
+        for name, phrases in self.mediocrity_phrases.items():
+            groups[f"mediocrity:{name}"] = phrases
+        return KeywordMatcher(groups)
+
+    def _scan_keywords(self, manager_messages: List[str]) -> Dict:
+        """一次扫描理财经理发言，返回各分组命中的关键词
+
+        亮点与平庸检测通常针对同一段发言先后调用，复用最近一次的扫描结果。
+        """
+        text = " ".join(manager_messages).lower()
+        last_text, last_hits = self._last_scan
+        if text == last_text:
+            return last_hits
+        hits = self._keyword_matcher.scan(text)
+        self._last_scan = (text, hits)
+        return hits
 
     def _detect_positive_indicators(self, manager_messages: List[str], client_type: str) -> float:
         """检测回答中的亮点"""
         if not manager_messages:
             return 0.0
 
-        text = " ".join(manager_messages).lower()
+        hits = self._scan_keywords(manager_messages)
 
         positive_count = 0
         total_indicators = 0
@@ -349,44 +520,21 @@ class SessionEvaluator:
         for dimension, indicators in self.positive_indicators.items():
             total_indicators += len(indicators)
             for indicator in indicators:
-                # 简单的关键词匹配
-                keywords = self._get_indicator_keywords(indicator)
-                if any(keyword in text for keyword in keywords):
+                if hits[f"indicator:{indicator}"]:
                     positive_count += 1
 
         # 特殊客户类型的额外亮点检测
-        if "小白" in client_type:
-            # 检测对小白客户的友好表现
-            friendly_indicators = ["不用着急", "慢慢来", "我理解", "不用担心", "简单说", "举个例子", "从基础开始",
-                                   "一步一步"]
-            if any(indicator in text for indicator in friendly_indicators):
-                positive_count += 2
-
-        if "蛮横" in client_type:
-            # 检测对蛮横客户的耐心表现
-            patience_indicators = ["我理解您的顾虑", "您说得对", "感谢您提出", "我们来看数据", "保持冷静", "专业应对"]
-            if any(indicator in text for indicator in patience_indicators):
-                positive_count += 2
+        if "小白" in client_type and hits["bonus:friendly"]:
+            positive_count += 2
+
+        if "蛮横" in client_type and hits["bonus:patience"]:
+            positive_count += 2
 
         return positive_count / total_indicators if total_indicators > 0 else 0.0
 
     def _get_indicator_keywords(self, indicator: str) -> List[str]:
         """获取指标对应的关键词"""
-        keyword_map = {
-            "使用开放式提问深入了解客户": ["什么", "如何", "为什么", "能不能聊聊", "您觉得", "哪些方面"],
-            "系统性收集客户完整信息": ["收入", "支出", "资产", "负债", "家庭", "规划", "工作情况"],
-            "挖掘到客户的隐性需求和痛点": ["其实您", "我理解您", "真正需要", "核心需求", "深层需求"],
-            "建立完整的客户画像": ["整体情况", "全面了解", "综合评估", "客户画像"],
-            "产品推荐与客户需求高度匹配": ["适合您", "根据您的", "匹配", "符合您", "针对您的"],
-            "提供个性化定制方案": ["为您定制", "个性化", "专门为您", "量身定做", "个性化方案"],
-            "有效化解客户关键质疑": ["数据表明", "案例显示", "实际上", "您看这样", "我们可以"],
-            "展现深度同理心和耐心": ["我理解", "不用担心", "慢慢来", "不着急", "有道理"],
-            "语言精准且通俗易懂": ["简单说", "举个例子", "就像", "通俗讲", "说白了"],
-            "建立良好的信任关系": ["我们一起", "长期", "信任", "放心", "合作"],
-            "产品信息准确无误": ["年化收益", "期限", "风险等级", "保本", "收益率"],
-            "风险提示完整清晰": ["风险", "可能亏损", "不保证", "需要注意", "风险提示"]
-        }
-        return keyword_map.get(indicator, [indicator.split()[0].lower()])
+        return self.indicator_keywords.get(indicator, [indicator.split()[0].lower()])
 
     def _apply_positive_adjustment(self, evaluation_data: Dict, positive_score: float) -> Dict:
         """根据亮点检测调整分数"""
@@ -447,8 +595,135 @@ class SessionEvaluator:
         else:
             return "需改进"
 
+    def _build_prompt_templates(self):
+        """预渲染各提示词的固定前缀、评估标准文本和各客户类型/难度的评估重点"""
+        self._criteria_text = {key: self._render_balanced_criteria(key) for key in self.evaluation_criteria}
+        self._evaluation_focus = {
+            (client_type, difficulty): self._render_evaluation_focus(client_type, difficulty)
+            for client_type in self.evaluation_focus_map
+            for difficulty in range(1, 6)
+        }
+        self._evaluation_prompt_prefix = f"""
+作为金融行业资深教练，请对理财经理与客户的对话进行平衡评估。
+
+## 📊 平衡评估标准（总分100分）
+
+### 核心原则：
+1. **严格但不苛刻**：要求专业但认可努力
+2. **亮点加分制**：优秀表现给予额外加分  
+3. **进步导向**：重点指出可改进的方向
+4. **客户适配**：根据客户类型调整评估重点
+5. **鼓励为主**：在指出问题的同时给予鼓励
+
+### 1. 需求挖掘（20分）
+{self._criteria_text['demand_mining']}
+
+### 2. 产品匹配（20分）  
+{self._criteria_text['product_fit']}
+
+### 3. 异议处理（20分）
+{self._criteria_text['objection_handling']}
+
+### 4. 沟通能力（20分）
+{self._criteria_text['communication']}
+
+### 5. 专业知识（20分）
+{self._criteria_text['professional_knowledge']}
+
+## 🌟 亮点加分项（每项+1-2分）：
+- 使用客户能理解的通俗语言解释复杂概念
+- 主动挖掘客户的隐性需求和真实痛点
+- 提供个性化定制的解决方案
+- 有效处理情绪化质疑并建立信任
+- 展现深度专业知识和数据支撑
+- 沟通节奏把控得当，引导对话进程
+- 展现耐心和同理心
+- 提供清晰的步骤指导
+
+## 📈 评分等级标准：
+- 🟢 卓越 (90-100分)：专业表现突出，有多处亮点
+- 🔵 优秀 (80-89分)：表现良好，有明显亮点
+- 🟡 良好 (70-79分)：基本达标，有进步空间  
+- 🟠 及格 (60-69分)：存在不足但无重大错误
+- 🔴 需改进 (50-59分)：需要重点改进
+
+请以JSON格式返回评估结果：
+{{
+    "overall_score": 75,
+    "scores": {{
+        "demand_mining": 15,
+        "product_fit": 16,
+        "objection_handling": 14, 
+        "communication": 16,
+        "professional_knowledge": 14
+    }},
+    "strengths": ["具体亮点描述，至少找出2-3个积极方面"],
+    "improvements": ["具体改进建议，3-4个关键点"],
+    "critical_errors": ["重大错误列表，如无则留空"],
+    "positive_highlights": ["检测到的具体亮点"],
+    "suggested_phrases": ["针对性提升话术"],
+    "detailed_feedback": {{
+        "demand_mining": "具体评价和改进建议",
+        "product_fit": "具体评价和改进建议",
+        "objection_handling": "具体评价和改进建议", 
+        "communication": "具体评价和改进建议",
+        "professional_knowledge": "具体评价和改进建议"
+    }},
+    "performance_level": "需改进/及格/良好/优秀/卓越",
+    "encouragement": "一句鼓励性话语"
+}}
+
+请确保找出对话中的亮点，给予建设性反馈。
+"""
+        self._dimension_prompt_prefixes = {
+            dimension: self._render_dimension_prompt_prefix(dimension) for dimension in self.evaluation_criteria
+        }
+
+    def _render_dimension_prompt_prefix(self, dimension: str) -> str:
+        """单维度评估提示词的固定前缀"""
+        criteria = self.evaluation_criteria[dimension]
+        return f"""
+作为金融行业资深教练，请只针对「{criteria['description']}」这一个维度，评估理财经理与客户的对话。
+
+## 评估标准（满分{criteria['max_score']}分）
+{self._criteria_text[dimension]}
+
+评分参考：{criteria['excellent_threshold']}分以上优秀，{criteria['good_threshold']}分以上良好，{criteria['pass_threshold']}分以上及格。
+
+请以JSON格式返回该维度的评估结果：
+{{
+    "score": 15,
+    "strengths": ["该维度的具体亮点，1-2条"],
+    "improvements": ["该维度的改进建议，1-2条"],
+    "critical_errors": ["该维度的重大错误，如无则留空"],
+    "positive_highlights": ["检测到的具体亮点"],
+    "suggested_phrases": ["针对该维度的提升话术"],
+    "feedback": "该维度的具体评价和改进建议"
+}}
+"""
+
+    @staticmethod
+    def _render_session_section(client_type: str, difficulty: int, evaluation_focus: str,
+                                conversation_text: str) -> str:
+        """提示词中随会话变化的部分，始终放在固定前缀之后"""
+        return f"""
+## 本次评估
+客户类型：{client_type}，难度级别：{difficulty}/5。
+{evaluation_focus}
+
+对话记录：
+{conversation_text}
+"""
+
     def _format_balanced_criteria(self, criteria_key: str) -> str:
-        """格式化平衡评估标准"""
+        """格式化平衡评估标准（预渲染结果）"""
+        criteria_text = self._criteria_text.get(criteria_key)
+        if criteria_text is None:
+            criteria_text = self._criteria_text[criteria_key] = self._render_balanced_criteria(criteria_key)
+        return criteria_text
+
+    def _render_balanced_criteria(self, criteria_key: str) -> str:
+        """渲染平衡评估标准"""
         criteria = self.evaluation_criteria[criteria_key]
         positive = "\n".join([f"   ✅ {indicator}" for indicator in self.positive_indicators[criteria_key][:3]])
         improvements = "\n".join([f"   📝 {rule}" for rule in criteria['deduction_rules'][:3]])
@@ -456,18 +731,16 @@ class SessionEvaluator:
         return f"优秀表现：\n{positive}\n常见不足：\n{improvements}"
 
     def _get_evaluation_focus(self, client_type: str, difficulty: int) -> str:
-        """获取评估重点说明"""
-        focus_map = {
-            "小白型新手客户": "🎓 重点评估耐心引导和通俗解释能力，认可基础教育的努力。对于通俗易懂的解释要给予加分。",
-            "蛮横型高净值客户": "⚠️ 重点评估情绪控制和专业权威展现，认可压力下的稳定表现。对于保持专业冷静要给予认可。",
-            "稳健型中年客户": "🏠 重点评估风险匹配和家庭规划，认可全面性考虑。对于稳健建议要给予肯定。",
-            "进取型年轻客户": "🚀 重点评估收益机会把握，认可创新思维。对于进取型建议要适当认可。",
-            "保守型退休客户": "🛡️ 重点评估安全保障，认可风险意识。对于保守建议要给予理解。",
-            "企业主客户": "💼 重点评估税务和企业需求，认可商业思维。对于企业角度思考要加分。",
-            "白领上班族": "📱 重点评估便捷方案，认可效率考虑。对于便捷性建议要认可。"
-        }
+        """获取评估重点说明（预渲染结果）"""
+        focus = self._evaluation_focus.get((client_type, difficulty))
+        if focus is None:
+            focus = self._evaluation_focus[(client_type, difficulty)] = self._render_evaluation_focus(
+                client_type, difficulty)
+        return focus
 
-        base_focus = focus_map.get(client_type, "采用标准平衡评估，重点找出亮点和进步空间。")
+    def _render_evaluation_focus(self, client_type: str, difficulty: int) -> str:
+        """渲染评估重点说明"""
+        base_focus = self.evaluation_focus_map.get(client_type, "采用标准平衡评估，重点找出亮点和进步空间。")
 
         if difficulty >= 4:
             base_focus += f"\n🔴 高难度模式：适当提高优秀标准，但仍要认可努力和亮点。"
@@ -479,29 +752,25 @@ class SessionEvaluator:
         if not manager_messages:
             return 0.0
 
-        text = " ".join(manager_messages).lower()
+        hits = self._scan_keywords(manager_messages)
 
         mediocrity_indicators = 0
         total_indicators = len(self.mediocre_patterns)
 
         # 检测模板化语言
-        template_phrases = ["很高兴为您服务", "这是一个很好的问题", "根据您的需求", "我们推荐", "建议您"]
-        if any(phrase in text for phrase in template_phrases):
+        if hits["mediocrity:template"]:
             mediocrity_indicators += 1
 
         # 检测缺乏数据支撑
-        data_indicators = ["数据显示", "统计表明", "案例显示", "历史回报", "年化收益", "具体数据"]
-        if not any(indicator in text for indicator in data_indicators):
+        if not hits["mediocrity:data"]:
             mediocrity_indicators += 1
 
         # 检测回避问题
-        evasion_phrases = ["这个要看具体情况", "很难一概而论", "建议您考虑", "我们可以进一步讨论"]
-        if any(phrase in text for phrase in evasion_phrases):
+        if hits["mediocrity:evasion"]:
             mediocrity_indicators += 1
 
         # 检测理论堆砌
-        theory_words = ["首先", "其次", "然后", "最后", "综上所述"]
-        if len([word for word in theory_words if word in text]) > 3:
+        if len(hits["mediocrity:theory"]) > 3:
             mediocrity_indicators += 1
 
         return mediocrity_indicators / total_indicators
@@ -540,74 +809,103 @@ class SessionEvaluator:
 
         return "\n".join(modifiers) if modifiers else "采用标准平衡评估，重点找出亮点。"
 
-    def parse_evaluation_result(self, result_text: str) -> Dict:
-        """解析评估结果"""
+    def parse_evaluation_result(self, result_text: str, difficulty: int = 3, client_type: str = "普通客户",
+                                manager_messages: List[str] = None) -> Dict:
+        """解析评估结果，完全无法解析时按实际难度和客户类型回退到本地规则评分"""
         try:
-            # 提取JSON部分
-            json_match = re.search(r'\{.*\}', result_text, re.DOTALL)
-            if json_match:
-                result = json.loads(json_match.group())
-                # 验证必要字段是否存在
-                required_fields = ['overall_score', 'scores']
-                if all(field in result for field in required_fields):
-                    return result
-                else:
-                    return self.get_balanced_evaluation(3, "普通客户")
-            else:
-                return self.get_balanced_evaluation(3, "普通客户")
-        except:
-            return self.get_balanced_evaluation(3, "普通客户")
-
-    def get_balanced_evaluation(self, difficulty: int = 3, client_type: str = "普通客户") -> Dict:
-        """获取平衡的默认评估结果"""
-        # 更合理的基准分数
-        base_score = 68 - (difficulty - 3) * 4  # 难度影响更温和
-
-        # 根据客户类型微调基准分
-        if "小白" in client_type:
-            base_score += 2  # 对小白客户更宽容
-        elif "蛮横" in client_type:
-            base_score -= 3  # 对蛮横客户稍严格
+            return self._parse_evaluation(result_text, manager_messages, client_type)
+        except ValueError:
+            return self.get_balanced_evaluation(difficulty, client_type, manager_messages)
 
-        return {
-            "overall_score": max(55, base_score),
-            "scores": {
-                "demand_mining": max(12, 15 - (difficulty - 3) * 1.5),
-                "product_fit": max(12, 15 - (difficulty - 3) * 1.5),
-                "objection_handling": max(11, 14 - (difficulty - 3) * 1.2),
-                "communication": max(13, 16 - (difficulty - 3) * 1.2),
-                "professional_knowledge": max(12, 15 - (difficulty - 3) * 1.2)
-            },
-            "strengths": [
-                "基本沟通能力良好",
-                "展现了服务客户的意愿",
-                "对客户问题做出了积极回应",
-                "具备基本的专业知识"
-            ],
-            "improvements": [
-                "可以更深度挖掘客户需求",
-                "产品推荐可以更个性化",
-                "沟通表达可以更结构化",
-                "可以更多使用数据支撑观点"
-            ],
-            "critical_errors": [],
-            "positive_highlights": ["积极回应客户问题", "展现服务意识"],
-            "suggested_phrases": [
-                "尝试使用更多开放式提问了解客户深层需求",
-                "在推荐产品时提供具体的数据支撑",
-                "用更结构化的方式组织沟通内容",
-                "针对客户特点提供更个性化的建议"
-            ],
-            "detailed_feedback": {
-                "demand_mining": "基本需求了解到位，可以进一步挖掘隐性需求和建立完整客户画像",
-                "product_fit": "产品推荐基本合理，匹配精度可以提升，建议更多个性化定制",
-                "objection_handling": "对客户疑虑有所回应，处理技巧可以加强，建议更多使用数据支撑",
-                "communication": "沟通表达清晰，可以更好引导对话节奏和建立信任关系",
-                "professional_knowledge": "专业知识掌握良好，可以更多结合案例和数据说明"
-            },
-            "performance_level": "良好" if base_score >= 70 else "及格",
-            "encouragement": "表现不错！继续努力，每一次对话都是进步的机会！"
-        }
+    def _parse_evaluation(self, result_text: str, manager_messages: List[str] = None,
+                          client_type: str = "普通客户") -> Dict:
+        """解析整体评估结果：容忍前后说明文字、尾逗号和截断，再按评分标准校验
+
+        完全无法得到任何维度得分时抛出 ValueError；理财经理发言用于给缺失的维度做本地规则评分。
+        """
+        result = extract_json_object(result_text)
+        if result is None:
+            result = self._salvage_fields(result_text, ['overall_score'] + list(self.evaluation_criteria))
+            result = {
+                "overall_score": result.pop('overall_score', None),
+                "scores": result
+            }
+        return self._validate_evaluation(result, manager_messages, client_type)
+
+    def _validate_evaluation(self, result: Dict, manager_messages: List[str] = None,
+                             client_type: str = "普通客户") -> Dict:
+        """按评分标准校验整体评估结果
+
+        各维度得分限制在 0~满分；缺失的维度按理财经理发言的本地规则评分补齐，并记入 rule_dimensions；
+        总分缺失、越界或有维度被补齐时，按维度得分和权重重新计算。列表字段统一为字符串列表。
+        """
+        raw_scores = result.get('scores') if isinstance(result.get('scores'), dict) else {}
+        scores = {}
+        for dimension, criteria in self.evaluation_criteria.items():
+            score = coerce_number(raw_scores.get(dimension))
+            if score is not None:
+                scores[dimension] = max(0, min(criteria['max_score'], score))
+        if not scores:
+            raise ValueError("缺少有效的 scores 字段")
+
+        detailed_feedback = result.get('detailed_feedback') if isinstance(result.get('detailed_feedback'), dict) else {}
+        detailed_feedback = {dimension: feedback for dimension, feedback in detailed_feedback.items()
+                             if isinstance(feedback, str)}
+        missing = [dimension for dimension in self.evaluation_criteria if dimension not in scores]
+        if missing:
+            rule_results = self.rule_scorer.score_dimensions(manager_messages or [], client_type)
+            for dimension in missing:
+                scores[dimension] = rule_results[dimension]['score']
+                detailed_feedback[dimension] = rule_results[dimension]['feedback']
+
+        overall_score = coerce_number(result.get('overall_score'))
+        if missing or overall_score is None or not 0 <= overall_score <= 100:
+            overall_score = round(sum(
+                scores[dimension] / criteria['max_score'] * criteria['weight'] * 100
+                for dimension, criteria in self.evaluation_criteria.items()
+            ))
+
+        evaluation = dict(result)
+        evaluation.update({
+            "overall_score": overall_score,
+            "scores": scores,
+            "detailed_feedback": detailed_feedback
+        })
+        if missing:
+            evaluation['rule_dimensions'] = missing
+        for field in ('strengths', 'improvements', 'critical_errors', 'positive_highlights', 'suggested_phrases'):
+            evaluation[field] = self._string_list(result.get(field))
+        if not isinstance(evaluation.get('performance_level'), str):
+            evaluation['performance_level'] = self._get_performance_level(overall_score)
+        return evaluation
+
+    @staticmethod
+    def _salvage_fields(result_text: str, fields: List[str]) -> Dict:
+        """JSON 无法恢复时，按 "字段": 数值 的形式逐个抢救出数字"""
+        salvaged = {}
+        for field in fields:
+            match = re.search(rf'"?{field}"?\s*[:：]\s*"?(-?\d+(?:\.\d+)?)', result_text)
+            if match:
+                salvaged[field] = coerce_number(match.group(1))
+        return salvaged
+
+    @staticmethod
+    def _string_list(value) -> List[str]:
+        """模型有时把列表字段写成单个字符串"""
+        if isinstance(value, str):
+            return [value] if value else []
+        if isinstance(value, list):
+            return [item for item in value if isinstance(item, str) and item]
+        return []
+
+    def get_balanced_evaluation(self, difficulty: int = 3, client_type: str = "普通客户",
+                                manager_messages: List[str] = None, dimensions: Dict[str, Dict] = None) -> Dict:
+        """模型评估不可用时的回退：按理财经理的实际发言做本地规则评分
+
+        结果中 evaluation_source 为 rules，便于界面提示和批量重评统计。
+        已算好 rule_scorer.score_dimensions 结果的调用方可通过 dimensions 传入，避免重复评分。
+        """
+        return self.rule_scorer.evaluate(manager_messages or [], client_type, difficulty, dimensions=dimensions)
 
     def format_feedback(self, evaluation: Dict) -> str:
         """格式化反馈信息"""
@@ -0,0 +1,127 @@
+"""OpenAI 兼容的本地替身服务
+
+用 FakeBackend 在本地提供 /v1/chat/completions 接口，便于在不访问真实 Qwen 服务的情况下
+对 OpenAICompatibleBackend 的完整 HTTP 链路做压测：
+
+    python -m models.fake_llm_server --port 8001 --latency 0.8 --jitter 0.2
+    COACH_LLM_BACKEND=openai COACH_OPENAI_BASE_URL=http://127.0.0.1:8001/v1 streamlit run app.py
+"""
+import argparse
+import json
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from models.llm_backend import FakeBackend
+
+
+class FakeChatHandler(BaseHTTPRequestHandler):
+    backend = FakeBackend()
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive 连接复用
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON body"}})
+            return
+
+        model = request.get("model", "fake")
+        messages = request.get("messages", [])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if request.get("stream"):
+            self._stream(completion_id, model, messages)
+            return
+
+        content = self.backend.call(messages, model)
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }]
+        })
+
+    def _stream(self, completion_id: str, model: str, messages):
+        """以 SSE 格式逐段返回"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        for delta in self.backend.stream(messages, model):
+            self._write_event({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]
+            })
+        self._write_event({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def _write_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 压测时请求量很大，不逐条打印访问日志
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地替身 LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.8, help="首字延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟抖动幅度（秒）")
+    parser.add_argument("--delta-interval", type=float, default=0.05, help="流式分段间隔（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    FakeChatHandler.backend = FakeBackend(
+        latency=args.latency,
+        jitter=args.jitter,
+        delta_interval=args.delta_interval,
+        seed=args.seed
+    )
+    ThreadingHTTPServer.request_queue_size = 256  # 默认 backlog 只有5，并发建连时会丢 SYN 导致秒级重传
+    server = ThreadingHTTPServer((args.host, args.port), FakeChatHandler)
+    print(f"Fake LLM server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import List, Dict
+
+from config import Config
+from models.evaluator import SessionEvaluator
+from models.llm_client import submit_in_context
+from utils.json_extract import coerce_number, extract_json_object
+from utils.metrics import timed
+
+# 进程内共享的逐轮评估线程池，避免每个会话各建一套线程
+_TURN_EXECUTOR = ThreadPoolExecutor(max_workers=Config.TURN_EVALUATION_WORKERS,
+                                    thread_name_prefix="turn-eval")
+
+
+@lru_cache(maxsize=8)
+def _turn_prompt_prefix(evaluator: SessionEvaluator) -> str:
+    """逐轮评估提示词的固定前缀，每个评估器只渲染一次"""
+    dimensions = "\n".join(
+        f"- {dimension}：{criteria['description']}（满分{criteria['max_score']}分）"
+        for dimension, criteria in evaluator.evaluation_criteria.items()
+    )
+    return f"""
+作为金融行业资深教练，请评估理财经理在与客户对话中的一轮发言。
+
+评估维度：
+{dimensions}
+
+只对本轮发言中实际体现的维度打分，未体现的维度填 null。
+请以JSON格式返回：
+{{
+    "scores": {{
+        "demand_mining": 15,
+        "product_fit": null,
+        "objection_handling": null,
+        "communication": 16,
+        "professional_knowledge": null
+    }},
+    "strengths": ["本轮亮点，如无则留空"],
+    "improvements": ["本轮改进建议，如无则留空"],
+    "critical_errors": ["本轮重大错误，如无则留空"],
+    "positive_highlights": ["本轮检测到的具体亮点"],
+    "suggested_phrases": ["针对本轮的提升话术"],
+    "detailed_feedback": {{"demand_mining": "对已打分维度的简短点评"}}
+}}
+"""
+
+
+class IncrementalEvaluator:
+    """增量评估器：在客户回复的同时于后台逐轮评估理财经理的新发言
+
+    每轮只把本轮发言（及其回应的客户问题）发给模型，结果累积为各维度的运行状态，
+    最终报告直接由这些状态聚合得到，结束会话时无需再对整段对话发起一次评估。
+    """
+
+    def __init__(self, evaluator: SessionEvaluator, client_type: str, difficulty: int = 3):
+        self.evaluator = evaluator
+        self.client_type = client_type
+        self.difficulty = difficulty
+
+        self._lock = threading.Lock()
+        self._futures = []
+        self._submitted = 0  # 已提交评估的理财经理发言数
+        self._manager_messages = []
+
+        # 各维度运行状态：累计得分、体现该维度的轮数、最近一次点评
+        self._dimension_state = {
+            dimension: {"total": 0.0, "count": 0, "feedback": ""}
+            for dimension in evaluator.evaluation_criteria
+        }
+        self._turns_scored = 0
+        self._turns_failed = 0
+        self._notes = {field: [] for field in
+                       ("strengths", "improvements", "critical_errors", "positive_highlights", "suggested_phrases")}
+
+    def submit_turn(self, messages: List[Dict]):
+        """把尚未评估的理财经理发言提交到后台线程池；请求反馈的指令不是对客户的发言，不计入"""
+        manager_count = 0
+        for index, msg in enumerate(messages):
+            if msg['role'] != 'user' or self.evaluator.is_feedback_request(msg['content']):
+                continue
+            manager_count += 1
+            if manager_count <= self._submitted:
+                continue
+
+            previous = messages[index - 1] if index > 0 else None
+            client_text = ""
+            # 评估报告和开场欢迎语不是客户说的话
+            if (previous and previous['role'] == 'assistant' and not previous.get('is_feedback')
+                    and not previous.get('is_welcome')):
+                client_text = previous['content']
+
+            with self._lock:
+                self._manager_messages.append(msg['content'])
+            self._futures.append(submit_in_context(_TURN_EXECUTOR, self._score_turn, client_text, msg['content']))
+            self._submitted = manager_count
+
+    def _score_turn(self, client_text: str, manager_text: str):
+        """评估单轮发言并累加到各维度状态"""
+        try:
+            result = self._call_turn_evaluation(client_text, manager_text)
+        except Exception as e:
+            print(f"逐轮评估出错: {str(e)}")
+            with self._lock:
+                self._turns_failed += 1
+            return
+
+        detailed_feedback = result.get('detailed_feedback') if isinstance(result.get('detailed_feedback'), dict) else {}
+        with self._lock:
+            self._turns_scored += 1
+            for dimension, state in self._dimension_state.items():
+                score = coerce_number(result['scores'].get(dimension))
+                if score is not None:
+                    max_score = self.evaluator.evaluation_criteria[dimension]['max_score']
+                    state['total'] += max(0, min(max_score, score))
+                    state['count'] += 1
+                feedback = detailed_feedback.get(dimension)
+                if feedback and isinstance(feedback, str):
+                    state['feedback'] = feedback
+            for field, items in self._notes.items():
+                for item in self.evaluator._string_list(result.get(field)):
+                    if item and item not in items:
+                        items.append(item)
+
+    def _call_turn_evaluation(self, client_text: str, manager_text: str) -> Dict:
+        """请求模型评估单轮发言，返回本轮体现的各维度得分"""
+        # 固定前缀在前，本轮内容在后，便于服务端前缀缓存命中
+        turn_prompt = _turn_prompt_prefix(self.evaluator) + f"""
+## 本轮评估
+客户类型：{self.client_type}，难度级别：{self.difficulty}/5。
+{self.evaluator._get_evaluation_focus(self.client_type, self.difficulty)}
+
+客户上一句：{client_text or "（对话开始）"}
+理财经理本轮发言：{manager_text}
+"""
+        result_text = self.evaluator.backend.call(
+            messages=[{"role": "user", "content": turn_prompt}],
+            model="qwen-turbo",
+            temperature=0.3,
+            max_tokens=600,
+            **self.evaluator.json_call_kwargs
+        )
+        with timed("evaluation_parse_seconds", kind="turn"):
+            result = extract_json_object(result_text)
+        if result is None:
+            raise ValueError("未找到JSON结果")
+        if not isinstance(result.get('scores'), dict):
+            raise ValueError("缺少 scores 字段")
+        return result
+
+    def report(self, timeout: float = 30.0) -> Dict:
+        """聚合各维度运行状态，生成与 comprehensive_evaluation 相同格式的评估结果"""
+        wait(self._futures, timeout=timeout)
+
+        with self._lock:
+            manager_messages = list(self._manager_messages)
+            # 本地规则评分只算一次：既用于回退，也用于补齐没有体现的维度
+            rule_results = self.evaluator.rule_scorer.score_dimensions(manager_messages, self.client_type)
+            fallback = self.evaluator.get_balanced_evaluation(self.difficulty, self.client_type, manager_messages,
+                                                              dimensions=rule_results)
+            if self._turns_scored == 0:
+                # 没有任何一轮评估成功时无状态可聚合
+                return fallback
+
+            results = {}
+            rule_dimensions = []
+            for dimension, state in self._dimension_state.items():
+                if state['count']:
+                    score = round(state['total'] / state['count'])
+                    feedback = state['feedback'] or f"共{state['count']}轮体现该维度，平均{score}分"
+                    results[dimension] = {"score": score, "feedback": feedback}
+                else:
+                    # 没有一轮体现该维度，模型没有给出评分，按全部发言的本地规则评分计，并记入 rule_dimensions
+                    results[dimension] = rule_results[dimension]
+                    rule_dimensions.append(dimension)
+
+            evaluation_data = self.evaluator._merge_dimension_results(results, fallback)
+            evaluation_data['strengths'] = self._notes['strengths'][:4] or fallback['strengths']
+            evaluation_data['improvements'] = self._notes['improvements'][:4] or fallback['improvements']
+            evaluation_data['critical_errors'] = list(self._notes['critical_errors'])
+            evaluation_data['positive_highlights'] = self._notes['positive_highlights'][:5]
+            evaluation_data['suggested_phrases'] = self._notes['suggested_phrases'][:4]
+            if rule_dimensions:
+                evaluation_data['rule_dimensions'] = rule_dimensions
+
+        # 本地关键词调整只依赖文本，成本很低，报告时按全部发言计算一次
+        positive_score = self.evaluator._detect_positive_indicators(manager_messages, self.client_type)
+        mediocrity_score = self.evaluator._detect_mediocrity(manager_messages)
+        evaluation_data = self.evaluator._apply_positive_adjustment(evaluation_data, positive_score)
+        evaluation_data = self.evaluator._apply_mediocrity_adjustment(evaluation_data, mediocrity_score)
+        evaluation_data = self.evaluator._apply_difficulty_adjustment(evaluation_data, self.difficulty,
+                                                                      self.client_type)
+        return evaluation_data
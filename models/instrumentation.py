@@ -0,0 +1,85 @@
+import time
+from typing import List, Dict, Iterator
+
+from models.context_manager import estimate_tokens
+from models.llm_backend import LLMBackend, LLMError
+from utils.metrics import count, observe
+
+
+class InstrumentedBackend(LLMBackend):
+    """记录每次 LLM 调用的耗时、首字延迟和 token 数
+
+    包在请求管线最外层，耗时即调用方实际等待的时间（含排队、重试和对冲）；
+    token 数按 estimate_tokens 估算，不依赖服务商是否返回用量。
+    """
+
+    name = "instrumented"
+
+    def __init__(self, backend: LLMBackend):
+        self.backend = backend
+
+    @property
+    def supports_json_mode(self) -> bool:
+        return self.backend.supports_json_mode
+
+    @staticmethod
+    def _input_tokens(messages: List[Dict]) -> int:
+        return sum(estimate_tokens(msg.get('content') or "") for msg in messages)
+
+    def _record(self, model: str, mode: str, start: float, messages: List[Dict], output: str, outcome: str):
+        observe("llm_seconds", time.perf_counter() - start, model=model, mode=mode)
+        count("llm_calls", model=model, mode=mode, outcome=outcome)
+        count("llm_input_tokens", self._input_tokens(messages), model=model)
+        count("llm_output_tokens", estimate_tokens(output), model=model)
+
+    def call(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+             **kwargs) -> str:
+        start = time.perf_counter()
+        try:
+            result = self.backend.call(messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs)
+        except LLMError:
+            self._record(model, "call", start, messages, "", "error")
+            raise
+        self._record(model, "call", start, messages, result, "ok")
+        return result
+
+    def stream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+               **kwargs) -> Iterator[str]:
+        start = time.perf_counter()
+        deltas = []
+        outcome = "cancelled"  # 调用方中途停止读取
+        try:
+            for delta in self.backend.stream(messages, model, temperature=temperature, max_tokens=max_tokens,
+                                             **kwargs):
+                if not deltas:
+                    observe("llm_ttft_seconds", time.perf_counter() - start, model=model)
+                deltas.append(delta)
+                yield delta
+            outcome = "ok"
+        except LLMError:
+            outcome = "error"
+            raise
+        finally:
+            self._record(model, "stream", start, messages, "".join(deltas), outcome)
+
+    async def acall(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                    **kwargs) -> str:
+        return await self.backend.acall(messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs)
+
+    async def astream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                      **kwargs):
+        async for delta in self.backend.astream(messages, model, temperature=temperature, max_tokens=max_tokens,
+                                                **kwargs):
+            yield delta
+
+    def stats(self) -> Dict:
+        """沿 backend 链合并各层的统计（请求管线的排队数、容错层的重试/对冲/熔断状态）"""
+        merged = {}
+        layer = self.backend
+        while layer is not None:
+            stats = getattr(layer, "stats", None)
+            if stats:
+                for key, value in stats().items():
+                    merged.setdefault(key, value)  # 同名字段以外层为准
+            layer = getattr(layer, "backend", None)
+        return merged
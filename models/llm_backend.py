@@ -0,0 +1,390 @@
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import random
+import time
+from typing import List, Dict, Iterator, AsyncIterator
+
+from config import Config
+
+
+class LLMError(Exception):
+    """LLM 调用失败（非200状态码、网络错误等）"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMBackend:
+    """LLM 后端基类，FinancialCoachAgent 与 SessionEvaluator 统一通过它调用模型"""
+
+    name = "base"
+    supports_json_mode = False  # 是否支持 response_format={"type": "json_object"}
+
+    def call(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+             **kwargs) -> str:
+        """一次性返回完整回复，失败时抛出 LLMError"""
+        raise NotImplementedError
+
+    def stream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+               **kwargs) -> Iterator[str]:
+        """逐段产出增量文本；默认退化为一次性返回"""
+        yield self.call(messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs)
+
+    async def acall(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                    **kwargs) -> str:
+        """异步调用；默认在线程池中执行同步实现，子类可提供原生异步实现"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(
+            self.call, messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs))
+
+    async def astream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                      **kwargs) -> AsyncIterator[str]:
+        """异步逐段产出增量文本；默认退化为一次性返回"""
+        yield await self.acall(messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs)
+
+
+class DashScopeBackend(LLMBackend):
+    """通义千问 DashScope 原生接口"""
+
+    name = "dashscope"
+    supports_json_mode = True
+
+    def __init__(self, api_key: str = None):
+        # 按调用传入 api_key，避免修改 dashscope 的全局配置
+        self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+        if not self.api_key:
+            raise LLMError("未配置 DashScope API Key，请设置环境变量 DASHSCOPE_API_KEY"
+                           "（本地调试可设置 COACH_LLM_BACKEND=fake 使用假后端）")
+
+    def call(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+             **kwargs) -> str:
+        from dashscope import Generation
+
+        response = Generation.call(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            result_format='message',
+            api_key=self.api_key,
+            **kwargs
+        )
+        if response.status_code != 200:
+            raise LLMError(f"Qwen API错误: {response.status_code}", status_code=response.status_code)
+        return response.output.choices[0].message.content
+
+    def stream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+               **kwargs) -> Iterator[str]:
+        from dashscope import Generation
+
+        responses = Generation.call(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            result_format='message',
+            api_key=self.api_key,
+            stream=True,
+            incremental_output=True,  # 每次只返回新增部分
+            **kwargs
+        )
+        for response in responses:
+            if response.status_code != 200:
+                raise LLMError(f"Qwen API错误: {response.status_code}", status_code=response.status_code)
+            delta = response.output.choices[0].message.content
+            if delta:
+                yield delta
+
+    async def acall(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                    **kwargs) -> str:
+        from dashscope import AioGeneration
+
+        response = await AioGeneration.call(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            result_format='message',
+            api_key=self.api_key,
+            **kwargs
+        )
+        if response.status_code != 200:
+            raise LLMError(f"Qwen API错误: {response.status_code}", status_code=response.status_code)
+        return response.output.choices[0].message.content
+
+    async def astream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                      **kwargs) -> AsyncIterator[str]:
+        from dashscope import AioGeneration
+
+        responses = await AioGeneration.call(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            result_format='message',
+            api_key=self.api_key,
+            stream=True,
+            incremental_output=True,
+            **kwargs
+        )
+        async for response in responses:
+            if response.status_code != 200:
+                raise LLMError(f"Qwen API错误: {response.status_code}", status_code=response.status_code)
+            delta = response.output.choices[0].message.content
+            if delta:
+                yield delta
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """OpenAI 兼容的 HTTP 接口（DashScope compatible-mode、vLLM、本地替身服务等）"""
+
+    name = "openai"
+    supports_json_mode = True
+
+    def __init__(self, base_url: str = None, api_key: str = None, model: str = None, timeout: float = 60.0):
+        from openai import OpenAI, DefaultHttpxClient
+
+        self.base_url = base_url or Config.OPENAI_BASE_URL
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY") or os.getenv("DASHSCOPE_API_KEY", "sk-placeholder")
+        self.timeout = timeout
+        self.client = OpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            timeout=timeout,
+            http_client=DefaultHttpxClient(limits=self._pool_limits())
+        )
+        self._async_client = None  # 异步客户端绑定事件循环，首次异步调用时在循环内创建
+        # 非空时覆盖调用方请求的模型名，便于对接只部署了单个模型的服务
+        self.model = model or Config.OPENAI_MODEL
+
+    @staticmethod
+    def _pool_limits():
+        """长连接池大小，与全局并发上限匹配，避免每次请求重新握手"""
+        import httpx
+
+        return httpx.Limits(max_connections=Config.LLM_MAX_CONNECTIONS,
+                            max_keepalive_connections=Config.LLM_MAX_CONNECTIONS,
+                            keepalive_expiry=60)
+
+    def _get_async_client(self):
+        if self._async_client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            self._async_client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                timeout=self.timeout,
+                http_client=DefaultAsyncHttpxClient(limits=self._pool_limits())
+            )
+        return self._async_client
+
+    def call(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+             **kwargs) -> str:
+        import openai
+
+        try:
+            completion = self.client.chat.completions.create(
+                model=self.model or model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+        except openai.APIStatusError as e:
+            raise LLMError(str(e), status_code=e.status_code) from e
+        except openai.OpenAIError as e:
+            raise LLMError(str(e)) from e
+        return completion.choices[0].message.content or ""
+
+    def stream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+               **kwargs) -> Iterator[str]:
+        import openai
+
+        try:
+            chunks = self.client.chat.completions.create(
+                model=self.model or model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **kwargs
+            )
+            for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except openai.APIStatusError as e:
+            raise LLMError(str(e), status_code=e.status_code) from e
+        except openai.OpenAIError as e:
+            raise LLMError(str(e)) from e
+
+    async def acall(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                    **kwargs) -> str:
+        import openai
+
+        try:
+            completion = await self._get_async_client().chat.completions.create(
+                model=self.model or model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+        except openai.APIStatusError as e:
+            raise LLMError(str(e), status_code=e.status_code) from e
+        except openai.OpenAIError as e:
+            raise LLMError(str(e)) from e
+        return completion.choices[0].message.content or ""
+
+    async def astream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                      **kwargs) -> AsyncIterator[str]:
+        import openai
+
+        try:
+            chunks = await self._get_async_client().chat.completions.create(
+                model=self.model or model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **kwargs
+            )
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except openai.APIStatusError as e:
+            raise LLMError(str(e), status_code=e.status_code) from e
+        except openai.OpenAIError as e:
+            raise LLMError(str(e)) from e
+
+
+class FakeBackend(LLMBackend):
+    """本地确定性假后端，可配置延迟和抖动，用于离线测试、压测和基准测试
+
+    同样的输入总是得到同样的输出和同样的延迟，便于把应用自身开销与模型延迟分开度量。
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, delta_interval: float = 0.0,
+                 chunk_size: int = 4, seed: int = 0, reply: str = None):
+        self.latency = latency  # 首字延迟（秒）
+        self.jitter = jitter  # 延迟抖动幅度（秒），在 ±jitter 内确定性取值
+        self.delta_interval = delta_interval  # 流式输出时每段之间的间隔（秒）
+        self.chunk_size = chunk_size
+        self.seed = seed
+        self.reply = reply
+
+    def _rng(self, messages: List[Dict], model: str) -> random.Random:
+        """根据请求内容派生随机数发生器，保证结果可复现"""
+        digest = hashlib.sha256(
+            json.dumps([model, messages], ensure_ascii=False, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        return random.Random(f"{self.seed}:{digest}")
+
+    def _delay(self, rng: random.Random) -> float:
+        return max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter))
+
+    def _build_reply(self, messages: List[Dict], rng: random.Random) -> str:
+        if self.reply is not None:
+            return self.reply
+
+        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        if "JSON" in last_user:
+            if '"scores"' not in last_user:
+                return json.dumps(self._fake_dimension_evaluation(rng), ensure_ascii=False)
+            return json.dumps(self._fake_evaluation(rng), ensure_ascii=False)
+
+        follow_ups = [
+            "这个产品风险大吗？",
+            "急用钱的时候能取出来吗？",
+            "收益比定期存款高多少？",
+            "能不能说得再简单一点？",
+            "手续费是怎么收的？"
+        ]
+        return (f"嗯，你说的「{last_user.strip()[:20]}」我大概明白了。"
+                f"不过我还是有点担心，{rng.choice(follow_ups)}")
+
+    @staticmethod
+    def _fake_evaluation(rng: random.Random) -> Dict:
+        """生成结构完整的模拟评估结果"""
+        dimensions = ["demand_mining", "product_fit", "objection_handling", "communication",
+                      "professional_knowledge"]
+        scores = {dimension: rng.randint(10, 18) for dimension in dimensions}
+        return {
+            "overall_score": sum(scores.values()),
+            "scores": scores,
+            "strengths": ["能够回应客户的主要关切", "沟通态度积极"],
+            "improvements": ["可以更深入挖掘客户需求", "推荐产品时补充数据支撑", "注意确认客户理解程度"],
+            "critical_errors": [],
+            "positive_highlights": ["主动了解客户情况"],
+            "suggested_phrases": ["您能具体说说这笔钱的使用计划吗？"],
+            "detailed_feedback": {dimension: "模拟评估：表现基本达标，仍有提升空间" for dimension in dimensions},
+            "performance_level": "良好",
+            "encouragement": "继续保持，多练习会更好！"
+        }
+
+    @staticmethod
+    def _fake_dimension_evaluation(rng: random.Random) -> Dict:
+        """生成单维度的模拟评估结果"""
+        return {
+            "score": rng.randint(10, 18),
+            "strengths": ["能够回应客户的主要关切"],
+            "improvements": ["可以更深入挖掘客户需求"],
+            "critical_errors": [],
+            "positive_highlights": ["主动了解客户情况"],
+            "suggested_phrases": ["您能具体说说这笔钱的使用计划吗？"],
+            "feedback": "模拟评估：表现基本达标，仍有提升空间"
+        }
+
+    def call(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+             **kwargs) -> str:
+        rng = self._rng(messages, model)
+        time.sleep(self._delay(rng))
+        return self._build_reply(messages, rng)
+
+    def stream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+               **kwargs) -> Iterator[str]:
+        rng = self._rng(messages, model)
+        time.sleep(self._delay(rng))
+        reply = self._build_reply(messages, rng)
+        for start in range(0, len(reply), self.chunk_size):
+            if start and self.delta_interval:
+                time.sleep(self.delta_interval)
+            yield reply[start:start + self.chunk_size]
+
+    async def acall(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                    **kwargs) -> str:
+        rng = self._rng(messages, model)
+        await asyncio.sleep(self._delay(rng))
+        return self._build_reply(messages, rng)
+
+    async def astream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                      **kwargs) -> AsyncIterator[str]:
+        rng = self._rng(messages, model)
+        await asyncio.sleep(self._delay(rng))
+        reply = self._build_reply(messages, rng)
+        for start in range(0, len(reply), self.chunk_size):
+            if start and self.delta_interval:
+                await asyncio.sleep(self.delta_interval)
+            yield reply[start:start + self.chunk_size]
+
+
+def create_backend(name: str = None) -> LLMBackend:
+    """根据名称（默认读取 Config.LLM_BACKEND）创建后端实例"""
+    name = (name or Config.LLM_BACKEND).lower()
+
+    if name == "dashscope":
+        return DashScopeBackend()
+    if name == "openai":
+        return OpenAICompatibleBackend()
+    if name in ("fake", "stub"):
+        return FakeBackend(
+            latency=Config.FAKE_LATENCY,
+            jitter=Config.FAKE_JITTER,
+            delta_interval=Config.FAKE_DELTA_INTERVAL
+        )
+    raise ValueError(f"未知的LLM后端: {name}")
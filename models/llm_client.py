@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import aclosing, contextmanager
+from typing import List, Dict, Iterator
+
+from config import Config
+from models.instrumentation import InstrumentedBackend
+from models.llm_backend import LLMBackend, LLMError, create_backend
+from models.resilience import CircuitBreaker, ResilientBackend
+from utils.metrics import observe
+
+_current_user = contextvars.ContextVar("llm_user", default="anonymous")
+_STREAM_END = object()
+
+
+@contextmanager
+def llm_user(user_id: str):
+    """标记当前上下文中发起的 LLM 请求属于哪个学员，用于按学员公平调度"""
+    token = _current_user.set(user_id or "anonymous")
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+
+def submit_in_context(executor, fn, *args, **kwargs) -> Future:
+    """向线程池提交任务并带上当前上下文，工作线程里发起的请求仍归属原学员"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class LLMOverloadedError(LLMError):
+    """请求排队已满且等待超时"""
+
+
+class AsyncLLMClient(LLMBackend):
+    """基于 asyncio 的共享 LLM 请求管线
+
+    所有请求都在一个后台事件循环里复用连接池执行，调用线程只等待结果：
+    - 全局并发上限：同时在途的请求不超过 max_concurrency，避免超出服务商的 QPS 限制
+    - 按学员公平：排队请求按学员分组轮转出队，一个学员的并发评估不会挤占其他人的对话
+    - 有界队列：在途加排队达到 max_queue 时调用线程阻塞等待（背压），超时抛出 LLMOverloadedError
+    对外仍是 LLMBackend 接口，FinancialCoachAgent 和 SessionEvaluator 无需区分。
+    """
+
+    name = "async"
+
+    def __init__(self, backend: LLMBackend, max_concurrency: int = 32, max_queue: int = 256,
+                 queue_timeout: float = 30.0):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_queue)
+
+        # 以下状态只在事件循环线程中修改
+        self._queues = OrderedDict()  # 学员 -> 待执行请求
+        self._active = 0
+        self._queued = 0
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True)
+        self._thread.start()
+
+    @property
+    def supports_json_mode(self) -> bool:
+        return self.backend.supports_json_mode
+
+    def submit(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+               **kwargs) -> Future:
+        """提交一次完整调用，立即返回 Future"""
+        future = Future()
+        self._enqueue(lambda: self.backend.acall(messages, model, temperature=temperature,
+                                                 max_tokens=max_tokens, **kwargs), future)
+        return future
+
+    def call(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+             **kwargs) -> str:
+        return self.submit(messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs).result()
+
+    def stream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+               **kwargs) -> Iterator[str]:
+        chunks = queue.Queue()
+        closed = threading.Event()
+
+        async def pump():
+            deltas = self.backend.astream(messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs)
+            async with aclosing(deltas):
+                async for delta in deltas:
+                    if closed.is_set():  # 调用方已不再读取
+                        break
+                    chunks.put(delta)
+
+        # 入队在调用时立即完成，归属的学员以调用方的上下文为准
+        future = Future()
+        self._enqueue(pump, future)
+        future.add_done_callback(lambda _: chunks.put(_STREAM_END))
+        return self._iterate_stream(chunks, future, closed)
+
+    @staticmethod
+    def _iterate_stream(chunks: queue.Queue, future: Future, closed: threading.Event) -> Iterator[str]:
+        try:
+            while True:
+                delta = chunks.get()
+                if delta is _STREAM_END:
+                    break
+                yield delta
+            future.result()  # 流式过程中的异常抛给调用方
+        finally:
+            closed.set()
+            future.cancel()  # 尚未开始的请求直接出队作废
+
+    def _enqueue(self, job, future: Future):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise LLMOverloadedError("LLM请求排队已满，请稍后重试", status_code=429)
+        future.add_done_callback(lambda _: self._slots.release())
+        # 带上调用方上下文，出队时把排队时间记到发起请求的那次运行上
+        self._loop.call_soon_threadsafe(self._push, _current_user.get(), job, future,
+                                        contextvars.copy_context(), time.monotonic())
+
+    def _push(self, user: str, job, future: Future, context: contextvars.Context, enqueued_at: float):
+        self._queues.setdefault(user, deque()).append((job, future, context, enqueued_at))
+        self._queued += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """在并发上限内按学员轮转启动排队中的请求"""
+        while self._active < self.max_concurrency and self._queues:
+            user, pending = self._queues.popitem(last=False)
+            job, future, context, enqueued_at = pending.popleft()
+            self._queued -= 1
+            if pending:
+                self._queues[user] = pending  # 排到队尾，下一个名额先让给其他学员
+            if not future.set_running_or_notify_cancel():
+                continue
+            context.run(observe, "llm_queue_seconds", time.monotonic() - enqueued_at)
+            self._active += 1
+            self._loop.create_task(self._run(job, future))
+
+    async def _run(self, job, future: Future):
+        try:
+            future.set_result(await job())
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            self._active -= 1
+            self._dispatch()
+
+    def try_acquire_slot(self) -> bool:
+        """为正在执行的请求额外占一个并发名额（如对冲请求），只能在事件循环线程中调用
+
+        有学员在排队时不占用，名额优先让给排队中的请求。
+        """
+        if self._active >= self.max_concurrency or self._queued:
+            return False
+        self._active += 1
+        return True
+
+    def release_slot(self):
+        """归还 try_acquire_slot 占用的名额，只能在事件循环线程中调用"""
+        self._active -= 1
+        self._dispatch()
+
+    def stats(self) -> Dict:
+        """当前在途与排队的请求数"""
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue
+        }
+
+
+def create_client(name: str = None) -> LLMBackend:
+    """创建后端，并按配置包上容错层（Config.LLM_RESILIENCE）、异步请求管线（Config.ASYNC_LLM）
+    和调用指标（Config.METRICS）"""
+    backend = create_backend(name)
+    resilient = None
+    if Config.LLM_RESILIENCE:
+        backend = resilient = ResilientBackend(
+            backend,
+            timeout=Config.LLM_TIMEOUT,
+            timeout_per_token=Config.LLM_TIMEOUT_PER_TOKEN,
+            deadline=Config.LLM_DEADLINE,
+            max_retries=Config.LLM_MAX_RETRIES,
+            backoff_base=Config.LLM_BACKOFF_BASE,
+            backoff_max=Config.LLM_BACKOFF_MAX,
+            hedge=Config.LLM_HEDGE,
+            hedge_delay=Config.LLM_HEDGE_DELAY,
+            breaker=CircuitBreaker(Config.LLM_BREAKER_THRESHOLD, Config.LLM_BREAKER_RESET)
+        )
+    if Config.ASYNC_LLM:
+        backend = AsyncLLMClient(
+            backend,
+            max_concurrency=Config.LLM_MAX_CONCURRENCY,
+            max_queue=Config.LLM_MAX_QUEUE,
+            queue_timeout=Config.LLM_QUEUE_TIMEOUT
+        )
+        if resilient is not None:
+            resilient.hedge_limiter = backend  # 对冲请求同样计入全局并发上限
+    return InstrumentedBackend(backend) if Config.METRICS else backend
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> LLMBackend:
+    """进程内共享的默认 LLM 客户端，全局并发上限对所有调用方生效"""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = create_client()
+        return _default_client
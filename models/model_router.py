@@ -0,0 +1,45 @@
+from typing import List
+
+from models.context_manager import estimate_tokens
+from models.resilience import LatencyTracker
+
+
+class ModelRouter:
+    """客户回复的模型路由
+
+    tiers 按从强到快排列。先按客户类型的难度和练习难度确定起始档位，简短的寒暄类发言再降一档；
+    所选档位近期的延迟（P90）超出预算时顺延到更快的档位。返回的候选列表中，首选之后的模型
+    即单次调用失败时的回退顺序。
+
+    延迟样本由容错层（ResilientBackend）写入共享的 LatencyTracker，关闭 Config.LLM_RESILIENCE 时
+    没有样本，所有档位都视为可用，路由只按难度和发言长度选择档位。
+    """
+
+    # 客户类型难度 -> 起始档位（0 为最强）
+    CLIENT_LEVEL_TIERS = {"困难": 0, "中等": 1, "简单但需要耐心": 1, "简单": 2}
+
+    def __init__(self, tiers: List[str], latency: LatencyTracker, latency_budget: float = 2.5,
+                 small_talk_tokens: int = 12):
+        self.tiers = tiers
+        self.latency = latency
+        self.latency_budget = latency_budget  # 流式为首字延迟，非流式为整次调用耗时
+        self.small_talk_tokens = small_talk_tokens
+
+    def route(self, client_level: str, difficulty: int, user_input: str, stream: bool = False) -> List[str]:
+        """返回按优先级排列的候选模型"""
+        tier = self.CLIENT_LEVEL_TIERS.get(client_level, 1)
+        if difficulty >= 4:
+            tier -= 1
+        elif difficulty <= 2:
+            tier += 1
+        if estimate_tokens(user_input) <= self.small_talk_tokens:
+            tier += 1
+        tier = max(0, min(len(self.tiers) - 1, tier))
+
+        # 近期延迟超预算的档位跳过；没有样本的档位视为可用
+        for index in range(tier, len(self.tiers)):
+            model = self.tiers[index]
+            p90 = self.latency.percentile(f"{model}/ttft" if stream else model, 0.9)
+            if p90 is None or p90 <= self.latency_budget:
+                return self.tiers[index:]
+        return self.tiers[-1:]
@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from models.coach_agent import FinancialCoachAgent
+from models.context_manager import estimate_tokens
+from models.llm_client import submit_in_context
+
+# 预取任务只是等待 LLM 返回，几个线程即可
+_PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+class OpeningPrefetcher:
+    """会话开始时在后台预生成客户的开场提问
+
+    客户按自己的典型问题先开口：学员阅读欢迎语时开场提问已在生成，完成后直接显示，首轮不必等待模型；
+    学员在开场提问生成之前就先开口，或会话在显示之前结束时，丢弃预生成结果并计入浪费的 token。
+    """
+
+    def __init__(self, agent: FinancialCoachAgent):
+        self.agent = agent
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+        self.wasted_tokens = 0
+
+    def start(self, client_type: str, difficulty: int) -> Future:
+        """提交预取任务"""
+        with self._lock:
+            self.started += 1
+        return submit_in_context(_PREFETCH_EXECUTOR, self._fetch, client_type, difficulty)
+
+    def _fetch(self, client_type: str, difficulty: int) -> Dict:
+        """生成开场提问，同时估算本次调用的 token 消耗"""
+        messages = self.agent.get_opening_messages(client_type, difficulty)
+        text = self.agent.get_opening(client_type, difficulty, messages=messages)
+        tokens = sum(estimate_tokens(msg['content']) for msg in messages) + estimate_tokens(text)
+        return {"text": text, "tokens": tokens}
+
+    def take(self, future: Future) -> Optional[str]:
+        """取用已完成的预取结果；预取失败时计入丢弃并返回 None"""
+        if future.cancelled() or future.exception() is not None:
+            if not future.cancelled():
+                print(f"开场提问预取失败: {str(future.exception())}")
+            with self._lock:
+                self.discarded += 1
+            return None
+        with self._lock:
+            self.used += 1
+        return future.result()['text']
+
+    def discard(self, future: Future):
+        """丢弃未使用的预取结果，尚未开始的任务直接取消"""
+        if future.cancel():
+            with self._lock:
+                self.discarded += 1
+            return
+        future.add_done_callback(self._count_wasted)
+
+    def _count_wasted(self, future: Future):
+        with self._lock:
+            self.discarded += 1
+            if future.exception() is None:
+                self.wasted_tokens += future.result()['tokens']
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "started": self.started,
+                "used": self.used,
+                "discarded": self.discarded,
+                "wasted_tokens": self.wasted_tokens
+            }
@@ -0,0 +1,394 @@
+import asyncio
+import contextvars
+import queue
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from contextlib import aclosing, contextmanager
+from typing import List, Dict, Iterator, AsyncIterator, Optional
+
+from models.llm_backend import LLMBackend, LLMError
+
+# 可重试的状态码：限流、超时和服务端错误；其余 4xx 属于请求本身的问题，重试无意义
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_STREAM_END = object()
+
+
+def _run_in_thread(fn) -> Future:
+    """在守护线程中执行同步调用并带上当前上下文；调用方超时后不再等待，卡住的连接由该线程自行结束"""
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="llm-sync", daemon=True).start()
+    return future
+
+
+class CircuitOpenError(LLMError):
+    """熔断期间直接拒绝请求"""
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后熔断，冷却期内直接失败；冷却期过后放行一个探测请求，成功即恢复"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe = None  # 进行中的探测请求的标记
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if self._probe is not None or time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> Optional[object]:
+        """熔断中时抛出 CircuitOpenError；放行探测请求时返回探测标记"""
+        with self._lock:
+            if self._opened_at is None:
+                return None
+            if self._probe is not None or time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError("Qwen服务暂时不可用（已熔断）", status_code=503)
+            self._probe = object()
+            return self._probe
+
+    def release_probe(self, probe: Optional[object]):
+        """探测请求结束但没有记录结果（被取消、调用方中途关闭流、程序错误）时归还探测名额"""
+        with self._lock:
+            if probe is not None and self._probe is probe:
+                self._probe = None
+
+    @contextmanager
+    def guard(self):
+        """包住一次尝试：进入时检查熔断，退出时无论以何种方式结束都不会留下悬空的探测"""
+        probe = self.before_call()
+        try:
+            yield
+        finally:
+            self.release_probe(probe)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe = None
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """按键（通常是模型名）记录最近的调用耗时，用于计算对冲延迟和模型路由
+
+    只统计 max_age 秒内的样本：因延迟过高被路由跳过的模型不再产生新样本，
+    旧样本过期后视为样本不足，该模型重新参与路由，由新的调用决定是否继续跳过。
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20, max_age: float = 300.0):
+        self.min_samples = min_samples
+        self.max_age = max_age
+        self._samples = defaultdict(lambda: deque(maxlen=window))  # 键 -> (记录时间, 耗时)
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            self._samples[key].append((time.monotonic(), seconds))
+
+    def percentile(self, key: str, q: float) -> Optional[float]:
+        """样本不足时返回 None"""
+        oldest = time.monotonic() - self.max_age
+        with self._lock:
+            samples = sorted(seconds for recorded_at, seconds in self._samples.get(key, ())
+                             if recorded_at >= oldest)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+_default_latency = LatencyTracker()
+
+
+def get_default_latency_tracker() -> LatencyTracker:
+    """进程内共享的延迟统计，容错层写入、模型路由读取"""
+    return _default_latency
+
+
+class ResilientBackend(LLMBackend):
+    """为 LLM 后端加上超时、重试、对冲请求和熔断
+
+    - 每次尝试有超时（按 max_tokens 放宽），整次调用有总截止时间
+    - 可重试的错误（超时、网络错误、429/5xx）按带抖动的指数退避重试
+    - 非流式调用超过该模型近期 P95 耗时仍未返回时，再并发发起一个相同请求，取先返回者；
+      设置了 hedge_limiter 时对冲请求要另占一个全局并发名额，名额已满则不对冲
+    - 连续失败时熔断，服务恢复前直接失败，不再占用排队名额
+    同步的 call/stream 在守护线程中执行后端调用，超时和截止时间同样生效；对冲只在异步实现（acall）中进行。
+    """
+
+    name = "resilient"
+
+    def __init__(self, backend: LLMBackend, timeout: float = 10.0, timeout_per_token: float = 0.05,
+                 deadline: float = 90.0, max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 4.0,
+                 hedge: bool = True, hedge_delay: float = 3.0, breaker: CircuitBreaker = None,
+                 latency: LatencyTracker = None):
+        self.backend = backend
+        self.timeout = timeout
+        self.timeout_per_token = timeout_per_token
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay  # 该模型样本不足时使用的对冲延迟
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = latency or get_default_latency_tracker()
+        self.hedge_limiter = None  # 提供 try_acquire_slot/release_slot 的全局并发限制（AsyncLLMClient）
+        self.retries = 0
+        self.hedged_requests = 0
+
+    @property
+    def supports_json_mode(self) -> bool:
+        return self.backend.supports_json_mode
+
+    @staticmethod
+    def is_retryable(error: LLMError) -> bool:
+        if isinstance(error, CircuitOpenError):
+            return False
+        return error.status_code is None or error.status_code in RETRYABLE_STATUS
+
+    @staticmethod
+    def _as_llm_error(error: Exception, timeout: float) -> Optional[LLMError]:
+        """把超时和网络异常统一为 LLMError；其他异常（程序错误等）返回 None，原样抛出"""
+        if isinstance(error, LLMError):
+            return error
+        if isinstance(error, TimeoutError):
+            return LLMError(f"LLM调用超时（超过{timeout:.1f}秒）")
+        if isinstance(error, OSError):
+            return LLMError(str(error))
+        return None
+
+    def _attempt_timeout(self, max_tokens: int) -> float:
+        return self.timeout + max_tokens * self.timeout_per_token
+
+    def _retry_delay(self, attempt: int, deadline: float) -> Optional[float]:
+        """第 attempt 次重试前的退避时间（full jitter）；超出重试次数或截止时间时返回 None"""
+        if attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if time.monotonic() + delay >= deadline:
+            return None
+        self.retries += 1
+        return delay
+
+    def _hedge_after(self, model: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        p95 = self.latency.percentile(model, 0.95)
+        return max(0.2, p95) if p95 is not None else self.hedge_delay
+
+    def _on_error(self, error: Exception, timeout: float) -> LLMError:
+        """记录熔断状态；不可重试的错误直接抛出"""
+        llm_error = self._as_llm_error(error, timeout)
+        if llm_error is None:
+            raise error
+        if not self.is_retryable(llm_error):
+            if not isinstance(llm_error, CircuitOpenError):
+                self.breaker.record_success()  # 服务有正常应答，只是请求本身不合法
+            raise llm_error from error
+        self.breaker.record_failure()
+        return llm_error
+
+    async def acall(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                    **kwargs) -> str:
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            with self.breaker.guard():
+                timeout = min(self._attempt_timeout(max_tokens), max(0.0, deadline - time.monotonic()))
+                try:
+                    result = await self._hedged(
+                        lambda: self.backend.acall(messages, model, temperature=temperature, max_tokens=max_tokens,
+                                                   **kwargs),
+                        model, timeout)
+                except Exception as e:
+                    error = self._on_error(e, timeout)
+                    delay = self._retry_delay(attempt, deadline)
+                    if delay is None:
+                        raise error from e
+                else:
+                    self.breaker.record_success()
+                    return result
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _hedged(self, factory, model: str, timeout: float):
+        """发起请求，超过对冲延迟仍未返回时再发一个，取先成功的结果"""
+        start = time.monotonic()
+        hedge_after = self._hedge_after(model)
+        hedged = hedge_after is None or hedge_after >= timeout
+        pending = {asyncio.ensure_future(factory())}
+        error = None
+        try:
+            while pending:
+                wait_until = start + (timeout if hedged else hedge_after)
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, wait_until - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.latency.record(model, time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+                if not done:
+                    if hedged:
+                        raise TimeoutError()
+                    hedged = True
+                    limiter = self.hedge_limiter
+                    if limiter is not None and not limiter.try_acquire_slot():
+                        continue  # 全局并发已满，继续等待原请求直到超时
+                    self.hedged_requests += 1
+                    hedge = asyncio.ensure_future(factory())
+                    if limiter is not None:
+                        hedge.add_done_callback(lambda _: limiter.release_slot())
+                    pending.add(hedge)
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def astream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+                      **kwargs) -> AsyncIterator[str]:
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            with self.breaker.guard():
+                start = time.monotonic()
+                started = False
+                deltas = self.backend.astream(messages, model, temperature=temperature, max_tokens=max_tokens,
+                                              **kwargs)
+                try:
+                    async with aclosing(deltas):
+                        while True:
+                            # 首字及相邻两段之间的等待都不超过单次超时
+                            try:
+                                delta = await asyncio.wait_for(anext(deltas), timeout=self.timeout)
+                            except StopAsyncIteration:
+                                break
+                            if not started:
+                                started = True
+                                self.latency.record(f"{model}/ttft", time.monotonic() - start)
+                            yield delta
+                except Exception as e:
+                    error = self._on_error(e, self.timeout)
+                    # 已经输出了部分内容，重试会让回复重复，只能失败
+                    delay = None if started else self._retry_delay(attempt, deadline)
+                    if delay is None:
+                        raise error from e
+                else:
+                    self.breaker.record_success()
+                    return
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def call(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+             **kwargs) -> str:
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            with self.breaker.guard():
+                start = time.monotonic()
+                timeout = min(self._attempt_timeout(max_tokens), max(0.0, deadline - start))
+                future = _run_in_thread(lambda: self.backend.call(messages, model, temperature=temperature,
+                                                                  max_tokens=max_tokens, **kwargs))
+                try:
+                    result = future.result(timeout=timeout)
+                except Exception as e:
+                    error = self._on_error(e, timeout)
+                    delay = self._retry_delay(attempt, deadline)
+                    if delay is None:
+                        raise error from e
+                else:
+                    self.breaker.record_success()
+                    self.latency.record(model, time.monotonic() - start)
+                    return result
+            attempt += 1
+            time.sleep(delay)
+
+    def stream(self, messages: List[Dict], model: str, temperature: float = 0.7, max_tokens: int = 500,
+               **kwargs) -> Iterator[str]:
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            with self.breaker.guard():
+                start = time.monotonic()
+                started = False
+                try:
+                    for delta in self._stream_in_thread(messages, model, temperature, max_tokens, **kwargs):
+                        if not started:
+                            started = True
+                            self.latency.record(f"{model}/ttft", time.monotonic() - start)
+                        yield delta
+                except Exception as e:
+                    error = self._on_error(e, self.timeout)
+                    delay = None if started else self._retry_delay(attempt, deadline)
+                    if delay is None:
+                        raise error from e
+                else:
+                    self.breaker.record_success()
+                    return
+            attempt += 1
+            time.sleep(delay)
+
+    def _stream_in_thread(self, messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                          **kwargs) -> Iterator[str]:
+        """在守护线程中读取同步流；首字及相邻两段之间的等待超过单次超时时抛出 TimeoutError"""
+        chunks = queue.Queue()
+        closed = threading.Event()
+
+        def pump():
+            for delta in self.backend.stream(messages, model, temperature=temperature, max_tokens=max_tokens,
+                                             **kwargs):
+                if closed.is_set():  # 调用方已不再读取
+                    break
+                chunks.put(delta)
+
+        future = _run_in_thread(pump)
+        future.add_done_callback(lambda _: chunks.put(_STREAM_END))
+        try:
+            while True:
+                try:
+                    delta = chunks.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError() from None
+                if delta is _STREAM_END:
+                    break
+                yield delta
+            future.result()  # 流式过程中的异常抛给调用方
+        finally:
+            closed.set()
+
+    def stats(self) -> Dict:
+        """重试、对冲次数与熔断状态"""
+        return {
+            "retries": self.retries,
+            "hedged_requests": self.hedged_requests,
+            "circuit": self.breaker.state
+        }
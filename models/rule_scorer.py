@@ -0,0 +1,175 @@
+import json
+import os
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    from models.evaluator import SessionEvaluator
+
+# 评估结果中 evaluation_source 的取值：完全由本地规则给出的评分
+RULE_SOURCE = "rules"
+
+
+class RuleScorer:
+    """基于关键词规则的本地评分器
+
+    复用 SessionEvaluator 的亮点指标、关键词和平庸特征：每个维度按命中的亮点指标给分，
+    再按客户类型加分、按平庸特征扣分。整个过程只扫描一遍理财经理的发言，几毫秒内给出
+    与 comprehensive_evaluation 相同格式的五维评估，不调用模型。
+    用于对话中的即时评分，以及模型不可用时的回退评估。
+    """
+
+    # 单个亮点指标命中几个不同关键词即视为充分体现
+    SATURATION_HITS = 2
+    # 维度得分区间：完全未体现时为及格线以下 FLOOR_OFFSET 分，全部体现时为满分以下 CEILING_OFFSET 分
+    FLOOR_OFFSET = 2
+    CEILING_OFFSET = 2
+    # 客户类型关键词 -> (加分短语分组, 加分维度)
+    CLIENT_BONUS = {"小白": ("friendly", "communication"), "蛮横": ("patience", "objection_handling")}
+    BONUS_POINTS = 2
+    # 平庸特征 -> (对应 mediocre_patterns 中的描述, [(扣分维度, 扣分)])
+    MEDIOCRITY_PENALTIES = {
+        "template": ("模板化回复", [("communication", 1)]),
+        "evasion": ("回避关键问题", [("objection_handling", 2)]),
+        "no_data": ("缺乏数据支撑", [("product_fit", 1), ("professional_knowledge", 1)]),
+        "theory": ("理论堆砌", [("communication", 1)])
+    }
+
+    def __init__(self, evaluator: "SessionEvaluator", calibration: Dict = None):
+        self.evaluator = evaluator
+        # 校准参数：{"overall" 或维度: {"slope": 斜率, "intercept": 截距}}，由 scripts/calibrate_rule_scorer.py 生成。
+        # 维度参数在 score_dimensions 中应用，补齐模型缺失维度的调用方拿到的也是校准后的得分；总分参数在 evaluate 中应用
+        self.calibration = calibration or {}
+
+    @staticmethod
+    def load_calibration(path: str) -> Dict:
+        """读取校准文件，文件不存在或格式不对时返回空字典（不校准）"""
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                calibration = json.load(f).get('calibration', {})
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"规则评分校准文件读取失败: {str(e)}")
+            return {}
+        return calibration if isinstance(calibration, dict) else {}
+
+    def detect_mediocrity(self, hits: Dict) -> List[str]:
+        """命中的平庸特征，判定条件与 SessionEvaluator._detect_mediocrity 一致"""
+        found = []
+        if hits["mediocrity:template"]:
+            found.append("template")
+        if not hits["mediocrity:data"]:
+            found.append("no_data")
+        if hits["mediocrity:evasion"]:
+            found.append("evasion")
+        if len(hits["mediocrity:theory"]) > 3:
+            found.append("theory")
+        return found
+
+    def score_dimensions(self, manager_messages: List[str], client_type: str) -> Dict[str, Dict]:
+        """按维度给出未经难度调整、已按校准参数映射的得分，格式与按维度并发评估的单维度结果相同"""
+        evaluator = self.evaluator
+        hits = evaluator._scan_keywords(manager_messages)
+        mediocrity = self.detect_mediocrity(hits)
+
+        adjustments = {dimension: 0 for dimension in evaluator.evaluation_criteria}
+        bonus_phrases = {}
+        for keyword, (group, dimension) in self.CLIENT_BONUS.items():
+            if keyword in client_type and hits[f"bonus:{group}"]:
+                adjustments[dimension] += self.BONUS_POINTS
+                bonus_phrases[dimension] = sorted(hits[f"bonus:{group}"])
+        for name in mediocrity:
+            for dimension, points in self.MEDIOCRITY_PENALTIES[name][1]:
+                adjustments[dimension] -= points
+
+        results = {}
+        for dimension, criteria in evaluator.evaluation_criteria.items():
+            # 只有配置了关键词的亮点指标能被规则识别
+            indicators = [indicator for indicator in evaluator.positive_indicators.get(dimension, [])
+                          if indicator in evaluator.indicator_keywords]
+            matched = {indicator: sorted(hits[f"indicator:{indicator}"]) for indicator in indicators
+                       if hits[f"indicator:{indicator}"]}
+            coverage = (sum(min(1.0, len(keywords) / self.SATURATION_HITS) for keywords in matched.values())
+                        / len(indicators)) if indicators else 0.0
+
+            floor = criteria['pass_threshold'] - self.FLOOR_OFFSET
+            ceiling = criteria['max_score'] - self.CEILING_OFFSET
+            score = round(floor + coverage * (ceiling - floor)) + adjustments[dimension]
+            score = self._calibrated(dimension, max(0, min(criteria['max_score'], score)), criteria['max_score'])
+
+            missing = [indicator for indicator in indicators if indicator not in matched]
+            highlights = [f"“{'”“'.join(keywords[:2])}”：{indicator}" for indicator, keywords in matched.items()]
+            if dimension in bonus_phrases:
+                highlights.append(f"“{'”“'.join(bonus_phrases[dimension][:2])}”：照顾到{client_type}的特点")
+            if matched:
+                feedback = f"体现了{len(matched)}/{len(indicators)}项要点：{'、'.join(matched)}"
+            else:
+                feedback = "对话中未体现该维度的要点，建议有意识地加强"
+            results[dimension] = {
+                "score": score,
+                "strengths": list(matched),
+                "improvements": [f"可以加强：{indicator}" for indicator in missing],
+                "critical_errors": [],
+                "positive_highlights": highlights,
+                "suggested_phrases": [
+                    f"{indicator}，可以试试“{'”“'.join(evaluator.indicator_keywords[indicator][:2])}”这类表达"
+                    for indicator in missing
+                ],
+                "feedback": feedback
+            }
+
+        for name in mediocrity:
+            pattern, penalties = self.MEDIOCRITY_PENALTIES[name]
+            for dimension, _ in penalties:
+                results[dimension]['improvements'].insert(0, f"避免{pattern}")
+        return results
+
+    def evaluate(self, manager_messages: List[str], client_type: str, difficulty: int = 3,
+                 dimensions: Dict[str, Dict] = None) -> Dict:
+        """完整的五维评估，标记 evaluation_source 为 rules
+
+        dimensions 为调用方已算好的 score_dimensions 结果，传入时不再重复扫描发言。
+        """
+        evaluator = self.evaluator
+        results = dimensions if dimensions is not None else self.score_dimensions(manager_messages, client_type)
+
+        def collect(field: str, limit: int) -> List[str]:
+            items = []
+            for result in results.values():
+                for item in result[field]:
+                    if item not in items:
+                        items.append(item)
+            return items[:limit]
+
+        scores = {dimension: result['score'] for dimension, result in results.items()}
+        evaluation_data = {
+            "overall_score": round(sum(
+                scores[dimension] / criteria['max_score'] * criteria['weight'] * 100
+                for dimension, criteria in evaluator.evaluation_criteria.items()
+            )),
+            "scores": scores,
+            "strengths": collect('strengths', 4) or ["完成了与客户的基本沟通"],
+            "improvements": collect('improvements', 4),
+            "critical_errors": [],
+            "positive_highlights": collect('positive_highlights', 5),
+            "suggested_phrases": collect('suggested_phrases', 4),
+            "detailed_feedback": {dimension: result['feedback'] for dimension, result in results.items()}
+        }
+        evaluation_data = evaluator._apply_difficulty_adjustment(evaluation_data, difficulty, client_type)
+        evaluation_data['overall_score'] = self._calibrated("overall", evaluation_data['overall_score'], 100)
+
+        evaluation_data['performance_level'] = evaluator._get_performance_level(evaluation_data['overall_score'])
+        evaluation_data['encouragement'] = (
+            "表现不错！继续保持，试着把每个维度的要点都覆盖到！" if evaluation_data['overall_score'] >= 70
+            else "每一次对话都是进步的机会，对照改进建议再练一次吧！"
+        )
+        evaluation_data['evaluation_source'] = RULE_SOURCE
+        return evaluation_data
+
+    def _calibrated(self, key: str, value: float, upper: int) -> float:
+        """按校准参数把规则得分线性映射到模型评分的尺度，没有该项参数时原样返回"""
+        params = self.calibration.get(key)
+        if not isinstance(params, dict):
+            return value
+        mapped = params.get('slope', 1.0) * value + params.get('intercept', 0.0)
+        return max(0, min(upper, round(mapped)))
@@ -0,0 +1,327 @@
+"""陪练与评估管线的性能基准测试
+
+用离线假后端回放 data/benchmark_conversations.json 中的对话（覆盖全部 7 种客户类型），测量：
+- 对话管线：FinancialCoachAgent.get_response 每轮、SessionEvaluator.comprehensive_evaluation 每个会话的
+  延迟（p50/p95/p99）和 CPU 时间，并发回放时的吞吐，以及每个会话的内存占用
+- 微基准：_detect_positive_indicators、parse_evaluation_result、本地规则评分、prepare_analytics_data
+  （学员分析缓存的冷/热路径）和 utils/visualization 的图表构建函数
+
+结果输出为 JSON，便于不同提交之间对比：
+
+    python -m scripts.benchmark --output bench/base.json
+    COACH_FAKE_LATENCY=0.05 python -m scripts.benchmark --concurrency 8 --compare bench/base.json
+
+假后端的延迟默认为 0，测得的是本地处理开销；可用 COACH_FAKE_* 环境变量模拟模型耗时。
+"""
+import os
+
+# 基准测试始终使用离线假后端，须在导入 config 之前设置
+os.environ["COACH_LLM_BACKEND"] = "fake"
+for _name in ("COACH_FAKE_LATENCY", "COACH_FAKE_JITTER", "COACH_FAKE_DELTA_INTERVAL"):
+    os.environ.setdefault(_name, "0")
+
+import argparse
+import datetime
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+import timeit
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Callable
+
+from config import BASE_DIR, Config
+from models.coach_agent import FinancialCoachAgent
+from models.evaluator import SessionEvaluator
+from models.llm_backend import FakeBackend
+from utils import visualization
+from utils.analytics import get_user_analytics, invalidate_user_analytics
+from utils.metrics import percentile
+from utils.session_store import SessionStore
+
+DEFAULT_CORPUS = os.path.join(BASE_DIR, "data", "benchmark_conversations.json")
+
+
+def load_corpus(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)['conversations']
+
+
+def latency_stats(samples: List[float]) -> Dict:
+    """耗时样本（秒）的分位数，单位毫秒"""
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3)
+    }
+
+
+class PipelineBenchmark:
+    """逐轮回放对话：理财经理发言 -> 客户回复，会话结束后整体评估"""
+
+    def __init__(self, agent: FinancialCoachAgent, evaluator: SessionEvaluator, stream: bool = False):
+        self.agent = agent
+        self.evaluator = evaluator
+        self.stream = stream
+
+    def replay(self, conversation: Dict, timings: Dict[str, List] = None) -> List[Dict]:
+        """回放一段对话，返回消息列表；timings 非空时记录每轮的墙钟与 CPU 时间"""
+        client_type = conversation['client_type']
+        difficulty = conversation.get('difficulty', 3)
+        messages = []
+        for prompt in conversation['turns']:
+            messages.append({"role": "user", "content": prompt})
+            wall, cpu = time.perf_counter(), time.process_time()
+            reply = self.agent.get_response(prompt, messages, client_type, difficulty, stream=self.stream)
+            if self.stream:
+                reply = "".join(reply)
+            if timings is not None:
+                timings['reply'].append(time.perf_counter() - wall)
+                timings['reply_cpu'].append(time.process_time() - cpu)
+            messages.append({"role": "assistant", "content": reply})
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        self.evaluator.comprehensive_evaluation(messages, client_type, difficulty)
+        if timings is not None:
+            timings['evaluation'].append(time.perf_counter() - wall)
+            timings['evaluation_cpu'].append(time.process_time() - cpu)
+        return messages
+
+    def run(self, corpus: List[Dict], repeat: int = 1) -> Dict:
+        """顺序回放，测量单轮延迟和 CPU 时间"""
+        timings = {"reply": [], "reply_cpu": [], "evaluation": [], "evaluation_cpu": []}
+        for _ in range(repeat):
+            for conversation in corpus:
+                self.replay(conversation, timings)
+        return {
+            "reply": dict(latency_stats(timings['reply']),
+                          cpu_ms_per_turn=round(sum(timings['reply_cpu']) / len(timings['reply_cpu']) * 1000, 3)),
+            "evaluation": dict(latency_stats(timings['evaluation']),
+                               cpu_ms_per_session=round(
+                                   sum(timings['evaluation_cpu']) / len(timings['evaluation_cpu']) * 1000, 3))
+        }
+
+    def throughput(self, corpus: List[Dict], concurrency: int, repeat: int = 1) -> Dict:
+        """多个会话并发回放的吞吐，CPU 时间按整个进程计"""
+        sessions = corpus * repeat
+        turns = sum(len(conversation['turns']) for conversation in sessions)
+        wall, cpu = time.perf_counter(), time.process_time()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(self.replay, sessions))
+        elapsed, cpu_used = time.perf_counter() - wall, time.process_time() - cpu
+        return {
+            "concurrency": concurrency,
+            "sessions": len(sessions),
+            "turns": turns,
+            "elapsed_seconds": round(elapsed, 3),
+            "sessions_per_second": round(len(sessions) / elapsed, 2),
+            "turns_per_second": round(turns / elapsed, 2),
+            "cpu_ms_per_turn": round(cpu_used / turns * 1000, 3)
+        }
+
+    def memory(self, corpus: List[Dict]) -> Dict:
+        """每个会话回放期间的峰值内存增量，以及会话结束后消息列表仍占用的内存"""
+        peaks, retained = [], []
+        tracemalloc.start()
+        try:
+            for conversation in corpus:
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                messages = self.replay(conversation)
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - baseline)
+                retained.append(current - baseline)
+                del messages
+        finally:
+            tracemalloc.stop()
+        return {
+            "sessions": len(corpus),
+            "peak_kb_mean": round(sum(peaks) / len(peaks) / 1024, 1),
+            "peak_kb_max": round(max(peaks) / 1024, 1),
+            "retained_kb_mean": round(sum(retained) / len(retained) / 1024, 1)
+        }
+
+
+def micro(fn: Callable, repeat: int = 5) -> Dict:
+    """单个函数的微基准：自动确定循环次数（每轮至少 0.2 秒），取多轮中的最好和中位结果"""
+    try:
+        timer = timeit.Timer(fn)
+        number, _ = timer.autorange()
+        runs = sorted(t / number for t in timer.repeat(repeat=repeat, number=number))
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {str(e)}"}
+    return {
+        "number": number,
+        "best_us": round(runs[0] * 1e6, 2),
+        "median_us": round(runs[len(runs) // 2] * 1e6, 2)
+    }
+
+
+def micro_benchmarks(evaluator: SessionEvaluator, corpus: List[Dict], history_sessions: int,
+                     repeat: int = 5) -> Dict:
+    manager_messages = [turn for conversation in corpus for turn in conversation['turns']]
+    client_type = corpus[0]['client_type']
+
+    def detect_positive_indicators():
+        evaluator._last_scan = (None, None)  # 不复用上一次扫描结果
+        evaluator._detect_positive_indicators(manager_messages, client_type)
+
+    rng = random.Random(0)
+    evaluation = FakeBackend._fake_evaluation(rng)
+    previous_evaluation = FakeBackend._fake_evaluation(rng)
+    clean_text = json.dumps(evaluation, ensure_ascii=False)
+    messy_text = "以下是评估结果：\n```json\n" + clean_text[:-40].replace('],', '],\n') + "\n```"
+
+    results = {
+        "detect_positive_indicators": micro(detect_positive_indicators, repeat),
+        "parse_evaluation_result[clean]": micro(lambda: evaluator.parse_evaluation_result(clean_text), repeat),
+        "parse_evaluation_result[truncated]": micro(lambda: evaluator.parse_evaluation_result(messy_text), repeat),
+        "rule_scorer.evaluate": micro(
+            lambda: evaluator.rule_scorer.evaluate(manager_messages, client_type, 3), repeat)
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = SessionStore(os.path.join(directory, "benchmark.db"))
+        client_types = sorted({conversation['client_type'] for conversation in corpus})
+        start = datetime.datetime(2025, 1, 1)
+        for index in range(history_sessions):
+            store.save_session("benchmark", {
+                "timestamp": (start + datetime.timedelta(hours=index)).isoformat(),
+                "client_type": client_types[index % len(client_types)],
+                "difficulty": 1 + index % 5,
+                "messages": [],
+                "evaluation": FakeBackend._fake_evaluation(rng),
+                "duration_minutes": rng.uniform(3, 30)
+            })
+
+        def prepare_analytics_cold():
+            invalidate_user_analytics("benchmark")
+            return get_user_analytics(store, "benchmark").frame()
+
+        results["prepare_analytics_data[cold]"] = micro(prepare_analytics_cold, repeat)
+        results["prepare_analytics_data[warm]"] = micro(
+            lambda: get_user_analytics(store, "benchmark").frame(), repeat)
+        history_df = prepare_analytics_cold()
+        invalidate_user_analytics("benchmark")
+
+    builders = {
+        "create_radar_dashboard": lambda: visualization.create_radar_dashboard(evaluation),
+        "create_simple_dashboard": lambda: visualization.create_simple_dashboard(evaluation),
+        "create_performance_dashboard": lambda: visualization.create_performance_dashboard(evaluation),
+        "create_comparison_chart": lambda: visualization.create_comparison_chart(evaluation, previous_evaluation),
+        "create_trend_analysis": lambda: visualization.create_trend_analysis(history_df),
+        "create_performance_metrics": lambda: visualization.create_performance_metrics(history_df),
+        "create_performance_breakdown": lambda: visualization.create_performance_breakdown(history_df)
+    }
+    for name, builder in builders.items():
+        results[f"visualization.{name}"] = micro(builder, repeat)
+    return results
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "fake_latency": Config.FAKE_LATENCY,
+            "fake_jitter": Config.FAKE_JITTER,
+            "fake_delta_interval": Config.FAKE_DELTA_INTERVAL,
+            "parallel_evaluation": Config.PARALLEL_EVALUATION,
+            "async_llm": Config.ASYNC_LLM,
+            "llm_resilience": Config.LLM_RESILIENCE,
+            "model_routing": Config.MODEL_ROUTING,
+            "metrics": Config.METRICS
+        }
+    }
+
+
+def flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    """把嵌套结果展开为 "a.b.c": 数值，便于逐项对比"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: Dict, baseline: Dict):
+    """打印与基线结果的差异（只比较耗时和吞吐类指标）"""
+    current_flat = flatten({k: current[k] for k in ("pipeline", "micro") if k in current})
+    baseline_flat = flatten({k: baseline[k] for k in ("pipeline", "micro") if k in baseline})
+    print(f"对比基线 {baseline.get('environment', {}).get('commit')} -> {current['environment']['commit']}")
+    for name in sorted(current_flat):
+        if not name.endswith(("_ms", "_us", "_per_second", "_per_turn", "_per_session")):
+            continue
+        old, new = baseline_flat.get(name), current_flat[name]
+        if not old:
+            continue
+        print(f"  {name:<70} {old:>12} -> {new:>12}  {(new - old) / old:+.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="陪练与评估管线的性能基准测试（离线假后端）")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="对话语料 JSON")
+    parser.add_argument("--repeat", type=int, default=1, help="对话管线回放的遍数")
+    parser.add_argument("--concurrency", type=int, default=4, help="吞吐测试中同时回放的会话数")
+    parser.add_argument("--stream", action="store_true", help="客户回复使用流式调用")
+    parser.add_argument("--history-sessions", type=int, default=200, help="分析与趋势图微基准使用的历史会话数")
+    parser.add_argument("--micro-repeat", type=int, default=5, help="每个微基准的重复轮数")
+    parser.add_argument("--skip-micro", action="store_true", help="只跑对话管线")
+    parser.add_argument("--output", help="把结果另存为 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    agent = FinancialCoachAgent()
+    evaluator = SessionEvaluator()
+    evaluator.cache = None  # 每次都走完整评估路径
+    pipeline = PipelineBenchmark(agent, evaluator, stream=args.stream)
+
+    pipeline.replay(corpus[0])  # 预热：线程池、事件循环、提示词模板
+    results = {
+        "environment": environment(),
+        "corpus": {
+            "conversations": len(corpus),
+            "client_types": len({conversation['client_type'] for conversation in corpus}),
+            "turns": sum(len(conversation['turns']) for conversation in corpus)
+        },
+        "pipeline": {
+            "sequential": pipeline.run(corpus, args.repeat),
+            "throughput": pipeline.throughput(corpus, args.concurrency, args.repeat),
+            "memory": pipeline.memory(corpus)
+        }
+    }
+    if not args.skip_micro:
+        results["micro"] = micro_benchmarks(evaluator, corpus, args.history_sessions, args.micro_repeat)
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
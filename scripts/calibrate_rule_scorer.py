@@ -0,0 +1,165 @@
+"""对照模型评分校准本地规则评分
+
+以已保存会话的模型评估（或某次重新评分 --run-id 的结果）为参照，逐个会话用 RuleScorer 评分，
+报告两者的偏差、平均绝对误差、相关系数、等级一致率和规则评分耗时，并按最小二乘拟合出
+“模型分 ≈ 斜率 × 规则分 + 截距”的线性校准参数：
+
+    python -m scripts.calibrate_rule_scorer
+    python -m scripts.calibrate_rule_scorer --run-id prompt-v2 --write
+
+--write 把报告写入 Config.RULE_SCORER_CALIBRATION，之后 RuleScorer 按其中的 calibration 映射得分。
+回退到规则评分的评估、以及并发评估中由规则补齐的维度不参与对照。
+"""
+import argparse
+import datetime
+import json
+import statistics
+import time
+from typing import List, Dict, Tuple
+
+from config import Config
+from models.evaluator import SessionEvaluator
+from models.llm_backend import FakeBackend
+from models.rule_scorer import RULE_SOURCE, RuleScorer
+from utils.metrics import percentile
+from utils.session_store import SessionStore
+
+
+def compare(pairs: List[Tuple[float, float]]) -> Dict:
+    """一组（规则分, 模型分）的对照指标与线性校准参数"""
+    rule_scores = [rule for rule, _ in pairs]
+    llm_scores = [llm for _, llm in pairs]
+    bias = statistics.fmean(rule - llm for rule, llm in pairs)
+    try:
+        correlation = statistics.correlation(rule_scores, llm_scores)
+        slope, intercept = statistics.linear_regression(rule_scores, llm_scores)
+    except statistics.StatisticsError:
+        # 样本过少或某一方分数全部相同时无法拟合，只做平移
+        correlation = None
+        slope, intercept = 1.0, -bias
+    return {
+        "samples": len(pairs),
+        "rule_mean": round(statistics.fmean(rule_scores), 2),
+        "llm_mean": round(statistics.fmean(llm_scores), 2),
+        "bias": round(bias, 2),
+        "mae": round(statistics.fmean(abs(rule - llm) for rule, llm in pairs), 2),
+        "correlation": round(correlation, 3) if correlation is not None else None,
+        "slope": round(slope, 4),
+        "intercept": round(intercept, 4)
+    }
+
+
+def calibrate(evaluator: SessionEvaluator, sessions: List[Tuple[Dict, Dict]], min_samples: int = 20) -> Dict:
+    """sessions 为（会话, 模型评估）列表，返回校准报告
+
+    与 RuleScorer 应用校准的顺序一致：各维度按未校准的 score_dimensions 得分拟合，
+    总分在应用了维度校准的 evaluate 结果上拟合。
+    """
+    raw_scorer = RuleScorer(evaluator)  # 不加载现有校准，拟合原始规则分
+    pairs = {dimension: [] for dimension in evaluator.evaluation_criteria}
+    samples = []
+
+    for session, reference in sessions:
+        manager_messages = [msg['content'] for msg in session['messages'] if msg['role'] == 'user']
+        samples.append((manager_messages, session, reference))
+        results = raw_scorer.score_dimensions(manager_messages, session['client_type'])
+        rule_dimensions = reference.get('rule_dimensions') or []
+        for dimension in evaluator.evaluation_criteria:
+            score = reference.get('scores', {}).get(dimension)
+            if isinstance(score, (int, float)) and dimension not in rule_dimensions:
+                pairs[dimension].append((results[dimension]['score'], score))
+
+    dimension_metrics = {key: compare(values) for key, values in pairs.items() if values}
+    # 样本不足时不给出校准参数，RuleScorer 保持原始规则分
+    calibration = {
+        key: {"slope": result['slope'], "intercept": result['intercept']}
+        for key, result in dimension_metrics.items() if result['samples'] >= min_samples
+    }
+
+    scorer = RuleScorer(evaluator, dict(calibration))
+    overall_pairs = []
+    latencies = []
+    level_matches = 0
+    for manager_messages, session, reference in samples:
+        start = time.perf_counter()
+        evaluation = scorer.evaluate(manager_messages, session['client_type'], session.get('difficulty') or 3)
+        latencies.append((time.perf_counter() - start) * 1000)
+        overall_pairs.append((evaluation['overall_score'], reference['overall_score']))
+        if evaluation['performance_level'] == evaluator._get_performance_level(reference['overall_score']):
+            level_matches += 1
+
+    metrics = {"overall": compare(overall_pairs)} if overall_pairs else {}
+    metrics.update(dimension_metrics)
+    if overall_pairs and metrics['overall']['samples'] >= min_samples:
+        calibration['overall'] = {"slope": metrics['overall']['slope'], "intercept": metrics['overall']['intercept']}
+    return {
+        "generated_at": datetime.datetime.now().isoformat(),
+        "sessions": len(sessions),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "max": round(max(latencies), 3) if latencies else 0.0
+        },
+        "level_agreement": round(level_matches / len(sessions), 3) if sessions else None,
+        "metrics": metrics,
+        "calibration": calibration
+    }
+
+
+def load_references(store: SessionStore, run_id: str = None, user_id: str = None) -> List[Tuple[Dict, Dict]]:
+    """读取作为参照的模型评估，跳过没有评估或由规则评分生成的会话"""
+    rescores = store.rescore_evaluations(run_id) if run_id else None
+    sessions = []
+    for session_id in store.session_ids(user_id):
+        if rescores is not None and session_id not in rescores:
+            continue
+        session = store.get_session(session_id)
+        reference = rescores[session_id] if rescores is not None else session['evaluation']
+        if not isinstance(reference, dict) or not isinstance(reference.get('overall_score'), (int, float)):
+            continue
+        if reference.get('evaluation_source') == RULE_SOURCE:
+            continue
+        sessions.append((session, reference))
+    return sessions
+
+
+def print_report(report: Dict):
+    print(f"对照会话 {report['sessions']} 个，规则评分耗时 p50 {report['latency_ms']['p50']}ms · "
+          f"p95 {report['latency_ms']['p95']}ms，表现等级一致率 {report['level_agreement']}")
+    print(f"{'维度':<24}{'样本':>6}{'规则均分':>10}{'模型均分':>10}{'偏差':>8}{'MAE':>8}{'相关':>8}")
+    for key, result in report['metrics'].items():
+        correlation = '-' if result['correlation'] is None else result['correlation']
+        print(f"{key:<24}{result['samples']:>6}{result['rule_mean']:>10}{result['llm_mean']:>10}"
+              f"{result['bias']:>8}{result['mae']:>8}{correlation:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对照模型评分校准本地规则评分")
+    parser.add_argument("--db", default=Config.SESSION_DB_PATH, help="会话数据库路径")
+    parser.add_argument("--run-id", help="以该次重新评分的结果为参照（默认使用会话保存时的评估）")
+    parser.add_argument("--user", help="只使用该学员的会话")
+    parser.add_argument("--min-samples", type=int, default=20, help="给出校准参数所需的最少样本数")
+    parser.add_argument("--output", help="把报告另存为 JSON 文件")
+    parser.add_argument("--write", action="store_true", help="把报告写入规则评分使用的校准文件")
+    args = parser.parse_args()
+
+    store = SessionStore(args.db)
+    # 只用到本地规则评分，不调用模型，用假后端构建评估器，无需配置 API Key
+    evaluator = SessionEvaluator(backend=FakeBackend())
+    sessions = load_references(store, args.run_id, args.user)
+    if not sessions:
+        print("没有可作为参照的模型评估")
+        return
+
+    report = calibrate(evaluator, sessions, args.min_samples)
+    report['reference'] = f"rescore:{args.run_id}" if args.run_id else "sessions"
+    print_report(report)
+
+    for path in filter(None, [args.output, Config.RULE_SCORER_CALIBRATION if args.write else None]):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
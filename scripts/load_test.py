@@ -0,0 +1,473 @@
+"""模拟多名学员同时练习的无界面压测
+
+每个虚拟学员像浏览器一样通过 Streamlit 的 WebSocket 协议驱动 FinancialCoachApp：打开页面、
+开始新会话、进行 N 轮对话（中途发送一次“评估”）、结束会话，并等待后台评估结果出现在评估页。
+所有学员连接同一个 Streamlit 进程，用来回答“单个进程能同时承载多少学员而不明显拖慢每轮响应”。
+
+默认在临时目录中用假后端（COACH_LLM_BACKEND=fake）和独立会话库启动一个 Streamlit 进程：
+
+    python -m scripts.load_test --users 200 --ramp-up 60 --turns 6 --think-time 3
+    COACH_FAKE_LATENCY=0.3 python -m scripts.load_test --users 400 --output load/400.json
+    python -m scripts.load_test --url http://localhost:8501 --users 50
+
+报告吞吐、各动作的延迟分位数（每轮对话还按当时的在线学员数分段）、服务进程内存增长和错误率。
+用 --url 压测已在运行的服务时，只有同时给出 --pid 才统计内存。
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import Counter, defaultdict
+from typing import List, Dict, Optional
+
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake
+
+from config import BASE_DIR
+from utils.metrics import percentile
+
+DEFAULT_CORPUS = os.path.join(BASE_DIR, "data", "benchmark_conversations.json")
+APP_PATH = os.path.join(BASE_DIR, "app.py")
+
+# 页面上用于定位控件的标签
+USER_ID_LABEL = "学员工号"
+CLIENT_TYPE_LABEL = "请选择要练习的客户类型:"
+START_LABEL = "开始新会话"
+END_LABEL = "结束会话"
+# 评估页出现该指标即表示评估报告已就绪
+REPORT_METRIC = "综合评分"
+# 对话中途请求反馈的发言（包含“评估”即触发即时反馈）
+FEEDBACK_PROMPT = "请帮我评估一下目前的表现"
+
+
+class AppError(Exception):
+    """页面运行中抛出了异常（Streamlit 以 exception 元素返回）"""
+
+
+class Recorder:
+    """汇总所有虚拟学员的动作耗时、错误和在线人数"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)  # 动作 -> [耗时]
+        self.turn_samples = []  # (开始时的在线学员数, 耗时)
+        self.attempts = Counter()
+        self.errors = Counter()  # (动作, 错误类型) -> 次数
+        self.examples = []
+        self.active = 0
+        self.peak_active = 0
+        self.completed = 0
+
+    def record(self, action: str, seconds: float, active: int):
+        self.samples[action].append(seconds)
+        if action == "turn":
+            self.turn_samples.append((active, seconds))
+
+    def error(self, action: str, error: Exception):
+        if isinstance(error, asyncio.TimeoutError):
+            kind = "timeout"
+        elif isinstance(error, ConnectionClosed):
+            kind = "disconnected"
+        elif isinstance(error, (OSError, InvalidHandshake)):
+            kind = "connect"
+        elif isinstance(error, AppError):
+            kind = "app_exception"
+        else:
+            kind = type(error).__name__
+        self.errors[(action, kind)] += 1
+        message = f"{action}/{kind}: {(str(error) or type(error).__name__)[:200]}"
+        if len(self.examples) < 10 and message not in self.examples:
+            self.examples.append(message)
+
+
+class VirtualUser:
+    """一个虚拟学员：按浏览器的方式发送重跑请求，解析返回的页面元素找到控件"""
+
+    def __init__(self, index: int, ws_url: str, conversation: Dict, args, recorder: Recorder):
+        self.index = index
+        self.ws_url = ws_url
+        self.conversation = conversation
+        self.args = args
+        self.recorder = recorder
+        self.rng = random.Random(args.seed + index)
+        self.user_id = f"{args.user_prefix}-{index:04d}"
+        self.ws = None
+        self.page_script_hash = ""
+        self.widgets = {}  # 控件标签 -> 控件ID
+        self.values = {}  # 控件ID -> WidgetState，非触发型控件的当前值，每次重跑都要带上
+        self.chat_input = None  # (控件ID, 所属片段ID)
+        self.auto_rerun = None  # (间隔秒数, 片段ID)，开场提问或后台评估轮询期间由服务端下发
+        self.metric_labels = set()
+        self.exceptions = []
+
+    def prompts(self) -> List[str]:
+        turns = self.conversation['turns']
+        return [turns[i % len(turns)] for i in range(self.args.turns)]
+
+    async def think(self):
+        """两次操作之间的思考时间，在 think_time 上下浮动 50%"""
+        if self.args.think_time > 0:
+            await asyncio.sleep(self.args.think_time * self.rng.uniform(0.5, 1.5))
+
+    def widget_id(self, label: str) -> str:
+        for widget_label, widget_id in self.widgets.items():
+            if label in widget_label:
+                return widget_id
+        raise AppError(f"页面上没有找到控件：{label}")
+
+    def set_value(self, label: str, value: str):
+        state = WidgetState(id=self.widget_id(label), string_value=value)
+        self.values[state.id] = state
+
+    async def rerun(self, trigger: WidgetState = None, fragment_id: str = "", is_auto_rerun: bool = False):
+        """发送一次重跑请求并读取返回的消息，直到本次运行（含其中 st.rerun 触发的运行）结束"""
+        msg = BackMsg()
+        client_state = msg.rerun_script
+        client_state.page_script_hash = self.page_script_hash
+        client_state.widget_states.widgets.extend(self.values.values())
+        if trigger is not None:
+            client_state.widget_states.widgets.append(trigger)
+        client_state.fragment_id = fragment_id
+        client_state.is_auto_rerun = is_auto_rerun
+        self.metric_labels = set()
+        self.exceptions = []
+        await self.ws.send(msg.SerializeToString())
+
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await self.ws.recv())
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                # 整页运行开始，与浏览器一致清除上一次运行注册的片段定时重跑，由本次运行重新注册
+                self.page_script_hash = msg.new_session.page_script_hash
+                self.auto_rerun = None
+            elif kind == "delta":
+                self.handle_delta(msg.delta)
+            elif kind == "auto_rerun":
+                self.auto_rerun = (msg.auto_rerun.interval, msg.auto_rerun.fragment_id)
+            elif kind == "stop_auto_rerun":
+                self.auto_rerun = None
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    # 被 st.rerun 打断的运行，页面以接下来的运行为准
+                    self.metric_labels = set()
+                    continue
+                if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    self.exceptions.append("脚本编译失败")
+                break
+        if self.exceptions:
+            raise AppError("; ".join(self.exceptions))
+
+    def handle_delta(self, delta):
+        if delta.WhichOneof("type") != "new_element":
+            return
+        element = delta.new_element
+        kind = element.WhichOneof("type")
+        if kind in ("button", "selectbox", "text_input"):
+            widget = getattr(element, kind)
+            self.widgets[widget.label] = widget.id
+        elif kind == "chat_input":
+            self.chat_input = (element.chat_input.id, delta.fragment_id)
+        elif kind == "metric":
+            self.metric_labels.add(element.metric.label)
+        elif kind == "exception" and not element.exception.is_warning:
+            self.exceptions.append(f"{element.exception.type}: {element.exception.message}")
+
+    async def click(self, label: str):
+        await self.rerun(WidgetState(id=self.widget_id(label), trigger_value=True))
+
+    async def send_chat(self, prompt: str):
+        if self.chat_input is None:
+            raise AppError("页面上没有聊天输入框")
+        widget_id, fragment_id = self.chat_input
+        trigger = WidgetState(id=widget_id)
+        trigger.chat_input_value.data = prompt
+        await self.rerun(trigger, fragment_id=fragment_id)
+
+    async def wait_for_report(self):
+        """按服务端下发的间隔轮询评估页片段，直到评估报告出现"""
+        while REPORT_METRIC not in self.metric_labels:
+            if self.auto_rerun is None:
+                raise AppError("结束会话后既没有评估报告，也没有在轮询后台评估")
+            interval, fragment_id = self.auto_rerun
+            await asyncio.sleep(interval)
+            await self.rerun(fragment_id=fragment_id, is_auto_rerun=True)
+
+    async def step(self, action: str, coro, timeout: float = None):
+        recorder = self.recorder
+        recorder.attempts[action] += 1
+        active = recorder.active
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(coro, timeout or self.args.timeout)
+        except Exception as e:
+            recorder.error(action, e)
+            raise
+        recorder.record(action, time.perf_counter() - start, active)
+
+    async def start_session(self):
+        self.set_value(USER_ID_LABEL, self.user_id)
+        self.set_value(CLIENT_TYPE_LABEL, self.conversation['client_type'])
+        await self.click(START_LABEL)
+
+    async def session(self):
+        await self.step("load", self.rerun())
+        await self.think()
+        await self.step("start_session", self.start_session())
+
+        prompts = self.prompts()
+        feedback_at = len(prompts) // 2
+        for turn, prompt in enumerate(prompts):
+            if turn == feedback_at:
+                await self.think()
+                await self.step("feedback", self.send_chat(FEEDBACK_PROMPT))
+            await self.think()
+            await self.step("turn", self.send_chat(prompt))
+
+        await self.think()
+        await self.step("end_session", self.click(END_LABEL))
+        await self.step("evaluation_ready", self.wait_for_report(), self.args.evaluation_timeout)
+
+    async def run(self, delay: float):
+        await asyncio.sleep(delay)
+        recorder = self.recorder
+        recorder.attempts["connect"] += 1
+        try:
+            self.ws = await asyncio.wait_for(open_connection(self.ws_url), self.args.timeout)
+        except Exception as e:
+            recorder.error("connect", e)
+            return
+        recorder.active += 1
+        recorder.peak_active = max(recorder.peak_active, recorder.active)
+        try:
+            await self.session()
+            recorder.completed += 1
+        except Exception:
+            pass  # 已在 step 中记录，后续步骤依赖前面的结果，直接放弃该学员
+        finally:
+            recorder.active -= 1
+            await self.ws.close()
+
+
+def open_connection(ws_url: str):
+    """与浏览器一致：不主动发送心跳（服务端的心跳仍会自动应答），单条消息不限大小"""
+    return connect(ws_url, subprotocols=["streamlit"], max_size=None, ping_interval=None)
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    """进程的常驻内存（MB），读取 /proc，非 Linux 或进程不存在时返回 None"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def latency_stats(samples: List[float]) -> Dict:
+    """耗时样本（秒）的分位数，单位毫秒"""
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 1),
+        "p50_ms": round(percentile(samples, 0.5) * 1000, 1),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1)
+    }
+
+
+def start_server(port: int, directory: str) -> subprocess.Popen:
+    """用假后端和临时会话库启动一个 Streamlit 进程，等待健康检查通过"""
+    env = dict(os.environ)
+    env["COACH_LLM_BACKEND"] = "fake"
+    env.setdefault("COACH_SESSION_DB_PATH", os.path.join(directory, "sessions.db"))
+    env.setdefault("COACH_METRICS_FILE", os.path.join(directory, "metrics.prom"))
+    log = open(os.path.join(directory, "streamlit.log"), "w", encoding="utf-8")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless=true",
+         f"--server.port={port}", "--server.fileWatcherType=none", "--browser.gatherUsageStats=false"],
+        cwd=BASE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Streamlit 进程启动失败，日志见 {log.name}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=2) as response:
+                if response.status == 200:
+                    return process
+        except OSError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"Streamlit 进程 60 秒内未就绪，日志见 {log.name}")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def sample_memory(pid: int, recorder: Recorder, timeline: List, start: float, interval: float):
+    while True:
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            timeline.append([round(time.perf_counter() - start, 1), round(rss, 1), recorder.active])
+        await asyncio.sleep(interval)
+
+
+async def run_load(args, ws_url: str, pid: Optional[int], corpus: List[Dict]) -> Dict:
+    # 预热：首次运行要导入模型、加载共享资源，不计入结果
+    warmup = VirtualUser(-1, ws_url, corpus[0], args, Recorder())
+    async with open_connection(ws_url) as warmup.ws:
+        await asyncio.wait_for(warmup.rerun(), max(args.timeout, args.evaluation_timeout))
+
+    recorder = Recorder()
+    timeline = []
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    rss_start = read_rss_mb(pid) if pid else None
+    sampler = asyncio.create_task(sample_memory(pid, recorder, timeline, start, args.sample_interval)) if pid else None
+    users = [VirtualUser(index, ws_url, corpus[index % len(corpus)], args, recorder) for index in range(args.users)]
+    await asyncio.gather(*(user.run(args.ramp_up * index / args.users) for index, user in enumerate(users)))
+    elapsed = time.perf_counter() - start
+    driver_cpu = time.process_time() - cpu_start
+    if sampler is not None:
+        sampler.cancel()
+    rss_end = read_rss_mb(pid) if pid else None
+
+    # 每轮对话的延迟按开始时的在线学员数分段，观察随并发上升的变化
+    by_active = defaultdict(list)
+    for active, seconds in recorder.turn_samples:
+        by_active[active // args.bucket * args.bucket].append(seconds)
+
+    attempts = sum(recorder.attempts.values())
+    failures = sum(recorder.errors.values())
+    turns = len(recorder.samples["turn"]) + len(recorder.samples["feedback"])
+    memory = None
+    if rss_start is not None and rss_end is not None:
+        peak = max([rss for _, rss, _ in timeline] + [rss_start, rss_end])
+        memory = {
+            "rss_mb_start": round(rss_start, 1),
+            "rss_mb_peak": round(peak, 1),
+            "rss_mb_end": round(rss_end, 1),
+            "growth_mb": round(rss_end - rss_start, 1),
+            "growth_kb_per_session": round((rss_end - rss_start) * 1024 / recorder.completed, 1)
+            if recorder.completed else None
+        }
+    return {
+        "duration_seconds": round(elapsed, 1),
+        "users": {
+            "started": args.users,
+            "completed": recorder.completed,
+            "failed": args.users - recorder.completed,
+            "peak_active": recorder.peak_active
+        },
+        "throughput": {
+            "turns_per_second": round(turns / elapsed, 2),
+            "sessions_per_second": round(recorder.completed / elapsed, 3),
+            "reruns_per_second": round(sum(len(samples) for samples in recorder.samples.values()) / elapsed, 2)
+        },
+        "latency": {action: latency_stats(samples) for action, samples in recorder.samples.items()},
+        "turn_latency_by_active_users": {
+            f"{low}-{low + args.bucket - 1}": latency_stats(samples) for low, samples in sorted(by_active.items())
+        },
+        "errors": {
+            "rate": round(failures / attempts, 4) if attempts else 0.0,
+            "by_action": {
+                action: {"attempts": count, "errors": sum(n for (a, _), n in recorder.errors.items() if a == action)}
+                for action, count in recorder.attempts.items()
+            },
+            "by_kind": {f"{action}/{kind}": n for (action, kind), n in recorder.errors.items()},
+            "examples": recorder.examples
+        },
+        "memory": memory,
+        # 压测进程自身的 CPU 占用，接近 1 时测得的延迟包含了压测端的排队
+        "driver_cpu_utilization": round(driver_cpu / elapsed, 3),
+        "timeline": timeline
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟多名学员同时练习的无界面压测")
+    parser.add_argument("--users", type=int, default=100, help="虚拟学员数")
+    parser.add_argument("--ramp-up", type=float, default=30.0, help="在多少秒内让全部学员依次进入")
+    parser.add_argument("--turns", type=int, default=6, help="每个会话的对话轮数（另有一次中途评估）")
+    parser.add_argument("--think-time", type=float, default=3.0, help="两次操作之间的平均思考时间（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单次操作的超时（秒）")
+    parser.add_argument("--evaluation-timeout", type=float, default=180.0, help="结束会话后等待评估报告的超时（秒）")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="对话语料 JSON，学员轮流使用其中的对话")
+    parser.add_argument("--url", help="压测已在运行的服务（默认自行启动一个使用假后端的进程）")
+    parser.add_argument("--pid", type=int, help="配合 --url 统计该进程的内存")
+    parser.add_argument("--bucket", type=int, default=25, help="按在线学员数分段统计延迟的段宽")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="内存采样间隔（秒）")
+    parser.add_argument("--user-prefix", default="load", help="虚拟学员工号前缀")
+    parser.add_argument("--seed", type=int, default=0, help="思考时间的随机种子")
+    parser.add_argument("--output", help="把结果（含内存时间线）另存为 JSON 文件")
+    args = parser.parse_args()
+
+    with open(args.corpus, "r", encoding="utf-8") as f:
+        corpus = json.load(f)['conversations']
+
+    with tempfile.TemporaryDirectory() as directory:
+        server = None
+        if args.url:
+            url, pid = args.url.rstrip("/"), args.pid
+        else:
+            port = free_port()
+            server = start_server(port, directory)
+            url, pid = f"http://127.0.0.1:{port}", server.pid
+        ws_url = url.replace("http", "ws", 1) + "/_stcore/stream"
+        try:
+            results = asyncio.run(run_load(args, ws_url, pid, corpus))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    results = {
+        "environment": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "commit": git_commit(),
+            "url": args.url or "spawned",
+            "users": args.users,
+            "ramp_up": args.ramp_up,
+            "turns": args.turns,
+            "think_time": args.think_time,
+            "fake_latency": os.getenv("COACH_FAKE_LATENCY") if not args.url else None
+        },
+        **results
+    }
+    print(json.dumps({key: value for key, value in results.items() if key != "timeline"},
+                     ensure_ascii=False, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""批量重新评分历史会话
+
+修改 evaluation_criteria 或评估提示词后，用当前的 SessionEvaluator 重新评估已保存的会话，
+新结果写入 session_rescores 表，与原评估并存以便对比：
+
+    python -m scripts.rescore_sessions --workers 8
+    python -m scripts.rescore_sessions --run-id criteria-trial --user 10086 --limit 200 --no-cache
+
+中断后用相同的 --run-id 重新执行即从断点继续；同一次运行中对话内容相同的会话只评估一次。
+模型不可用时评估器回退到本地规则评分，这类结果不写入、计入 rule_fallbacks，下次运行时重试。
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import List, Dict
+
+from config import Config
+from models.evaluator import SessionEvaluator
+from models.llm_client import llm_user, submit_in_context
+from models.rule_scorer import RULE_SOURCE
+from utils.metrics import percentile
+from utils.session_store import SessionStore
+
+
+def transcript_hash(session: Dict) -> str:
+    """按参与评分的内容（理财经理发言、客户类型、难度）计算哈希"""
+    manager_messages = [msg['content'] for msg in session['messages'] if msg['role'] == 'user']
+    payload = json.dumps([session.get('client_type'), session.get('difficulty') or 3, manager_messages],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Rescorer:
+    """对单个会话重新评分；相同对话只调用一次模型，并发中的重复会话等待同一结果"""
+
+    def __init__(self, evaluator: SessionEvaluator, store: SessionStore, run_id: str, parallel: bool = None):
+        self.evaluator = evaluator
+        self.store = store
+        self.run_id = run_id
+        self.parallel = parallel
+        self._inflight = {}  # 对话哈希 -> Future
+        self._lock = threading.Lock()
+
+    def rescore(self, session_id: int) -> Dict:
+        session = self.store.get_session(session_id)
+        digest = transcript_hash(session)
+
+        with self._lock:
+            future = self._inflight.get(digest)
+            owner = future is None
+            if owner:
+                future = self._inflight[digest] = Future()
+
+        start = time.monotonic()
+        if owner:
+            try:
+                evaluation = self.store.rescore_by_hash(self.run_id, digest)
+                deduped = evaluation is not None
+                if not deduped:
+                    evaluation = self.evaluator.comprehensive_evaluation(
+                        session['messages'], session['client_type'], session.get('difficulty') or 3,
+                        parallel=self.parallel)
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            future.set_result(evaluation)
+        else:
+            evaluation = future.result()
+            deduped = True
+        latency = time.monotonic() - start
+
+        fallback = evaluation.get('evaluation_source') == RULE_SOURCE
+        if not fallback:
+            self.store.save_rescore(session_id, self.run_id, digest, evaluation, latency,
+                                    datetime.datetime.now().isoformat())
+        return {
+            "session_id": session_id,
+            "deduped": deduped,
+            "fallback": fallback,
+            "latency": latency,
+            "old_score": session.get('overall_score'),
+            "new_score": evaluation.get('overall_score')
+        }
+
+
+def summarize(results: List[Dict], failures: int, elapsed: float, comparison: List[Dict]) -> Dict:
+    """本次运行的吞吐、延迟，以及本轮全部结果与原评分的差异"""
+    latencies = [result['latency'] for result in results if not result['deduped'] and not result['fallback']]
+    fallbacks = sum(1 for result in results if result['fallback'])
+    deltas = [row['new_score'] - row['old_score'] for row in comparison
+              if row['new_score'] is not None and row['old_score'] is not None]
+    return {
+        "sessions": len(results) + failures,
+        "scored": len(latencies),
+        "deduped": sum(1 for result in results if result['deduped']),
+        "rule_fallbacks": fallbacks,
+        "failed": failures,
+        "elapsed_seconds": round(elapsed, 2),
+        "sessions_per_second": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50": round(percentile(latencies, 0.5), 3),
+        "latency_p95": round(percentile(latencies, 0.95), 3),
+        "latency_max": round(max(latencies), 3) if latencies else 0.0,
+        "compared": len(deltas),
+        "mean_delta": round(sum(deltas) / len(deltas), 2) if deltas else 0.0,
+        "mean_abs_delta": round(sum(abs(delta) for delta in deltas) / len(deltas), 2) if deltas else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量重新评分历史会话")
+    parser.add_argument("--db", default=Config.SESSION_DB_PATH, help="会话数据库路径")
+    parser.add_argument("--run-id", default=f"prompt-v{SessionEvaluator.PROMPT_VERSION}",
+                        help="本次重新评分的标识，相同标识可断点续跑")
+    parser.add_argument("--user", help="只处理该学员的会话")
+    parser.add_argument("--limit", type=int, help="本次最多处理的会话数")
+    parser.add_argument("--workers", type=int, default=4, help="同时评估的会话数")
+    parser.add_argument("--single", action="store_true", help="使用单次整体评估而不是按维度并发评估")
+    parser.add_argument("--no-cache", action="store_true", help="不使用评估结果缓存，强制调用模型")
+    parser.add_argument("--summary-json", help="把汇总结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    store = SessionStore(args.db)
+    evaluator = SessionEvaluator()
+    if args.no_cache:
+        evaluator.cache = None
+    rescorer = Rescorer(evaluator, store, args.run_id, parallel=False if args.single else None)
+
+    session_ids = store.session_ids(args.user)
+    done = store.rescored(args.run_id)
+    todo = [session_id for session_id in session_ids if session_id not in done]
+    if args.limit is not None:
+        todo = todo[:args.limit]
+    print(f"[{args.run_id}] 共 {len(session_ids)} 个会话，已完成 {len(done)}，本次评分 {len(todo)}")
+
+    results = []
+    failures = 0
+    start = time.monotonic()
+    # 批量任务单独作为一个调度对象，与在线学员公平分享模型并发额度
+    with llm_user(f"rescore:{args.run_id}"), ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {submit_in_context(executor, rescorer.rescore, session_id): session_id for session_id in todo}
+        for index, future in enumerate(as_completed(futures), 1):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failures += 1
+                print(f"会话 {futures[future]} 评分失败: {str(e)}")
+            if index % 10 == 0 or index == len(todo):
+                elapsed = time.monotonic() - start
+                print(f"  {index}/{len(todo)}  {index / elapsed:.2f} 会话/秒")
+
+    summary = summarize(results, failures, time.monotonic() - start, store.rescore_comparison(args.run_id))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if args.summary_json:
+        with open(args.summary_json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import itertools
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.session_store import SCORE_DIMENSIONS, SessionStore
+
+NUMERIC_COLUMNS = ['overall_score'] + SCORE_DIMENSIONS + ['duration_minutes']
+ANALYTICS_COLUMNS = ['session_date', 'client_type'] + NUMERIC_COLUMNS
+
+# 进程内全局递增的版本号：缓存被丢弃或淘汰后重新加载的实例也不会与旧实例的版本号重复
+_versions = itertools.count(1)
+
+
+class SessionAnalytics:
+    """单个学员的列式分析缓存
+
+    各列以定长 numpy 数组保存、按倍增扩容，会话结束时追加一行即可；
+    趋势图、饼图、明细表和侧边栏指标都从这些列做向量化计算，无需每次重建。
+    """
+
+    def __init__(self, rows: List[Dict] = None, capacity: int = 64):
+        rows = rows or []
+        capacity = max(capacity, len(rows))
+        self._size = 0
+        self._numeric = {column: np.zeros(capacity, dtype=np.float64) for column in NUMERIC_COLUMNS}
+        self._has_score = np.zeros(capacity, dtype=bool)  # overall_score 是否有效，用于计算平均分
+        self._client_types = np.empty(capacity, dtype=object)
+        self._lock = threading.Lock()
+        self._frame = None
+        self._frame_version = -1
+        self.version = 0  # 数据每变化一次换一个进程内唯一的新值，可作为图表等下游缓存的键
+
+        for row in rows:
+            self._append_row(row)
+        self.version = next(_versions)
+
+    @staticmethod
+    def row_from_record(record: Dict) -> Dict:
+        """把 end_session 生成的会话记录转换为分析行"""
+        evaluation = record.get('evaluation') or {}
+        scores = evaluation.get('scores', {}) if isinstance(evaluation, dict) else {}
+        row = {
+            'client_type': record.get('client_type'),
+            'overall_score': evaluation.get('overall_score') if isinstance(evaluation, dict) else None,
+            'duration_minutes': record.get('duration_minutes', 0)
+        }
+        for dimension in SCORE_DIMENSIONS:
+            row[dimension] = scores.get(dimension)
+        return row
+
+    def append(self, record: Dict):
+        """会话结束时追加一条记录"""
+        with self._lock:
+            self._append_row(self.row_from_record(record))
+            self.version = next(_versions)
+
+    def _append_row(self, row: Dict):
+        if self._size == len(self._client_types):
+            self._grow()
+        index = self._size
+        for column in NUMERIC_COLUMNS:
+            value = row.get(column)
+            self._numeric[column][index] = value if value is not None else 0
+        self._has_score[index] = row.get('overall_score') is not None
+        self._client_types[index] = row.get('client_type')
+        self._size += 1
+
+    def _grow(self):
+        capacity = max(1, len(self._client_types)) * 2
+        for column, values in self._numeric.items():
+            self._numeric[column] = np.resize(values, capacity)
+        self._has_score = np.resize(self._has_score, capacity)
+        client_types = np.empty(capacity, dtype=object)
+        client_types[:self._size] = self._client_types[:self._size]
+        self._client_types = client_types
+
+    def __len__(self):
+        return self._size
+
+    def frame(self) -> pd.DataFrame:
+        """与 prepare_analytics_data 相同列结构的 DataFrame，数据未变化时直接复用"""
+        with self._lock:
+            if self._frame is None or self._frame_version != self.version:
+                size = self._size
+                data = {
+                    'session_date': np.arange(1, size + 1),  # 使用序号而不是日期，便于显示
+                    'client_type': pd.Categorical(self._client_types[:size]),
+                }
+                for column in NUMERIC_COLUMNS:
+                    data[column] = self._numeric[column][:size].copy()
+                self._frame = pd.DataFrame(data, columns=ANALYTICS_COLUMNS)
+                self._frame_version = self.version
+            return self._frame
+
+    def summary(self) -> Dict:
+        """侧边栏指标：练习次数与平均得分"""
+        with self._lock:
+            size = self._size
+            valid = self._has_score[:size]
+            avg_score = float(self._numeric['overall_score'][:size][valid].mean()) if valid.any() else None
+            return {"total": size, "avg_score": avg_score}
+
+    def client_type_counts(self) -> pd.Series:
+        """各客户类型的练习次数"""
+        return self.frame()['client_type'].value_counts(sort=False)
+
+
+_analytics_cache = OrderedDict()
+_analytics_lock = threading.Lock()
+_MAX_CACHED_USERS = 512
+
+
+def get_user_analytics(store: SessionStore, user_id: str) -> SessionAnalytics:
+    """获取学员的列式分析缓存，首次访问时从会话存储一次性加载"""
+    with _analytics_lock:
+        analytics = _analytics_cache.get(user_id)
+        if analytics is not None:
+            _analytics_cache.move_to_end(user_id)
+            return analytics
+
+    analytics = SessionAnalytics(store.analytics_rows(user_id))
+    with _analytics_lock:
+        analytics = _analytics_cache.setdefault(user_id, analytics)
+        _analytics_cache.move_to_end(user_id)
+        while len(_analytics_cache) > _MAX_CACHED_USERS:
+            _analytics_cache.popitem(last=False)
+        return analytics
+
+
+def peek_user_analytics(user_id: str) -> Optional[SessionAnalytics]:
+    """已加载的分析缓存，尚未加载时返回 None 而不触发加载"""
+    with _analytics_lock:
+        return _analytics_cache.get(user_id)
+
+
+def invalidate_user_analytics(user_id: str):
+    """学员的会话数据在别处被修改（如后台评估完成）后丢弃缓存，下次访问时重新加载"""
+    with _analytics_lock:
+        _analytics_cache.pop(user_id, None)
@@ -0,0 +1,118 @@
+import json
+import re
+from typing import Dict, Optional
+
+_decoder = json.JSONDecoder()
+_CLOSERS = {'{': '}', '[': ']'}
+
+
+def extract_json_object(text: str) -> Optional[Dict]:
+    """从模型输出中提取 JSON 对象
+
+    依次尝试：
+    1. 从每个 '{' 处直接解码（C 实现，格式正确时一步到位，自动忽略前后的说明文字和代码块标记）
+    2. 括号配对扫描出完整对象，去掉多余的尾逗号后再解码
+    3. 输出被截断时，回退到最近一个完整成员处并补齐括号
+    都失败时返回 None。
+    """
+    if not text:
+        return None
+
+    start = text.find('{')
+    while start != -1:
+        try:
+            result, _ = _decoder.raw_decode(text, start)
+            if isinstance(result, dict):
+                return result
+        except json.JSONDecodeError:
+            pass
+        result = _scan_object(text, start)
+        if result is not None:
+            return result
+        start = text.find('{', start + 1)
+    return None
+
+
+def _scan_object(text: str, start: int) -> Optional[Dict]:
+    """从 start 处按括号配对扫描一个对象；对象未闭合时尝试修复截断"""
+    stack = []
+    in_string = False
+    escaped = False
+    cut_points = []  # (截断位置, 当时的括号栈)：在这些位置截断后补齐括号即为合法 JSON
+
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in _CLOSERS:
+            stack.append(char)
+        elif char in '}]':
+            if not stack or _CLOSERS[stack[-1]] != char:
+                return None
+            stack.pop()
+            if not stack:
+                return _loads(text[start:index + 1])
+            cut_points.append((index + 1, tuple(stack)))
+        elif char == ',':
+            cut_points.append((index, tuple(stack)))
+
+    # 文本在对象内部结束：先尝试补全字符串和括号，再从最近的完整成员处截断
+    if in_string:
+        tail = (text[start:-1] if escaped else text[start:]) + '"'  # 丢掉末尾不完整的转义
+        result = _loads(tail + _close(stack))
+        if result is not None:
+            return result
+    for cut, cut_stack in reversed(cut_points[-50:]):
+        result = _loads(text[start:cut] + _close(cut_stack))
+        if result is not None:
+            return result
+    return None
+
+
+def _close(stack) -> str:
+    return ''.join(_CLOSERS[opener] for opener in reversed(stack))
+
+
+def _loads(candidate: str) -> Optional[Dict]:
+    for attempt in (candidate, _strip_trailing_commas(candidate)):
+        try:
+            result = json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(result, dict):
+            return result
+    return None
+
+
+_TRAILING_COMMA = re.compile(r'("(?:[^"\\]|\\.)*")|,\s*([}\]])')
+
+
+def _strip_trailing_commas(candidate: str) -> str:
+    """去掉 '}' 或 ']' 前多余的逗号，字符串内容保持不变"""
+    return _TRAILING_COMMA.sub(lambda m: m.group(1) or m.group(2), candidate)
+
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+def coerce_number(value) -> Optional[float]:
+    """把模型给出的分数（数字，或 "15"、"15分"、"15/20" 之类的字符串）转换为数字，无法识别时返回 None"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        match = _NUMBER.search(value)
+        if match:
+            number = float(match.group())
+            return int(number) if number.is_integer() else number
+    return None
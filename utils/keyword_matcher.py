@@ -0,0 +1,63 @@
+from collections import deque
+from typing import Dict, Iterable, Set
+
+
+class KeywordMatcher:
+    """Aho-Corasick 多模式匹配器
+
+    构建时把所有分组的关键词编译成一个确定性自动机，匹配时对文本只扫描一遍，
+    耗时与文本长度线性相关，与关键词数量无关。
+    """
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self.groups = list(groups)
+        goto = [{}]  # 字典树的字符转移
+        output = [set()]  # 到达该状态时命中的 (分组, 关键词)
+
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                if not keyword:
+                    continue
+                state = 0
+                for char in keyword:
+                    next_state = goto[state].get(char)
+                    if next_state is None:
+                        next_state = len(goto)
+                        goto[state][char] = next_state
+                        goto.append({})
+                        output.append(set())
+                    state = next_state
+                output[state].add((group, keyword))
+
+        # 按广度优先计算失配指针，并把失配转移直接展开进转移表（DFA），
+        # 扫描时每个字符只需一次字典查找，不再沿失配链回溯
+        fail = [0] * len(goto)
+        self._delta = [dict(transitions) for transitions in goto]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            output[state] |= output[fail[state]]
+            for char, fail_next in self._delta[fail[state]].items():
+                self._delta[state].setdefault(char, fail_next)
+            for char, next_state in goto[state].items():
+                fail[next_state] = self._delta[fail[state]].get(char, 0)
+                queue.append(next_state)
+
+        self._output = [tuple(matches) for matches in output]
+        self._terminal = [bool(matches) for matches in output]
+
+    def scan(self, text: str) -> Dict[str, Set[str]]:
+        """扫描文本，返回每个分组命中的关键词集合"""
+        delta, terminal = self._delta, self._terminal
+        matched_states = set()
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            if terminal[state]:
+                matched_states.add(state)
+
+        hits = {group: set() for group in self.groups}
+        for state in matched_states:
+            for group, keyword in self._output[state]:
+                hits[group].add(keyword)
+        return hits
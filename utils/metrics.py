@@ -0,0 +1,238 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Optional, Tuple
+
+# 导出时的指标名前缀
+PREFIX = "coach_"
+
+# 耗时直方图的分桶上界（秒），覆盖从本地解析到整次模型调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "llm_queue_seconds": "LLM 请求在异步管线中的排队时间",
+    "llm_ttft_seconds": "流式调用的首字延迟",
+    "llm_seconds": "LLM 调用总耗时（含排队、重试）",
+    "llm_calls": "LLM 调用次数",
+    "llm_input_tokens": "LLM 输入 token 数（估算）",
+    "llm_output_tokens": "LLM 输出 token 数（估算）",
+    "evaluation_parse_seconds": "评估结果解析耗时",
+    "figure_build_seconds": "图表构建耗时（缓存未命中时）",
+    "rerun_seconds": "Streamlit 脚本（或片段）单次运行耗时"
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """样本的 q 分位数（取最近秩，不插值），没有样本时返回 0，供离线脚本汇总耗时"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """进程内指标：耗时直方图和计数器，按标签区分，可导出为 Prometheus 文本格式"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}  # (指标名, 标签) -> _Histogram
+        self._counters = {}  # (指标名, 标签) -> 累计值
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self) -> str:
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for name in sorted({name for name, _ in histograms}):
+            metric = PREFIX + name
+            lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} histogram")
+            for (key_name, labels), (counts, total, count) in sorted(histograms.items()):
+                if key_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{metric}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{metric}_sum{_labels(labels)} {total:.6f}")
+                lines.append(f"{metric}_count{_labels(labels)} {count}")
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{PREFIX}{name}_total"
+            lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            for (key_name, labels), value in sorted(counters.items()):
+                if key_name == name:
+                    lines.append(f"{metric}{_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """原子地写入指标文件（可供 node_exporter textfile collector 采集）"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+def _labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+class RunMetrics:
+    """一次脚本运行（对应一轮对话）内累计的指标，随会话记录保存"""
+
+    def __init__(self, scope: str):
+        self.scope = scope
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: float):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {name: round(value, 4) for name, value in self._values.items()}
+
+
+_current_run = contextvars.ContextVar("coach_run_metrics", default=None)
+
+
+def current_run() -> Optional[RunMetrics]:
+    """当前上下文所属的运行；线程池任务经 submit_in_context 提交时同样可见"""
+    return _current_run.get()
+
+
+def observe(name: str, seconds: float, **labels):
+    """记录一次耗时：进入进程级直方图，同时累计到当前运行"""
+    get_default_metrics().observe(name, seconds, **labels)
+    run = _current_run.get()
+    if run is not None:
+        run.add(name, seconds)
+
+
+def count(name: str, amount: float = 1, **labels):
+    """记录次数或 token 数：进入进程级计数器，同时累计到当前运行"""
+    get_default_metrics().inc(name, amount, **labels)
+    run = _current_run.get()
+    if run is not None:
+        run.add(name, amount)
+
+
+@contextmanager
+def timed(name: str, **labels):
+    """计时代码块，异常时同样记录"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+@contextmanager
+def track_run(scope: str):
+    """统计一次脚本（或片段）运行：期间记录的指标归入返回的 RunMetrics，结束时补记运行耗时
+
+    st.rerun() 以异常方式结束运行，耗时同样会被记录。
+    """
+    run = RunMetrics(scope)
+    token = _current_run.set(run)
+    start = time.perf_counter()
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        seconds = time.perf_counter() - start
+        get_default_metrics().observe("rerun_seconds", seconds, scope=scope)
+        run.add("rerun_seconds", seconds)
+
+
+class MetricsExporter:
+    """定时把指标写入文件，并可在独立端口上提供 /metrics"""
+
+    def __init__(self, registry: MetricsRegistry, path: str = "", port: int = 0, interval: float = 15.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.server = None
+        if path:
+            threading.Thread(target=self._write_forever, name="metrics-writer", daemon=True).start()
+        if port:
+            self.server = ThreadingHTTPServer(("0.0.0.0", port), self._handler())
+            threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True).start()
+
+    def _write_forever(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.registry.write(self.path)
+            except OSError as e:
+                print(f"指标文件写入失败: {str(e)}")
+
+    def _handler(self):
+        registry = self.registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_default_metrics() -> MetricsRegistry:
+    """进程内共享的指标注册表"""
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = MetricsRegistry()
+        return _default_metrics
@@ -0,0 +1,48 @@
+import streamlit as st
+
+from config import Config
+from models.coach_agent import FinancialCoachAgent
+from models.evaluation_jobs import EvaluationJobQueue
+from models.evaluator import SessionEvaluator
+from models.llm_client import get_default_client
+from models.prefetch import OpeningPrefetcher
+from utils.metrics import MetricsExporter, get_default_metrics
+from utils.session_store import get_default_store
+
+# 进程级共享资源：Streamlit 每次交互都会重新执行脚本，这些对象只在进程内构建一次，
+# 各会话共享，连接池等状态也因此可以跨 rerun 保留。
+# LLM 客户端和会话存储已由 get_default_client / get_default_store 在进程内共享（脚本中同样使用），
+# 这里直接复用，不再套一层 st.cache_resource，避免两层缓存各自失效后持有不同的实例。
+
+
+@st.cache_resource(show_spinner=False)
+def get_coach_agent() -> FinancialCoachAgent:
+    """共享的客户陪练 Agent"""
+    return FinancialCoachAgent(backend=get_default_client())
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_evaluator() -> SessionEvaluator:
+    """共享的会话评估器（评估标准、关键词匹配器只构建一次）"""
+    return SessionEvaluator(backend=get_default_client())
+
+
+@st.cache_resource(show_spinner=False)
+def get_opening_prefetcher() -> OpeningPrefetcher:
+    """共享的开场提问预取器（命中与浪费统计跨会话累计）"""
+    return OpeningPrefetcher(get_coach_agent())
+
+
+@st.cache_resource(show_spinner=False)
+def get_evaluation_jobs() -> EvaluationJobQueue:
+    """共享的后台评估队列，创建时恢复上次进程未完成的任务"""
+    jobs = EvaluationJobQueue(get_session_evaluator(), get_default_store(), workers=Config.EVALUATION_JOB_WORKERS)
+    jobs.resume_pending()
+    return jobs
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics_exporter() -> MetricsExporter:
+    """按配置定时写出指标文件、开启 /metrics 端口，进程内只启动一次"""
+    return MetricsExporter(get_default_metrics(), path=Config.METRICS_FILE, port=Config.METRICS_PORT,
+                           interval=Config.METRICS_INTERVAL)
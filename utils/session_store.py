@@ -0,0 +1,332 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Optional
+
+from config import Config
+
+SCORE_DIMENSIONS = ['demand_mining', 'product_fit', 'objection_handling', 'communication', 'professional_knowledge']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    client_type TEXT,
+    scenario TEXT,
+    difficulty INTEGER,
+    started_at TEXT,
+    ended_at TEXT NOT NULL,
+    duration_minutes REAL DEFAULT 0,
+    overall_score REAL,
+    performance_level TEXT,
+    evaluation_json TEXT,
+    evaluation_status TEXT,
+    evaluation_job_id TEXT,
+    metrics_json TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_ended ON sessions (user_id, ended_at);
+CREATE INDEX IF NOT EXISTS idx_sessions_client_type ON sessions (client_type);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp TEXT,
+    is_feedback INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, seq);
+
+CREATE TABLE IF NOT EXISTS evaluation_scores (
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    dimension TEXT NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (session_id, dimension)
+);
+CREATE INDEX IF NOT EXISTS idx_scores_dimension ON evaluation_scores (dimension, score);
+
+-- 批量重新评分的结果，与原评估并存以便对比；(session_id, run_id) 同时作为断点续跑的检查点
+CREATE TABLE IF NOT EXISTS session_rescores (
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    run_id TEXT NOT NULL,
+    transcript_hash TEXT NOT NULL,
+    overall_score REAL,
+    evaluation_json TEXT,
+    latency_seconds REAL,
+    scored_at TEXT NOT NULL,
+    PRIMARY KEY (session_id, run_id)
+);
+CREATE INDEX IF NOT EXISTS idx_rescores_hash ON session_rescores (run_id, transcript_hash);
+"""
+
+# 旧版数据库缺少的列：(表, 列, 类型)
+_MIGRATIONS = [
+    ("sessions", "evaluation_status", "TEXT"),
+    ("sessions", "evaluation_job_id", "TEXT"),
+    ("sessions", "metrics_json", "TEXT"),
+]
+_POST_MIGRATION_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_sessions_job ON sessions (evaluation_job_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_status ON sessions (evaluation_status);
+"""
+
+# 评估任务状态；为空表示会话保存时已带评估结果（同步评估或旧数据）
+EVALUATION_PENDING = "pending"
+EVALUATION_RUNNING = "running"
+EVALUATION_DONE = "done"
+EVALUATION_FAILED = "failed"
+
+
+class SessionStore:
+    """基于 SQLite 的会话持久化存储
+
+    会话、消息、各维度得分分表保存并建立索引；使用 WAL 模式，多个 Streamlit 会话
+    可以并发写入而不互相阻塞读取。每个线程使用各自的连接。
+    """
+
+    def __init__(self, db_path: str = None):
+        self.db_path = db_path or Config.SESSION_DB_PATH
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        self._migrate(conn)
+        conn.executescript(_POST_MIGRATION_SCHEMA)
+        conn.commit()
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection):
+        """为旧版数据库补齐新增的列"""
+        for table, column, column_type in _MIGRATIONS:
+            columns = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if column not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+    def _connect(self) -> sqlite3.Connection:
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def save_session(self, user_id: str, record: Dict) -> int:
+        """保存一条会话记录（含消息和评估），返回会话ID"""
+        evaluation = record.get('evaluation') or {}
+        messages = record.get('messages') or []
+        scores = evaluation.get('scores', {}) if isinstance(evaluation, dict) else {}
+
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                """INSERT INTO sessions (user_id, client_type, scenario, difficulty, started_at, ended_at,
+                                         duration_minutes, overall_score, performance_level, evaluation_json,
+                                         evaluation_status, evaluation_job_id, metrics_json)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    user_id,
+                    record.get('client_type'),
+                    record.get('scenario'),
+                    record.get('difficulty'),
+                    messages[0].get('timestamp') if messages else None,
+                    record['timestamp'],
+                    record.get('duration_minutes', 0),
+                    evaluation.get('overall_score') if isinstance(evaluation, dict) else None,
+                    evaluation.get('performance_level') if isinstance(evaluation, dict) else None,
+                    json.dumps(evaluation, ensure_ascii=False),
+                    record.get('evaluation_status'),
+                    record.get('evaluation_job_id'),
+                    json.dumps(record.get('metrics') or [], ensure_ascii=False)
+                )
+            )
+            session_id = cursor.lastrowid
+            conn.executemany(
+                """INSERT INTO messages (session_id, seq, role, content, timestamp, is_feedback)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                [
+                    (session_id, seq, msg['role'], msg['content'], msg.get('timestamp'),
+                     int(bool(msg.get('is_feedback'))))
+                    for seq, msg in enumerate(messages)
+                ]
+            )
+            self._insert_scores(conn, session_id, scores)
+        return session_id
+
+    @staticmethod
+    def _insert_scores(conn: sqlite3.Connection, session_id: int, scores: Dict):
+        conn.executemany(
+            "INSERT INTO evaluation_scores (session_id, dimension, score) VALUES (?, ?, ?)",
+            [(session_id, dimension, score) for dimension, score in scores.items()
+             if isinstance(score, (int, float))]
+        )
+
+    def update_evaluation(self, session_id: int, evaluation: Optional[Dict], status: str):
+        """后台评估完成（或失败）后写回评估结果与状态"""
+        conn = self._connect()
+        with conn:
+            if evaluation is None:
+                conn.execute("UPDATE sessions SET evaluation_status = ? WHERE id = ?", (status, session_id))
+                return
+            conn.execute(
+                """UPDATE sessions SET overall_score = ?, performance_level = ?, evaluation_json = ?,
+                                      evaluation_status = ?
+                   WHERE id = ?""",
+                (evaluation.get('overall_score'), evaluation.get('performance_level'),
+                 json.dumps(evaluation, ensure_ascii=False), status, session_id)
+            )
+            conn.execute("DELETE FROM evaluation_scores WHERE session_id = ?", (session_id,))
+            self._insert_scores(conn, session_id, evaluation.get('scores', {}))
+
+    def get_evaluation_job(self, job_id: str) -> Optional[Dict]:
+        """按任务ID查询评估状态与结果"""
+        row = self._connect().execute(
+            "SELECT id, user_id, evaluation_status, evaluation_json FROM sessions WHERE evaluation_job_id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "session_id": row['id'],
+            "user_id": row['user_id'],
+            "status": row['evaluation_status'],
+            "evaluation": json.loads(row['evaluation_json'] or "{}")
+        }
+
+    def pending_evaluations(self) -> List[Dict]:
+        """尚未完成的后台评估（进程重启后用于恢复）"""
+        rows = self._connect().execute(
+            "SELECT id, user_id, evaluation_job_id FROM sessions WHERE evaluation_status IN (?, ?) ORDER BY id",
+            (EVALUATION_PENDING, EVALUATION_RUNNING)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def analytics_rows(self, user_id: str) -> List[Dict]:
+        """按时间顺序返回分析用的每会话一行数据（各维度得分已展开为列，评估未完成的会话不计入）"""
+        dimension_columns = ",\n".join(
+            f"MAX(CASE WHEN e.dimension = '{dimension}' THEN e.score END) AS {dimension}"
+            for dimension in SCORE_DIMENSIONS
+        )
+        rows = self._connect().execute(
+            f"""SELECT s.id, s.client_type, s.overall_score, s.duration_minutes, s.ended_at,
+                       {dimension_columns}
+                FROM sessions s
+                LEFT JOIN evaluation_scores e ON e.session_id = s.id
+                WHERE s.user_id = ? AND (s.evaluation_status IS NULL OR s.evaluation_status = ?)
+                GROUP BY s.id
+                ORDER BY s.ended_at, s.id""",
+            (user_id, EVALUATION_DONE)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_session(self, session_id: int) -> Optional[Dict]:
+        """读取完整会话，包括消息和评估结果"""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        session = dict(row)
+        session['evaluation'] = json.loads(session.pop('evaluation_json') or "{}")
+        session['metrics'] = json.loads(session.pop('metrics_json') or "[]")
+        session['messages'] = [
+            {"role": msg['role'], "content": msg['content'], "timestamp": msg['timestamp'],
+             **({"is_feedback": True} if msg['is_feedback'] else {})}
+            for msg in conn.execute(
+                "SELECT role, content, timestamp, is_feedback FROM messages WHERE session_id = ? ORDER BY seq",
+                (session_id,)
+            )
+        ]
+        return session
+
+    def session_ids(self, user_id: str = None) -> List[int]:
+        """全部（或某个学员的）会话ID，按时间顺序"""
+        if user_id is None:
+            rows = self._connect().execute("SELECT id FROM sessions ORDER BY ended_at, id")
+        else:
+            rows = self._connect().execute(
+                "SELECT id FROM sessions WHERE user_id = ? ORDER BY ended_at, id", (user_id,))
+        return [row['id'] for row in rows]
+
+    def save_rescore(self, session_id: int, run_id: str, transcript_hash: str, evaluation: Dict,
+                     latency_seconds: float, scored_at: str):
+        """保存一次重新评分的结果"""
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO session_rescores
+                   (session_id, run_id, transcript_hash, overall_score, evaluation_json, latency_seconds, scored_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (session_id, run_id, transcript_hash, evaluation.get('overall_score'),
+                 json.dumps(evaluation, ensure_ascii=False), latency_seconds, scored_at)
+            )
+
+    def rescored(self, run_id: str) -> Dict[int, str]:
+        """某次重新评分中已完成的会话：会话ID -> 对话哈希"""
+        rows = self._connect().execute(
+            "SELECT session_id, transcript_hash FROM session_rescores WHERE run_id = ?", (run_id,))
+        return {row['session_id']: row['transcript_hash'] for row in rows}
+
+    def rescore_by_hash(self, run_id: str, transcript_hash: str) -> Optional[Dict]:
+        """同一次重新评分中相同对话已有的结果"""
+        row = self._connect().execute(
+            "SELECT evaluation_json FROM session_rescores WHERE run_id = ? AND transcript_hash = ? LIMIT 1",
+            (run_id, transcript_hash)
+        ).fetchone()
+        return json.loads(row['evaluation_json']) if row else None
+
+    def rescore_evaluations(self, run_id: str) -> Dict[int, Dict]:
+        """某次重新评分的全部评估结果：会话ID -> 评估"""
+        rows = self._connect().execute(
+            "SELECT session_id, evaluation_json FROM session_rescores WHERE run_id = ?", (run_id,))
+        return {row['session_id']: json.loads(row['evaluation_json']) for row in rows}
+
+    def rescore_comparison(self, run_id: str) -> List[Dict]:
+        """新旧总分对照"""
+        rows = self._connect().execute(
+            """SELECT s.id AS session_id, s.client_type, s.difficulty, s.overall_score AS old_score,
+                      r.overall_score AS new_score
+               FROM session_rescores r JOIN sessions s ON s.id = r.session_id
+               WHERE r.run_id = ? ORDER BY s.id""",
+            (run_id,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def import_history_json(self, path: str, user_id: str = "guest") -> int:
+        """把旧版 session_history.json 中的记录导入数据库，返回导入条数"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+        except OSError:
+            return 0
+        if not content:
+            return 0
+
+        records = json.loads(content)
+        for record in records:
+            self.save_session(record.get('user_id', user_id), record)
+        return len(records)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store() -> SessionStore:
+    """进程内共享的默认会话存储"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            is_new = not os.path.exists(Config.SESSION_DB_PATH)
+            _default_store = SessionStore()
+            if is_new:
+                # 首次创建数据库时迁移旧的 JSON 历史记录
+                _default_store.import_history_json(Config.LEGACY_HISTORY_PATH)
+        return _default_store
@@ -1,8 +1,67 @@
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import plotly.express as px
-from typing import Dict
+from typing import Dict, Callable, Hashable
 import plotly.colors as colors
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from utils.metrics import timed
+
+# 图表缓存：输入数据不变时复用已构建的 Figure，按 LRU 淘汰
+FIGURE_CACHE_SIZE = 32
+_figure_cache = OrderedDict()
+_figure_cache_lock = threading.Lock()
+figure_cache_stats = {"hits": 0, "misses": 0}
+
+
+def data_fingerprint(data) -> str:
+    """计算评估字典或 DataFrame 的内容指纹"""
+    if isinstance(data, pd.DataFrame):
+        digest = hashlib.sha256(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        digest.update(json.dumps(list(map(str, data.columns))).encode("utf-8"))
+        return digest.hexdigest()
+    payload = json.dumps(data, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_cached_figure(name: str, key: Hashable, builder: Callable[[], go.Figure]) -> go.Figure:
+    """按 (name, key) 返回缓存的图表，未命中时调用 builder 构建
+
+    返回的 Figure 为共享对象，调用方不应再修改它。
+    """
+    cache_key = (name, key)
+    with _figure_cache_lock:
+        fig = _figure_cache.get(cache_key)
+        if fig is not None:
+            _figure_cache.move_to_end(cache_key)
+            figure_cache_stats["hits"] += 1
+            return fig
+        figure_cache_stats["misses"] += 1
+
+    with timed("figure_build_seconds", figure=name):
+        fig = builder()
+    with _figure_cache_lock:
+        _figure_cache[cache_key] = fig
+        _figure_cache.move_to_end(cache_key)
+        while len(_figure_cache) > FIGURE_CACHE_SIZE:
+            _figure_cache.popitem(last=False)
+    return fig
+
+
+def cached_radar_dashboard(evaluation: Dict) -> go.Figure:
+    """评估数据不变时复用雷达图"""
+    return get_cached_figure("radar", data_fingerprint(evaluation), lambda: create_radar_dashboard(evaluation))
+
+
+def cached_trend_analysis(history_data, version: Hashable = None) -> go.Figure:
+    """历史数据不变时复用趋势图；传入 version（如分析缓存版本号）可省去计算数据指纹"""
+    key = version if version is not None else data_fingerprint(history_data)
+    return get_cached_figure("trend", key, lambda: create_trend_analysis(history_data))
 
 
 def create_performance_dashboard(evaluation: Dict):
@@ -543,7 +602,7 @@ def create_trend_analysis(history_data):
 
 def create_performance_metrics(history_data):
     """创建关键绩效指标卡片"""
-    if not history_data or len(history_data) == 0:
+    if history_data is None or len(history_data) == 0:
         return None
 
     current_score = history_data['overall_score'].iloc[-1]
@@ -642,7 +701,7 @@ def create_performance_metrics(history_data):
 
 def create_performance_breakdown(history_data):
     """创建能力维度趋势分解"""
-    if not history_data or len(history_data) < 2:
+    if history_data is None or len(history_data) < 2:
         return None
 
     # 提取各维度得分